@@ -0,0 +1,213 @@
+"""
+Per-client aggregates: everything product selection needs, without raw rows.
+
+ClientAggregates exposes the same attributes the scoring functions read from a
+Client (totals_by_category, transfer_sums_by_type, fx_stats, ...), so
+client.decide_product works on it unchanged. Aggregates are stored as JSON lines.
+"""
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from client import best_product_by_transactions, decide_product
+from deposit import DEFAULT_FX_RATES_TO_KZT, FX_TOPUP_TYPE, FX_WITHDRAW_TYPE, fx_transfer_stats, to_kzt
+from profits import convert_to_kzt
+
+
+@dataclass
+class ClientAggregates:
+    client_code: int
+    name: str
+    status: str
+    age: int
+    city: str
+    avg_monthly_balance_KZT: float
+    totals_by_category: dict = field(default_factory=dict)        # сырые суммы (для долей)
+    totals_by_category_kzt: dict = field(default_factory=dict)    # в KZT (для выгоды)
+    transfer_sums_by_direction_type: dict = field(default_factory=dict)
+    transfer_counts: dict = field(default_factory=dict)
+    fx_stats: list = field(default_factory=lambda: [0, 0.0, 0, 0.0])
+    observed_months: Optional[float] = None                       # период выгрузки; None -> deposit.OBSERVED_MONTHS
+    cached_push: Optional[tuple] = None                           # (product, push_text)
+    # заполняются в refresh()
+    product: Optional[str] = None
+    max_potential_profit: float = 0.0
+
+    # --- производные поля, которые читают функции скоринга ---
+    @property
+    def transfer_sums_by_type(self) -> dict:
+        sums = defaultdict(float)
+        for by_type in self.transfer_sums_by_direction_type.values():
+            for ttype, amount in by_type.items():
+                sums[ttype] += amount
+        return dict(sums)
+
+    @property
+    def transfer_types(self) -> set:
+        return {t for t, cnt in self.transfer_counts.items() if cnt > 0}
+
+    @property
+    def total_transfers_in(self) -> float:
+        return sum(self.transfer_sums_by_direction_type.get("in", {}).values())
+
+    @property
+    def total_transfers_out(self) -> float:
+        return sum(self.transfer_sums_by_direction_type.get("out", {}).values())
+
+    @property
+    def total_transfers(self) -> float:
+        return self.total_transfers_in + self.total_transfers_out
+
+    @property
+    def total_transactions(self) -> float:
+        return sum(self.totals_by_category.values())
+
+    # --- инкрементальные обновления, O(1) на событие ---
+    def apply_transaction(self, category: str, amount: float, currency: str = "KZT", sign: int = 1):
+        amount = sign * float(amount)
+        self.totals_by_category[category] = self.totals_by_category.get(category, 0.0) + amount
+        self.totals_by_category_kzt[category] = (
+            self.totals_by_category_kzt.get(category, 0.0) + convert_to_kzt(amount, currency)
+        )
+
+    def apply_transfer(self, type: str, direction: str, amount: float, currency: str = "KZT", sign: int = 1):
+        amount = sign * float(amount)
+        by_type = self.transfer_sums_by_direction_type.setdefault(direction, {})
+        by_type[type] = by_type.get(type, 0.0) + amount
+        self.transfer_counts[type] = self.transfer_counts.get(type, 0) + sign
+
+        if type == FX_TOPUP_TYPE:
+            self.fx_stats[0] += sign
+            self.fx_stats[1] += to_kzt(amount, currency, DEFAULT_FX_RATES_TO_KZT)
+        elif type == FX_WITHDRAW_TYPE:
+            self.fx_stats[2] += sign
+            self.fx_stats[3] += to_kzt(amount, currency, DEFAULT_FX_RATES_TO_KZT)
+
+    def merge(self, other: "ClientAggregates", sign: int = 1):
+        """Прибавляет (sign=1) или вычитает (sign=-1) агрегаты другого периода того же клиента."""
+        _merge_flat(self.totals_by_category, other.totals_by_category, sign)
+        _merge_flat(self.totals_by_category_kzt, other.totals_by_category_kzt, sign)
+        for direction, by_type in other.transfer_sums_by_direction_type.items():
+            _merge_flat(self.transfer_sums_by_direction_type.setdefault(direction, {}), by_type, sign)
+            if not self.transfer_sums_by_direction_type[direction]:
+                del self.transfer_sums_by_direction_type[direction]
+        _merge_flat(self.transfer_counts, other.transfer_counts, sign)
+        self.fx_stats = [a + sign * b for a, b in zip(self.fx_stats, other.fx_stats)]
+
+    def empty_like(self) -> "ClientAggregates":
+        """Пустые агрегаты с тем же профилем клиента."""
+        return ClientAggregates(
+            client_code=self.client_code,
+            name=self.name,
+            status=self.status,
+            age=self.age,
+            city=self.city,
+            avg_monthly_balance_KZT=self.avg_monthly_balance_KZT,
+            observed_months=self.observed_months,
+        )
+
+    # --- решение ---
+    def refresh(self):
+        """Пересчитывает карточный продукт по тратам (то, что в batch делает group_category_product)."""
+        self.product, self.max_potential_profit = best_product_by_transactions(self)
+
+    def decide(self) -> tuple[Optional[str], str, float]:
+        self.refresh()
+        return decide_product(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "client_code": int(self.client_code),
+            "name": self.name,
+            "status": self.status,
+            "age": int(self.age),
+            "city": self.city,
+            "avg_monthly_balance_KZT": float(self.avg_monthly_balance_KZT),
+            "totals_by_category": self.totals_by_category,
+            "totals_by_category_kzt": self.totals_by_category_kzt,
+            "transfer_sums_by_direction_type": self.transfer_sums_by_direction_type,
+            "transfer_counts": self.transfer_counts,
+            "fx_stats": list(self.fx_stats),
+            "observed_months": self.observed_months,
+            "cached_push": list(self.cached_push) if self.cached_push else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ClientAggregates":
+        data = dict(data)
+        if data.get("cached_push"):
+            data["cached_push"] = tuple(data["cached_push"])
+        return cls(**data)
+
+
+def _merge_flat(target: dict, source: dict, sign: int):
+    for key, value in source.items():
+        merged = target.get(key, 0) + sign * value
+        # после вычитания периода не оставляем «нулевые» ключи с погрешностью float
+        if abs(merged) < 1e-6:
+            target.pop(key, None)
+        else:
+            target[key] = merged
+
+
+def from_client(client) -> ClientAggregates:
+    """Aggregates of a fully built Client (after build_clients)."""
+    totals_kzt = defaultdict(float)
+    for tx in client.transactions:
+        totals_kzt[tx.category] += convert_to_kzt(tx.amount, tx.currency)
+
+    by_dir_type, counts = {}, defaultdict(int)
+    for tr in client.transfers:
+        by_type = by_dir_type.setdefault(tr.direction, {})
+        by_type[tr.type] = by_type.get(tr.type, 0.0) + float(tr.amount)
+        counts[tr.type] += 1
+
+    return ClientAggregates(
+        client_code=int(client.client_code),
+        name=client.name,
+        status=client.status,
+        age=int(client.age),
+        city=client.city,
+        avg_monthly_balance_KZT=float(client.avg_monthly_balance_KZT),
+        totals_by_category={k: float(v) for k, v in client.totals_by_category.items()},
+        totals_by_category_kzt=dict(totals_kzt),
+        transfer_sums_by_direction_type=by_dir_type,
+        transfer_counts=dict(counts),
+        fx_stats=list(fx_transfer_stats(client)),
+        observed_months=getattr(client, "observed_months", None),
+    )
+
+
+def save_aggregates(aggregates, filename: str):
+    with open(filename, "w", encoding="utf-8") as f:
+        for agg in aggregates:
+            f.write(json.dumps(agg.to_dict(), ensure_ascii=False) + "\n")
+
+
+def load_aggregates(filename: str) -> dict[int, ClientAggregates]:
+    """In-memory index {client_code: ClientAggregates}."""
+    index = {}
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                agg = ClientAggregates.from_dict(json.loads(line))
+                index[agg.client_code] = agg
+    return index
+
+
+def attach_cached_pushes(index: dict[int, ClientAggregates], result_csv: str) -> int:
+    """Подкладывает пуши из результата run (любой формат csv_save); пуш отдаётся, только если продукт совпадает с текущим решением."""
+    import pandas as pd
+    from csv_save import read_results
+
+    attached = 0
+    for chunk in read_results(result_csv):
+        codes = pd.to_numeric(chunk["client_code"], errors="coerce")
+        keep = codes.notna() & chunk["push_notification"].notna() & (chunk["push_notification"] != "")
+        for code, product, push in zip(codes[keep].astype("int64"), chunk["product"][keep],
+                                       chunk["push_notification"][keep]):
+            if code in index:
+                index[code].cached_push = (product, push)
+                attached += 1
+    return attached
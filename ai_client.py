@@ -1,3 +1,13 @@
+import logging
+
+from logs import get_logger, log
+
+_log = get_logger("ai_client")
+
+# Ожидаемая длина ответа в токенах — для резерва в tokens.RUN_BUDGET до запроса
+RECOMMENDATION_COMPLETION_TOKENS = 60
+PUSH_COMPLETION_TOKENS = 100
+
 PROMPT_TEMPLATE = """
 Ты — финансовый ассистент, который анализирует поведение клиента и предлагает персональные push-уведомления.
 Твоя цель — помочь клиенту контролировать расходы, формировать сбережения и замечать возможности для дохода.
@@ -61,48 +71,164 @@ PROMPT_TEMPLATE = """
 """
 
 
-def get_recomended_product(client) -> dict:
-  from openai import OpenAI
+# Ступени сжатия деталей переводов: (доля для группировки в «прочее», шаг округления ₸).
+# Идём по ним, пока промпт не влезет в бюджет; None — детализация не передаётся.
+COMPACTION_LEVELS = [(0.02, 1_000), (0.05, 1_000), (0.10, 10_000), None]
+MINOR_TYPES_KEY = "прочее"
+
+
+def compact_amounts(sums: dict, min_share: float = 0.02, round_to: int = 1_000) -> dict:
+  """
+  Компактное представление {type: amount}: без нулей, суммы округлены до round_to,
+  типы с долей < min_share схлопнуты в «прочее». Порядок — по убыванию суммы.
+  """
+  positive = {k: float(v) for k, v in sums.items() if v and float(v) > 0}
+  total = sum(positive.values())
+  if total <= 0:
+    return {}
+
+  compact, minor = {}, 0.0
+  for key, amount in sorted(positive.items(), key=lambda kv: kv[1], reverse=True):
+    if amount / total < min_share:
+      minor += amount
+    else:
+      compact[key] = int(round(amount / round_to) * round_to)
+  if minor > 0:
+    compact[MINOR_TYPES_KEY] = int(round(minor / round_to) * round_to)
+  return compact
+
+
+def _dump_compact(data: dict) -> str:
   import json
+  return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
 
-  detailed_transfer_in_json = json.dumps(client.transfer_sums_by_direction_type.get("in", {}), ensure_ascii=False, indent=2)
-  detailed_transfer_out_json = json.dumps(client.transfer_sums_by_direction_type.get("out", {}), ensure_ascii=False, indent=2)
-  
+def _render_prompt(client, detail_in: str, detail_out: str, round_totals: bool) -> str:
+  amount = (lambda v: int(round(float(v)))) if round_totals else (lambda v: v)
   prompt = PROMPT_TEMPLATE.format(
      client_name=client.name,
      client_status=client.status,
      client_age=client.age,
      client_city=client.city,
-     avg_monthly_balance=client.avg_monthly_balance_KZT,
-     total_transactions=client.total_transactions,
-     total_transfers_in=client.total_transfers_in,
-     transfer_sums_by_direction_type_in=detailed_transfer_in_json,
-     total_transfers_out=client.total_transfers_out,
-     transfer_sums_by_direction_type_out=detailed_transfer_out_json,
-     total_transfers=client.total_transfers,
+     avg_monthly_balance=amount(client.avg_monthly_balance_KZT),
+     total_transactions=amount(client.total_transactions),
+     total_transfers_in=amount(client.total_transfers_in),
+     transfer_sums_by_direction_type_in=detail_in,
+     total_transfers_out=amount(client.total_transfers_out),
+     transfer_sums_by_direction_type_out=detail_out,
+     total_transfers=amount(client.total_transfers),
      )
-  
-  client = OpenAI()
-
-  response = client.chat.completions.create(
-    model="gpt-4o-mini",   # or "gpt-4o", "gpt-3.5-turbo", etc.
-    messages=[
-        {"role": "system", "content": "Ты умный ассистент банка."},
-        {"role": "user", "content": prompt}
-    ],
-    temperature=0.3
+  if round_totals:
+    prompt = "\n".join(line.rstrip() for line in prompt.splitlines())
+  return prompt
+
+
+def build_recommendation_prompt(client, token_budget: int | None = None) -> str:
+  """Компактный промпт для get_recomended_product в пределах бюджета токенов (см. _compact_prompt)."""
+  return _compact_prompt(client, token_budget)[0]
+
+
+def _compact_prompt(client, token_budget: int | None = None) -> tuple[str, int, int, bool]:
+  """
+  (промпт, его токены, токены того же промпта с indent=2, промпт не влез в бюджет).
+  В PROMPT_STATS пишет get_recomended_product — только для реально отправленных запросов.
+  """
+  import json
+  from tokens import count_tokens, DEFAULT_PROMPT_TOKEN_BUDGET
+
+  budget = token_budget or DEFAULT_PROMPT_TOKEN_BUDGET
+  by_dir = client.transfer_sums_by_direction_type
+
+  baseline = _render_prompt(
+    client,
+    json.dumps(by_dir.get("in", {}), ensure_ascii=False, indent=2),
+    json.dumps(by_dir.get("out", {}), ensure_ascii=False, indent=2),
+    round_totals=False,
   )
-  result = response.choices[0].message.content
 
-  parsed = {}
-  try:
-    parsed = json.loads(result)
-  except:
-     print(f"Invalid response from chat gpt")
+  prompt, tokens = "", 0
+  for level in COMPACTION_LEVELS:
+    if level is None:
+      detail_in = detail_out = "{}"
+    else:
+      min_share, round_to = level
+      detail_in = _dump_compact(compact_amounts(by_dir.get("in", {}), min_share, round_to))
+      detail_out = _dump_compact(compact_amounts(by_dir.get("out", {}), min_share, round_to))
+    prompt = _render_prompt(client, detail_in, detail_out, round_totals=True)
+    tokens = count_tokens(prompt)
+    if tokens <= budget:
+      break
+
+  return prompt, tokens, count_tokens(baseline), tokens > budget
+
+
+def fallback_recomended_product(client) -> tuple[str, int]:
+  """
+  Детерминированный выбор из каталога промпта, когда LLM недоступна или дедлайн истёк.
+  Пороги — раздел "fallback" rules.json (тот же, что у scoring.fallback_products).
+  """
+  from rules import RULES
+
+  balance = client.avg_monthly_balance_KZT
+  if client.total_transfers_out > client.total_transfers_in + balance:
+    return "Кредит наличными", 0
+  if balance < RULES.fallback["savings_max_balance"] or client.age > RULES.fallback["savings_min_age"]:
+    return "Депозит Сберегательный", 0
+  return "Депозит Накопительный", 0
+
+
+def get_recomended_product(client) -> tuple[str, float, str]:
+  """
+  (product, accuracy, source): source "llm" — ответ модели, "fallback" — LLM недоступна,
+  дедлайн истёк, не хватило бюджета прогона или ответ невалиден (fallback_recomended_product).
+  """
+  from llm import chat_completion, RUN_DEADLINE
+  from openai import APIError
+
+  if RUN_DEADLINE.expired():
+    return *fallback_recomended_product(client), "fallback"
+
+  from tokens import PROMPT_STATS, RUN_BUDGET, messages_tokens
+
+  prompt, tokens, baseline_tokens, over_budget = _compact_prompt(client)
+  messages = [
+      {"role": "system", "content": "Ты умный ассистент банка."},
+      {"role": "user", "content": prompt}
+  ]
+  if not RUN_BUDGET.try_spend(messages_tokens(messages), RECOMMENDATION_COMPLETION_TOKENS):
+    return *fallback_recomended_product(client), "fallback"
+  # статистика промптов — по отправленным запросам, согласована с бюджетом прогона
+  PROMPT_STATS.record(sent=tokens, baseline=baseline_tokens, over_budget=over_budget)
 
-  product_name = parsed["product_suggestion"]["name"]
-  accuracy = parsed["accuracy"]
+  try:
+    result = chat_completion(messages=messages, temperature=0.3)
+  except (TimeoutError, APIError) as e:
+    log(_log, logging.WARNING, "llm_unavailable", client_code=client.client_code, stage="product", error=str(e))
+    return *fallback_recomended_product(client), "fallback"
+
+  recommendation = parse_recommendation(result)
+  if recommendation is None:
+    log(_log, logging.WARNING, "llm_invalid_response", client_code=client.client_code, response=str(result)[:200])
+    return *fallback_recomended_product(client), "fallback"
+  return *recommendation, "llm"
+
+
+def parse_recommendation(result) -> tuple[str, float] | None:
+  """
+  {"product_suggestion": {"name": ...}, "accuracy": ...} -> (name, accuracy);
+  None — невалидный JSON, не та структура или продукт не из каталога rules.json.
+  """
+  import json
+  from rules import RULES
 
+  try:
+    parsed = json.loads(result)
+    product_name = parsed["product_suggestion"]["name"]
+    accuracy = float(parsed.get("accuracy", 0))
+  except (TypeError, ValueError, KeyError, AttributeError):
+    return None
+  if not isinstance(product_name, str) or product_name not in RULES.product_categories:
+    return None
   return product_name, accuracy
 
 
@@ -173,22 +299,38 @@ def generate_push_notification(name: str,
                                profit: float | int,
                                product_type: str | None = None,
                               ) -> str:
-    from openai import OpenAI
-
-    messages = build_messages(name, age, profit, product_type)
+    from llm import chat_completion, RUN_DEADLINE
+    from openai import APIError
 
-    client = OpenAI()
+    if RUN_DEADLINE.expired():
+        return fallback_push_notification(name, profit, product_type)
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.7
-    )
+    from tokens import RUN_BUDGET, messages_tokens
 
-    push_text = response.choices[0].message.content.strip()
+    messages = build_messages(name, age, profit, product_type)
+    if not RUN_BUDGET.try_spend(messages_tokens(messages), PUSH_COMPLETION_TOKENS):
+        return fallback_push_notification(name, profit, product_type)
+
+    try:
+        push_text = chat_completion(messages=messages, temperature=0.7).strip()
+    except (TimeoutError, APIError) as e:
+        log(_log, logging.WARNING, "llm_unavailable", name=name, stage="push", error=str(e))
+        return fallback_push_notification(name, profit, product_type)
     return push_text
 
 
+def fallback_push_notification(name: str,
+                               profit: float | int,
+                               product_type: str | None = None,
+                              ) -> str:
+    """Детерминированный пуш без LLM — по редполитике: ₸ через пробел, запятая в дробной части."""
+    product = (product_type or "новый продукт").lower()
+    if profit and profit > 0:
+        profit_fmt = f"{profit:,.2f}".replace(",", " ").replace(".", ",")
+        return f"{name}, с продуктом «{product}» могло бы вернуться около {profit_fmt} ₸. Посмотреть"
+    return f"{name}, посмотрите продукт «{product}» — возможно, он вам подойдёт. Посмотреть"
+
+
 
 SYSTEM_PROMPT_NO_PROFIT = """Ты пишешь короткие пуш-уведомления про финансы.
 Тон: на равных, просто и по-человечески; обращение на «вы».
@@ -0,0 +1,130 @@
+"""
+Execution backends for the aggregation stages (client.calculations,
+group_category_product, group_transfers_by_type).
+
+Every stage only needs grouped sums of `amount`, so a backend implements one
+call: aggregate(df, groupings) -> {name: long-form pandas frame}. Pandas runs
+each groupby eagerly; DuckDB evaluates all groupings of a table as one
+multi-threaded GROUPING SETS query and Polars as lazy queries collected
+together. The results are small (clients x keys) and the callers reshape them
+in pandas, so per-client output does not depend on the backend.
+
+The backends are in-memory only: they get the pandas frames already read from
+the CSVs, not the files, so peak memory is the same as with pandas.
+
+Selected with `main.py run --backend duckdb` or AGG_BACKEND; duckdb/polars are optional.
+"""
+import os
+
+import pandas as pd
+
+DEFAULT_BACKEND = os.getenv("AGG_BACKEND", "pandas")
+BACKENDS = ("pandas", "duckdb", "polars")
+
+
+class PandasBackend:
+    name = "pandas"
+
+    def aggregate(self, df: pd.DataFrame, groupings: dict[str, list[str]], value: str = "amount") -> dict[str, pd.DataFrame]:
+        return {
+            name: df.groupby(keys)[value].sum().reset_index()
+            for name, keys in groupings.items()
+        }
+
+
+class DuckDBBackend:
+    name = "duckdb"
+
+    def __init__(self, threads: int | None = None):
+        import duckdb
+
+        self.con = duckdb.connect()
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+
+    def aggregate(self, df: pd.DataFrame, groupings: dict[str, list[str]], value: str = "amount") -> dict[str, pd.DataFrame]:
+        if df.empty:
+            return PandasBackend().aggregate(df, groupings, value)
+        columns = sorted({key for keys in groupings.values() for key in keys})
+        sets = ", ".join("(" + ", ".join(f'"{k}"' for k in keys) + ")" for keys in groupings.values())
+        # GROUPING_ID отличает наборы группировки друг от друга в общем результате
+        query = f"""
+            SELECT {", ".join(f'"{c}"' for c in columns)},
+                   GROUPING_ID({", ".join(f'"{c}"' for c in columns)}) AS _gid,
+                   SUM("{value}") AS "{value}"
+            FROM df
+            GROUP BY GROUPING SETS ({sets})
+        """
+        data, uniques = _encode(df, columns, value)
+        self.con.register("df", pd.DataFrame(data))
+        try:
+            result = self.con.execute(query).df()
+        finally:
+            self.con.unregister("df")
+
+        out = {}
+        for name, keys in groupings.items():
+            # бит = 1 у колонок, которых нет в наборе; старший бит — первая колонка
+            gid = sum(1 << (len(columns) - 1 - i) for i, c in enumerate(columns) if c not in keys)
+            part = result.loc[result["_gid"] == gid, keys + [value]].reset_index(drop=True)
+            out[name] = _decode(part, df, keys, uniques)
+        return out
+
+
+class PolarsBackend:
+    name = "polars"
+
+    def __init__(self):
+        import polars
+
+        self.pl = polars
+
+    def aggregate(self, df: pd.DataFrame, groupings: dict[str, list[str]], value: str = "amount") -> dict[str, pd.DataFrame]:
+        if df.empty:
+            return PandasBackend().aggregate(df, groupings, value)
+        pl = self.pl
+        columns = sorted({key for keys in groupings.values() for key in keys})
+        data, uniques = _encode(df, columns, value)
+        lazy = pl.DataFrame(data).lazy()
+        queries = [lazy.group_by(keys).agg(pl.col(value).sum()) for keys in groupings.values()]
+
+        out = {}
+        for (name, keys), frame in zip(groupings.items(), pl.collect_all(queries)):
+            part = pd.DataFrame({c: frame[c].to_numpy() for c in keys + [value]})
+            out[name] = _decode(part, df, keys, uniques)
+        return out
+
+
+def _encode(df: pd.DataFrame, columns: list[str], value: str) -> tuple[dict, dict]:
+    """
+    Строковые ключи -> целые коды pd.factorize (-1 для пустых): движки группируют
+    по int64 вместо Python-строк, а Polars получает numpy-колонки без pyarrow.
+    """
+    data, uniques = {value: df[value].to_numpy()}, {}
+    for column in columns:
+        if df[column].dtype == object:
+            data[column], uniques[column] = pd.factorize(df[column])
+        else:
+            data[column] = df[column].to_numpy()
+    return data, uniques
+
+
+def _decode(part: pd.DataFrame, source: pd.DataFrame, keys: list[str], uniques: dict) -> pd.DataFrame:
+    """Обратно к виду pandas groupby: значения ключей, без групп с пустым ключом, сортировка по ключам."""
+    for column in keys:
+        if column in uniques:
+            codes = part[column].to_numpy()
+            part[column] = pd.Series(uniques[column].take(codes.clip(min=0)), dtype=object).where(codes >= 0)
+    part = part.dropna(subset=keys).astype({k: source[k].dtype for k in keys})
+    return part.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def get_backend(name: str | None = None):
+    name = (name or DEFAULT_BACKEND).lower()
+    if name == "pandas":
+        return PandasBackend()
+    if name == "duckdb":
+        return DuckDBBackend()
+    if name == "polars":
+        return PolarsBackend()
+    raise ValueError(f"Unknown aggregation backend {name!r}, expected one of {BACKENDS}")
@@ -0,0 +1,107 @@
+"""
+Batch mode: many case folders in one warm process.
+
+Interpreter, pandas, scoring modules and the shared LLM client (llm.get_client)
+are loaded once; folders run sequentially or in parallel threads.
+Each folder gets its own result CSV and a JSON run report.
+"""
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from client import handle_clients_logic
+from llm import RUN_DEADLINE
+from main import load_valid_data, quarantine_path, validate_input
+from tokens import PROMPT_STATS, RUN_BUDGET
+
+
+def output_paths(folders: list[Path], output_dir: Path | None,
+                 result_format: str = ".csv") -> list[tuple[Path, Path]]:
+    """(result<format>, report.json) per folder; inside the folder unless output_dir is given."""
+    paths, used = [], Counter()
+    for folder in folders:
+        if output_dir is None:
+            paths.append((folder / f"result{result_format}", folder / "result.report.json"))
+            continue
+        stem = folder.resolve().name.replace(" ", "_") or "case"
+        used[stem] += 1
+        if used[stem] > 1:
+            stem = f"{stem}_{used[stem]}"
+        paths.append((output_dir / f"{stem}{result_format}", output_dir / f"{stem}.report.json"))
+    return paths
+
+
+def run_folder(folder: Path, result_path: Path, report_path: Path, **run_kwargs) -> dict:
+    started = time.perf_counter()
+    report = {"input": str(folder), "output": str(result_path)}
+
+    problems = validate_input(folder)
+    if problems:
+        report.update(status="invalid", problems=problems)
+    else:
+        try:
+            clients_df, transactions_df, transfers_df = load_valid_data(
+                folder, None if run_kwargs.get("dry_run") else quarantine_path(result_path))
+            result = handle_clients_logic(
+                clients_df, transactions_df, transfers_df,
+                output=str(result_path),
+                **run_kwargs,
+            )
+            report.update(
+                status="ok",
+                clients=len(result),
+                products=dict(Counter(product for _, product, _ in result)),
+            )
+        except Exception as e:  # одна битая папка не должна ронять весь batch
+            report.update(status="failed", error=f"{type(e).__name__}: {e}")
+
+    report["duration_sec"] = round(time.perf_counter() - started, 3)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def run_batch(folders: list[Path],
+              output_dir: Path | None = None,
+              parallel: int = 1,
+              deadline_seconds: float | None = None,
+              result_format: str = ".csv",
+              token_budget: int | None = None,
+              cost_budget: float | None = None,
+              **run_kwargs) -> dict:
+    """
+    Runs every folder; deadline_seconds and the LLM budget (token_budget / cost_budget) apply to the whole batch.
+    run_kwargs go to handle_clients_logic (with_push, dry_run, workers, backend, rank_k,
+    write_batch, partition_by_product, model, model_threshold); result_format is one of csv_save.FORMATS.
+    """
+    started = time.perf_counter()
+    RUN_DEADLINE.start(deadline_seconds)
+    RUN_BUDGET.start(token_budget, cost_budget)
+    PROMPT_STATS.reset()
+
+    jobs = [(folder, *paths) for folder, paths in zip(folders, output_paths(folders, output_dir, result_format))]
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    if parallel > 1:
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="case") as pool:
+            reports = list(pool.map(lambda job: run_folder(*job, **run_kwargs), jobs))
+    else:
+        reports = [run_folder(*job, **run_kwargs) for job in jobs]
+
+    summary = {
+        "folders": len(reports),
+        "ok": sum(r["status"] == "ok" for r in reports),
+        "clients": sum(r.get("clients", 0) for r in reports),
+        "duration_sec": round(time.perf_counter() - started, 3),
+        "prompt_tokens": PROMPT_STATS.snapshot(),
+        "llm_budget": RUN_BUDGET.snapshot(),
+        "reports": reports,
+    }
+    if output_dir is not None:
+        with open(output_dir / "batch.report.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
@@ -0,0 +1,101 @@
+"""
+Benchmark of aggregation backends (backends.py) on synthetic data.
+
+For every size runs the TRANSACTION_GROUPINGS / TRANSFER_GROUPINGS aggregations
+with each backend, checks the per-client sums against pandas and prints the
+timings plus the first size at which a backend beats pandas (crossover).
+
+    python bench_backends.py --sizes 10000 100000 1000000 --clients 5000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backends import BACKENDS, get_backend
+from client import TRANSACTION_GROUPINGS, TRANSFER_GROUPINGS
+from validation import CATEGORIES, TRANSFER_TYPES
+
+
+def synthetic(rows: int, clients: int, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(10**9, 2**62, clients)
+    transactions = pd.DataFrame({
+        "client_code": codes[rng.integers(0, clients, rows)],
+        "category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)],
+        "amount": rng.integers(100, 500_000, rows).astype("float64"),
+    })
+    kinds = rng.integers(0, len(TRANSFER_TYPES), rows)
+    transfers = pd.DataFrame({
+        "client_code": codes[rng.integers(0, clients, rows)],
+        "type": np.array([t for t, _ in TRANSFER_TYPES], dtype=object)[kinds],
+        "direction": np.array([d for _, d in TRANSFER_TYPES], dtype=object)[kinds],
+        "amount": rng.integers(100, 2_000_000, rows).astype("float64"),
+    })
+    return transactions, transfers
+
+
+def run_once(backend, transactions: pd.DataFrame, transfers: pd.DataFrame) -> tuple[float, dict]:
+    started = time.perf_counter()
+    result = {
+        **backend.aggregate(transactions, TRANSACTION_GROUPINGS),
+        **backend.aggregate(transfers, TRANSFER_GROUPINGS),
+    }
+    return time.perf_counter() - started, result
+
+
+def same_results(a: dict, b: dict) -> bool:
+    for name in a:
+        left, right = a[name], b[name]
+        keys = [c for c in left.columns if c != "amount"]
+        if len(left) != len(right) or not left[keys].equals(right[keys]):
+            return False
+        if not np.allclose(left["amount"], right["amount"], rtol=1e-12, atol=1e-6):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aggregation backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 5_000_000],
+                        help="rows per table")
+    parser.add_argument("--clients", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    args = parser.parse_args()
+
+    backends = {}
+    for name in args.backends:
+        try:
+            backends[name] = get_backend(name)
+        except ImportError as e:
+            print(f"skip {name}: {e}")
+
+    crossover = {}
+    print(f"{'rows':>10} " + " ".join(f"{name:>10}" for name in backends) + "   (seconds, best of %d)" % args.repeat)
+    for size in args.sizes:
+        transactions, transfers = synthetic(size, args.clients)
+        timings, reference = {}, None
+        for name, backend in backends.items():
+            run_once(backend, transactions.head(1000), transfers.head(1000))  # прогрев
+            best, result = min((run_once(backend, transactions, transfers) for _ in range(args.repeat)),
+                               key=lambda r: r[0])
+            timings[name] = best
+            if name == "pandas":
+                reference = result
+            elif reference is not None and not same_results(reference, result):
+                print(f"!! {name}: results differ from pandas at {size} rows")
+        print(f"{size:>10} " + " ".join(f"{timings[name]:>10.4f}" for name in backends))
+        for name, seconds in timings.items():
+            if name != "pandas" and "pandas" in timings and seconds < timings["pandas"]:
+                crossover.setdefault(name, size)
+
+    for name in backends:
+        if name != "pandas":
+            found = crossover.get(name)
+            print(f"{name}: " + (f"faster than pandas from {found} rows" if found else "not faster than pandas at tested sizes"))
+
+
+if __name__ == "__main__":
+    main()
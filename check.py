@@ -1,3 +1,12 @@
+import json
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from csv_save import read_results
+
 def get_transfer_types(client) -> list:
     """Получаем типы переводов клиента"""
     return [tr.type for tr in client.transfers]
@@ -236,3 +245,169 @@ def choose_best_product_smart(client) -> tuple[str, float]:
     benefit = 1000.0  # Фиксированная выгода для всех
     
     return best_product, benefit
+
+
+# ---------- Оценка result.csv против меток (без построения Client) ----------
+LABEL_COLUMNS = ("product", "products")
+CHUNK_ROWS = 200_000
+
+
+def _key(values: pd.Series) -> pd.Series:
+    """Как client.normalize: сравнение без учёта регистра и пробелов по краям (по уникальным значениям)."""
+    codes, uniques = pd.factorize(values)
+    keys = np.array([str(u).strip().lower() for u in uniques] + [""], dtype=object)
+    return pd.Series(keys[codes], index=values.index)      # -1 (NaN) -> ""
+
+
+def load_labels(transaction_files: list, chunksize: int = CHUNK_ROWS) -> pd.Series:
+    """
+    Метка клиента — продукт его первой транзакции с непустым продуктом (как groupby().first()
+    в feature store). Клиенты без продукта ни в одной транзакции меток не получают.
+    Файлы читаются кусками и только колонки client_code + product.
+    """
+    parts, seen = [], set()
+    for path in transaction_files:
+        for chunk in pd.read_csv(path, usecols=lambda c: c == "client_code" or c in LABEL_COLUMNS,
+                                 chunksize=chunksize):
+            column = next((c for c in LABEL_COLUMNS if c in chunk.columns), None)
+            if column is None:
+                break
+            chunk = chunk[_key(chunk[column]) != ""]
+            first = chunk.drop_duplicates("client_code")
+            first = first[~first["client_code"].isin(seen)]
+            seen.update(first["client_code"].tolist())
+            parts.append(first.set_index("client_code")[column])
+    if not parts:
+        return pd.Series(dtype=object, name="label")
+    return pd.concat(parts).rename("label")
+
+
+def labels_from_store(store) -> pd.Series:
+    labels = pd.Series(store.labels.astype(object), index=store.client_codes, name="label")
+    return labels[labels != ""]
+
+
+def _read_result(result_csv: str, chunksize: int):
+    # результат в любом формате run: csv / jsonl / parquet, в том числе с партициями
+    return read_results(result_csv, columns=["client_code", "product"], chunksize=chunksize)
+
+
+def evaluate_results(result_csv: str, labels: pd.Series, samples: int = 20,
+                     chunksize: int = CHUNK_ROWS) -> dict:
+    """
+    Джойн result.csv с метками по client_code кусками: матрица ошибок, precision/recall
+    по продуктам, примеры расхождений. Клиенты без метки считаются отдельно (unlabeled).
+    """
+    labels = labels[~labels.index.duplicated()]
+    label_keys = _key(labels)
+    # пустая метка (NaN / "") — клиент без метки, а не отдельный класс
+    labels, label_keys = labels[label_keys != ""], label_keys[label_keys != ""]
+    names = dict(zip(label_keys, labels))                 # ключ -> написание из меток
+    pairs = Counter()                                       # (метка, прогноз) -> клиентов
+    mismatches, rows, unlabeled = [], 0, 0
+
+    for chunk in _read_result(result_csv, chunksize):
+        chunk = chunk.dropna(subset=["client_code"]).astype({"client_code": "int64"})
+        rows += len(chunk)
+        chunk["predicted"] = _key(chunk["product"])
+        chunk["label"] = label_keys.reindex(chunk["client_code"]).to_numpy()
+        for key, name in chunk.drop_duplicates("predicted")[["predicted", "product"]].fillna("").itertuples(index=False):
+            names.setdefault(key, name)
+        known = chunk["label"].notna()
+        unlabeled += int((~known).sum())
+        chunk = chunk[known]
+        pairs.update(chunk.groupby(["label", "predicted"]).size().to_dict())
+        if len(mismatches) < samples:
+            wrong = chunk[chunk["label"] != chunk["predicted"]].head(samples - len(mismatches))
+            mismatches += [
+                {"client_code": int(code), "predicted": product, "label": names[label]}
+                for code, product, label in zip(wrong["client_code"], wrong["product"], wrong["label"])
+            ]
+
+    keys = sorted({k for pair in pairs for k in pair})
+    confusion = pd.DataFrame(0, index=keys, columns=keys, dtype="int64")
+    for (label, predicted), n in pairs.items():
+        confusion.at[label, predicted] += n
+    confusion.index = [names.get(k, k) for k in keys]
+    confusion.columns = list(confusion.index)
+    confusion.index.name = "label \\ predicted"
+
+    matrix = confusion.to_numpy()
+    tp = matrix.diagonal()
+    support, predicted = matrix.sum(axis=1), matrix.sum(axis=0)
+    metrics = pd.DataFrame({
+        "support": support,
+        "predicted": predicted,
+        "correct": tp,
+        "precision": tp / pd.Series(predicted).where(predicted > 0).to_numpy(),
+        "recall": tp / pd.Series(support).where(support > 0).to_numpy(),
+    }, index=pd.Index(list(confusion.index), name="product"))
+    metrics["f1"] = 2 * metrics["precision"] * metrics["recall"] / (metrics["precision"] + metrics["recall"])
+
+    evaluated = int(matrix.sum())
+    return {
+        "rows": rows,
+        "evaluated": evaluated,
+        "unlabeled": unlabeled,
+        "accuracy": float(tp.sum() / evaluated) if evaluated else 0.0,
+        "metrics": metrics,
+        "confusion": confusion,
+        "mismatch_samples": mismatches,
+    }
+
+
+def diff_results(old_csv: str, new_csv: str, labels: pd.Series | None = None, samples: int = 20) -> dict:
+    """Что поменялось между двумя result.csv: матрица переходов продуктов и примеры изменений."""
+    old = pd.concat(_read_result(old_csv, CHUNK_ROWS)).drop_duplicates("client_code").set_index("client_code")
+    new = pd.concat(_read_result(new_csv, CHUNK_ROWS)).drop_duplicates("client_code").set_index("client_code")
+    joined = old.join(new, how="outer", lsuffix="_old", rsuffix="_new")
+    both = joined.dropna(subset=["product_old", "product_new"], how="any")
+    changed = both[_key(both["product_old"]) != _key(both["product_new"])]
+
+    report = {
+        "old_only": int(joined["product_new"].isna().sum()),
+        "new_only": int(joined["product_old"].isna().sum()),
+        "compared": len(both),
+        "changed": len(changed),
+        "transitions": changed.groupby(["product_old", "product_new"]).size()
+                              .sort_values(ascending=False).rename("clients").reset_index(),
+        "change_samples": [
+            {"client_code": int(code), "old": a, "new": b}
+            for code, a, b in changed.head(samples)[["product_old", "product_new"]].itertuples()
+        ],
+    }
+    if labels is not None:
+        keys = _key(labels[~labels.index.duplicated()]).reindex(changed.index)
+        report["fixed"] = int((_key(changed["product_new"]) == keys).sum())
+        report["broken"] = int((_key(changed["product_old"]) == keys).sum())
+    return report
+
+
+def write_evaluation(report: dict, output_dir: Path):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report["confusion"].to_csv(output_dir / "confusion.csv", encoding="utf-8")
+    report["metrics"].round(6).to_csv(output_dir / "metrics.csv", encoding="utf-8")
+    summary = {k: v for k, v in report.items() if k not in ("metrics", "confusion")}
+    summary["metrics"] = json.loads(report["metrics"].round(6).to_json(orient="index", force_ascii=False))
+    with open(output_dir / "evaluation.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def print_evaluation(report: dict):
+    print(f"Evaluated {report['evaluated']} of {report['rows']} rows "
+          f"({report['unlabeled']} without label), accuracy {report['accuracy']:.4f}")
+    print(report["metrics"].round(3).to_string())
+    if report["mismatch_samples"]:
+        print("Mismatch samples:")
+        for m in report["mismatch_samples"]:
+            print(f"- client_code={m['client_code']}: predicted='{m['predicted']}' vs label='{m['label']}'")
+
+
+def print_diff(report: dict):
+    print(f"Compared {report['compared']} clients: {report['changed']} changed"
+          f", {report['old_only']} only in old, {report['new_only']} only in new")
+    if "fixed" in report:
+        print(f"Changes that now match the label: {report['fixed']}, that no longer match: {report['broken']}")
+    if report["changed"]:
+        print(report["transitions"].to_string(index=False))
@@ -1,12 +1,31 @@
+import logging
 from dataclasses import dataclass, field
 from typing import List
 from collections import defaultdict
-from ai_client import get_recomended_product, generate_push_notification
+from ai_client import (
+    get_recomended_product,
+    generate_push_notification,
+    fallback_recomended_product,
+    fallback_push_notification,
+)
+from contextlib import nullcontext
+from functools import partial
+import numpy as np
 import pandas as pd
 from typing import Optional
-from profits import calculate_profit_for_client_by_product
-from deposit import choose_deposit_product
-from csv_save import save_push_notifications
+from profits import spending_kzt_by_category
+from deposit import choose_deposit_product, observed_months
+from csv_save import BATCH_SIZE, open_writer
+from tokens import PROMPT_STATS, RUN_BUDGET
+from llm import RUN_DEADLINE
+from scheduler import InOrder, client_value, priority, run_by_priority
+from features import FeatureCache
+from registry import ClientRegistry
+from backends import get_backend
+from rules import PROFILE_FIELDS, RULES, transfer_column
+from logs import get_logger, log, log_decision, sampled
+
+_log = get_logger("client")
 
 # ---------- Models ----------
 @dataclass
@@ -55,30 +74,31 @@ class Client:
 
 def build_clients(clients_df: pd.DataFrame, transactions_df: pd.DataFrame, transfers_df: pd.DataFrame) -> list[Client]:
     clients: list[Client] = []
+    registry = ClientRegistry(clients_df["client_code"])  # падает на повторяющихся client_code
 
     # Standardize columns
     transactions_df = transactions_df.rename(columns={"products": "product"})
     transactions_df = transactions_df.drop(columns=["products"], errors="ignore")  # in case both existed
-    for _, row in clients_df.iterrows():
-        code = row["client_code"]
-
-    # Transactions
-
-        if "product" not in transactions_df.columns:
-            transactions_df["product"] = None 
-
-        client_transactions = [
-            Transaction(**t.to_dict())
-            for _, t in transactions_df[transactions_df["client_code"] == code].iterrows()
-        ]
-
-        if "product" not in transfers_df.columns:
-            transfers_df["product"] = None 
-    # Transfers
-        client_transfers = [
-            Transfer(**tr.to_dict())
-            for _, tr in transfers_df[transfers_df["client_code"] == code].iterrows()
-        ]
+    if "product" not in transactions_df.columns:
+        transactions_df = transactions_df.assign(product=None)
+    if "product" not in transfers_df.columns:
+        transfers_df = transfers_df.assign(product=None)
+
+    # Один проход по таблицам вместо фильтрации по каждому клиенту; сироты сюда не попадают
+    tx_rows = registry.rows(transactions_df["client_code"]) if len(transactions_df) else np.array([], dtype=int)
+    tr_rows = registry.rows(transfers_df["client_code"]) if len(transfers_df) else np.array([], dtype=int)
+    transactions_by_row = defaultdict(list)
+    for row, t in zip(tx_rows, transactions_df[list(Transaction.__dataclass_fields__)].to_dict("records")):
+        if row >= 0:
+            transactions_by_row[row].append(Transaction(**t))
+    transfers_by_row = defaultdict(list)
+    for row, tr in zip(tr_rows, transfers_df[list(Transfer.__dataclass_fields__)].to_dict("records")):
+        if row >= 0:
+            transfers_by_row[row].append(Transfer(**tr))
+
+    for i, row in enumerate(clients_df.to_dict("records")):
+        client_transactions = transactions_by_row.get(i, [])
+        client_transfers = transfers_by_row.get(i, [])
 
     # Group sums
         totals_by_category = defaultdict(float)
@@ -110,94 +130,229 @@ def build_clients(clients_df: pd.DataFrame, transactions_df: pd.DataFrame, trans
     return clients
 
 
+def report_orphans(clients, transactions_df: pd.DataFrame, transfers_df: pd.DataFrame) -> dict[str, int]:
+    """Печатает и возвращает количество транзакций/переводов с неизвестным client_code."""
+    orphans = ClientRegistry.of(clients).validate(transactions_df, transfers_df)
+    for table, count in orphans.items():
+        if count:
+            print(f"⚠️ {table}: {count} строк с client_code, которого нет в clients.csv — пропущены")
+    return orphans
 
-def handle_clients_logic(clients_df, transactions_df, transfers_df):
-    clients = build_clients(clients_df, transactions_df, transfers_df)
 
-    clients = calculations(transactions_df, transfers_df, clients)
-    result = []
-    for client in clients:
-        
-        print(f"\nClient: {client.name}, client_code: {client.client_code}, Age: {client.age}, City: {client.city}, Avg Balance: {client.avg_monthly_balance_KZT}₸")
-        best_product = choose_best_product(client, transfers_df)
-        push_notification = generate_push_notification(
-                name=client.name,
-                age=client.age,
-                profit=client.max_potential_profit,
-                product_type=best_product)
-
-        result.append((client.client_code, best_product, push_notification))
-    
-    save_push_notifications(result)
-
-
-def choose_best_product(client: Client, transfers_df) -> str:
-    
+def report_rule_problems(transactions_df: pd.DataFrame, transfers_df: pd.DataFrame) -> list[str]:
+    """Печатает категории/типы переводов из rules.json, которых нет в данных (опечатки в правилах)."""
+    problems = RULES.validate(
+        transactions_df["category"].unique() if len(transactions_df) else [],
+        transfers_df["type"].unique() if len(transfers_df) else [],
+    )
+    for problem in problems:
+        print(f"⚠️ rules: {problem}")
+    return problems
+
+def handle_clients_logic(clients_df, transactions_df, transfers_df,
+                         deadline_seconds: float | None = None,
+                         output: str = "result.csv",
+                         with_push: bool = True,
+                         dry_run: bool = False,
+                         workers: int = 1,
+                         backend: str | None = None,
+                         rank_k: int = 0,
+                         write_batch: int = BATCH_SIZE,
+                         partition_by_product: bool = False,
+                         writer=None,
+                         check_rules: bool = True,
+                         model: str | None = None,
+                         model_threshold: float | None = None,
+                         token_budget: int | None = None,
+                         cost_budget: float | None = None,
+                         observed_span: float | None = None):
+    """
+    Полный прогон: выбор продукта и (опционально) генерация пуша для каждого клиента.
+      - with_push=False — только выбор продуктов, колонка push_notification пустая;
+      - dry_run=True — без вызовов LLM (детерминированные тексты) и без записи файла;
+      - workers — сколько клиентов обрабатывать параллельно (ограничено ожиданием LLM);
+      - backend — движок агрегаций (backends.BACKENDS), по умолчанию AGG_BACKEND или pandas;
+      - rank_k > 0 — ещё и top-k продуктов каждого клиента в <output>.rank.npz (ranking.py);
+      - output — формат по расширению (csv_save.FORMATS); строки уходят во writer по мере готовности,
+        пачками по write_batch, файл появляется на месте только после успешного прогона;
+      - partition_by_product — output становится каталогом product=<name>/ (csv_save.PartitionedWriter);
+      - writer — общий writer нескольких вызовов (partition.py): строки пишутся в него, закрывает его
+        вызывающий, а output служит только базой для <output>.rank.npz;
+      - check_rules=False — не сверять rules.json с данными (в одной партиции видна лишь часть категорий);
+      - model — .npz local_model.LocalModel: клиенты ветки "ai" с вероятностью >= model_threshold
+        получают продукт модели без запроса к LLM;
+      - token_budget / cost_budget — бюджет LLM на прогон (tokens.RUN_BUDGET): запросы идут по убыванию
+        ценности клиента (scheduler.py), не влезшие в бюджет получают детерминированный текст;
+      - observed_span — период всей выгрузки в месяцах, когда на вход пришла её часть (партиция, выборка);
+        None — по датам clients/transactions/transfers этого вызова (features.FeatureCache.observed_span).
+    """
+    # Глобальный дедлайн прогона: после него LLM не вызывается, пуши — детерминированные.
+    # None — дедлайн не трогаем (его мог выставить batch на весь набор папок).
+    if deadline_seconds is not None:
+        RUN_DEADLINE.start(deadline_seconds)
+    # Так же бюджет: None и None — не трогаем (общий бюджет batch / партиций)
+    if token_budget is not None or cost_budget is not None:
+        RUN_BUDGET.start(token_budget, cost_budget)
+
+    clients = build_clients(clients_df, transactions_df, transfers_df)
+    report_orphans(clients, transactions_df, transfers_df)
+    if check_rules:
+        report_rule_problems(transactions_df, transfers_df)
+
+    clients = calculations(transactions_df, transfers_df, clients, backend=backend, observed_span=observed_span)
+
+    local = {}
+    if model:
+        from local_model import MODEL_THRESHOLD, LocalModel
+        threshold = MODEL_THRESHOLD if model_threshold is None else model_threshold
+        local = LocalModel.load(model).confident(clients, threshold)
+
+    result: list = [None] * len(clients)        # строки в порядке входа
+    own_writer = writer is None and not dry_run
+    if own_writer:
+        writer = open_writer(output, batch_size=write_batch, partition_by_product=partition_by_product)
+    # строки уходят во writer по мере готовности префикса, не дожидаясь всей LLM-работы
+    rows = InOrder(result, writer.write if writer is not None else None)
+
+    def push(i: int, client: Client, best_product: str):
+        if dry_run:
+            text = fallback_push_notification(client.name, client.max_potential_profit, best_product)
+        else:
+            text = generate_push_notification(
+                    name=client.name,
+                    age=client.age,
+                    profit=client.max_potential_profit,
+                    product_type=best_product)
+        rows.put(i, (client.client_code, best_product, text))
+
+    def process(i: int, client: Client, value: float):
+        if sampled(client.client_code):
+            log(_log, logging.DEBUG, "client", client_code=client.client_code, age=client.age, city=client.city,
+                avg_monthly_balance_KZT=client.avg_monthly_balance_KZT)
+        best_product = choose_best_product(client, use_llm=not dry_run, local=local.get(client.client_code))
+        if not with_push:
+            rows.put(i, (client.client_code, best_product, ""))
+            return None
+        # пуш встаёт в общую очередь со своим приоритетом (с учётом ценности продукта)
+        return priority(value, best_product), lambda: push(i, client, best_product)
+
+    # LLM-работа — по убыванию ценности клиента (scheduler.py): при дедлайне или бюджете
+    # детерминированные тексты достаются наименее ценным. dry run без LLM — в порядке входа.
+    values = [0.0 if dry_run else client_value(client) for client in clients]
+    with writer if own_writer else nullcontext():
+        run_by_priority([(value, partial(process, i, client, value))
+                         for i, (client, value) in enumerate(zip(clients, values))], workers=workers)
+
+    if dry_run:
+        print(f"Dry run: {len(result)} clients processed, nothing saved")
+    else:
+        if own_writer:
+            print(f"Saved {writer.rows} push notifications to {output} ✅")
+        if rank_k:
+            from ranking import ranking_path, write_ranking
+            saved = write_ranking(clients, ranking_path(output), rank_k)
+            if own_writer:
+                print(f"Top-{rank_k} rankings saved to {saved}")
+
+    token_stats = PROMPT_STATS.snapshot()
+    if token_stats["prompts"]:
+        print(f"AI prompts sent: {token_stats['prompts']}, tokens sent: {token_stats['tokens_sent']}, "
+              f"saved: {token_stats['tokens_saved']}, over prompt token limit: {token_stats['over_budget']}")
+    if RUN_BUDGET.limited:
+        spent = RUN_BUDGET.snapshot()
+        print(f"LLM budget: {spent['calls']} calls, {spent['tokens_spent']} tokens, ${spent['cost_spent']:.4f}; "
+              f"{spent['over_budget']} requests over budget got deterministic texts")
+    return result
+
+
+def decide_product(client) -> tuple[Optional[str], str, float]:
+    """
+    Правила без LLM: transfers -> deposit -> transactions.
+    Возвращает (product, branch, score); branch == "ai" — правила не сработали, product = None.
+    Работает и с Client, и с любым объектом с теми же агрегатами (см. aggregates.py).
+    """
     # 1) Check transfers for related products
-        # mapping: продукт -> связанные типы переводов
     best_product, score = recommend_product_by_transfers(
-        transfers_df[transfers_df["client_code"] == client.client_code],
+        getattr(client, "transfer_sums_by_type", {}),
         product_transfer_map
     )
-
     if best_product is not None:
-        print(f"Client {client.client_code} - Recommended by Transfers Logic: {best_product} (Score: {score})")
-        return best_product
+        return best_product, "transfers", score
 
     deposits_info = choose_deposit_product(client)
-    if deposits_info["product"] is not None and deposits_info["confidence"] >= 0.8:
-        print(f"Client {client.client_code} - Recommended by Deposit Logic: {deposits_info['product']} (Confidence: {deposits_info['confidence']})")
-        return deposits_info["product"]
-    
+    if deposits_info["product"] is not None and deposits_info["confidence"] >= RULES.deposit_min_confidence:
+        return deposits_info["product"], "deposit", deposits_info["confidence"]
+
     if client.product is not None:
-        print(f"Client {client.client_code} - Recommended by Transaction Logic: {client.product} (Potential Profit: {client.max_potential_profit}₸)")
-        return client.product
+        return client.product, "transactions", client.max_potential_profit
+
+    return None, "ai", 0.0
+
 
-    ai_product, accuracy = get_recomended_product(client)
+def choose_best_product(client: Client, use_llm: bool = True, local: tuple | None = None) -> str:
+    """local — уверенный прогноз local_model.LocalModel (product, score): тогда LLM не вызывается."""
+    product, branch, score = decide_product(client)
+    if branch != "ai":
+        # score: сумма переводов / уверенность депозита / выгода карты в месяц
+        log_decision(client.client_code, product, branch, score)
+        return product
 
-    print(f"Client {client.client_code} - Recommended by AI: {ai_product} (Accuracy: {accuracy})")
+    if local is not None:
+        (ai_product, accuracy), source = local, "model"
+    elif use_llm:
+        ai_product, accuracy, source = get_recomended_product(client)
+    else:
+        (ai_product, accuracy), source = fallback_recomended_product(client), "fallback"
+
+    # source == "llm" — ответы, на которых учится local_model (train-model --log)
+    log_decision(client.client_code, ai_product, branch, accuracy, llm=use_llm, source=source)
     return ai_product
 
-def calculations(transactions_df, transfers_df, clients):
+# Группировки для backends: только суммы amount, остальное — перестановка маленьких результатов
+TRANSACTION_GROUPINGS = {
+    "by_category": ["client_code", "category"],
+    "total": ["client_code"],
+}
+TRANSFER_GROUPINGS = {
+    "by_direction": ["client_code", "direction"],
+    "by_type": ["client_code", "type"],
+    "by_direction_type": ["client_code", "direction", "type"],
+}
+
+def calculations(transactions_df, transfers_df, clients, backend: Optional[str] = None,
+                 observed_span: Optional[float] = None):
+    # Помесячные признаки и фактический период выгрузки (вместо «всегда 3 месяца»), один на всех клиентов;
+    # observed_span — период всей выгрузки, если здесь только её часть (партиция, выборка)
+    registry = ClientRegistry.from_clients(clients)
+    features = FeatureCache(registry, transactions_df, transfers_df)
+    span = observed_span or features.observed_span or None
+    for client in clients:
+        client.features = features.get(client.client_code)
+        client.observed_months = span
+
+    backend = get_backend(backend)
+    tx_sums = backend.aggregate(transactions_df, TRANSACTION_GROUPINGS)
+    tr_sums = backend.aggregate(transfers_df, TRANSFER_GROUPINGS)
+
     # GROUP TRANSACTIONS
-    grouped_transactions = (
-        transactions_df
-        .groupby(["client_code", "category"])["amount"]
-        .sum()
-        .reset_index()
-        .sort_values(by="amount", ascending=False)
-    )
-    grouped_transactions = grouped_transactions.sort_values(
+    grouped_transactions = tx_sums["by_category"].sort_values(
         by=["client_code", "amount"], ascending=[True, False]
     )
 
     spent_categories_per_client = grouped_transactions.groupby("client_code").head(10000)
-    clients = group_category_product(spent_categories_per_client, clients)
+    group_category_product(spent_categories_per_client, registry)
 
-    transactions_total_dict = dict(
-        transactions_df.groupby("client_code")["amount"].sum()
-    )
+    transactions_total_dict = dict(zip(tx_sums["total"]["client_code"], tx_sums["total"]["amount"]))
 
     # Calculate total in/out transfers per client
     transfer_direction_sums = (
-        transfers_df
-        .groupby(["client_code", "direction"])["amount"]
-        .sum()
-        .unstack(fill_value=0)  # makes columns 'in', 'out'
-        .reset_index()
-    )
-
-    # Calculate total in/out transfers per client
-    transfer_types_sums = (
-        transfers_df
-        .groupby(["client_code", "type"])["amount"]
-        .sum()
+        tr_sums["by_direction"]
+        .set_index(["client_code", "direction"])["amount"]
         .unstack(fill_value=0)  # makes columns 'in', 'out'
         .reset_index()
     )
 
-
-    clients = group_transfers_by_type(transfers_df, clients)
+    clients = group_transfers_by_type(transfers_df, clients, sums=tr_sums)
 
     in_totals = dict(zip(transfer_direction_sums["client_code"], transfer_direction_sums.get("in", 0)))
     out_totals = dict(zip(transfer_direction_sums["client_code"], transfer_direction_sums.get("out", 0)))
@@ -213,24 +368,17 @@ def calculations(transactions_df, transfers_df, clients):
 
     return clients
 
-# mapping: продукт -> связанные типы переводов
-product_transfer_map = {
-   "Обмен валют": ["fx_buy", "fx_sell"],
-   "Инвестиции": ["invest_out", "invest_in"],
-   "Золотые слитки": ["gold_buy_out", "gold_sell_in"]
-}
+# mapping: продукт -> связанные типы переводов (rules.json)
+product_transfer_map = RULES.transfer_products
 
-def recommend_product_by_transfers(client_transfers, product_map):
+def recommend_product_by_transfers(transfer_sums_by_type: dict, product_map):
 
     scores = {product: 0 for product in product_map}
 
-    for _, tr in client_transfers.iterrows():
-        tr_type = tr["type"]
-        tr_amount = tr["amount"]
-        for product, related_types in product_map.items():
-            if tr_type in related_types:
-                # можно учитывать не только факт операции, но и её сумму
-                scores[product] += tr_amount
+    for product, related_types in product_map.items():
+        for tr_type in related_types:
+            # можно учитывать не только факт операции, но и её сумму
+            scores[product] += transfer_sums_by_type.get(tr_type, 0.0)
 
     # выбрать продукт с максимальным "весом"
     if max(scores.values()) == 0:
@@ -240,108 +388,76 @@ def recommend_product_by_transfers(client_transfers, product_map):
     return best_product, scores[best_product]
 
 
-PRODUCT_CATEGORIES = {
-    "Карта для путешествий": ["Путешествия", "Отели", "Такси"],
-    "Кредитная карта": ["Едим дома", "Смотрим дома", "Играем дома"],
-    "Премиальная карта": ["Ювелирные изделия", "Косметика и Парфюмерия", "Кафе и рестораны",],
-    "Депозит Накопительный":[],
-    "Депозит Мультивалютный": [],
-    "Депозит Сберегательный": [],
-    "Золотые слитки": [],
-    "Инвестиции": [],
-    "Обмен валют": [],
-    "Кредит наличными": [],
-    "Другое": []
-}
+# продукт -> категории трат (rules.json)
+PRODUCT_CATEGORIES = RULES.product_categories
 
 
-def get_dynamic_threshold(client: Client, product: str) -> float:
-    base = {
-        "Премиальная карта": 0.30,
-        "Кредитная карта":   0.26,
-        "Карта для путешествий": 0.26,
-    }
-    thr = base.get(product, 0.0)
-
-    if product == "Премиальная карта":
-        if client.avg_monthly_balance_KZT >= 1_500_000 or client.status == "Премиальный клиент":
-            thr -= 0.10
-        if client.status == "Студент":
-            thr += 0.10
-
-    if product == "Кредитная карта":
-        if client.age < 25:
-            thr -= 0.05
-        if any(tr.type in ("installment_payment_out", "cc_repayment_out") for tr in client.transfers):
-            thr -= 0.05
-
-    if product == "Карта для путешествий":
-        travel_cats = set(PRODUCT_CATEGORIES["Карта для путешествий"])
-        travel_spend = sum(tx.amount for tx in client.transactions if tx.category in travel_cats)
-        if travel_spend >= 400_000:
-            thr -= 0.10
-        if client.status == 'обычный':
-            thr += 0.15
-
-
-    return max(min(thr, 0.9), 0.05)  # защита от экстремумов
-
-# --- 3) Сервисные функции подсчета доли ---
-def _build_cat_to_product() -> dict:
-    cat_to_product = {}
-    for prod, cats in PRODUCT_CATEGORIES.items():
-        for c in cats:
-            cat_to_product[c] = prod
-    return cat_to_product
-
-def _share_by_product_for_client(df_client: pd.DataFrame, product: str) -> float:
-    """Доля трат клиента в категориях, релевантных product."""
-    cats = set(PRODUCT_CATEGORIES.get(product, []))
-    total = df_client["amount"].sum()
-    if total <= 0:
-        return 0.0
-    relevant = df_client[df_client["category"].isin(cats)]["amount"].sum()
-    return float(relevant) / float(total)
-
-# --- 4) Основная функция выбора продукта с учётом динамического порога ---
-def group_category_product(spent_categories_per_client: pd.DataFrame, clients: list[Client]):
-    cat_to_product = _build_cat_to_product()
-    df = spent_categories_per_client.copy()
-    df["product"] = df["category"].map(cat_to_product).fillna("Другое")
-
-    grouped = (
-        df.groupby(["client_code", "product"], as_index=False)["amount"]
-          .sum()
-          .sort_values(["client_code", "amount"], ascending=[True, False])
-    )
-
-    # быстрое разбиение по клиентам
-    df_by_client = {cid: g.drop(columns=["product"]) for cid, g in df.groupby("client_code")}
-
-    for client_code, group in grouped.groupby("client_code"):
-        client = clients[client_code - 1]
-        df_client = df_by_client.get(client_code, df.iloc[0:0])
+def _transfer_types(client) -> set:
+    """Типы переводов клиента; из агрегатов (client.transfer_types), если они есть."""
+    types = getattr(client, "transfer_types", None)
+    if types is not None:
+        return types
+    return {tr.type for tr in client.transfers}
 
-        max_profit = 0.0
-        max_product = None
 
-        for row in group.itertuples():
-            product = row.product
-
-            # если продукт из «процентных» — проверяем долю против динамического порога
-            if product in ("Премиальная карта", "Кредитная карта", "Карта для путешествий"):
-                share = _share_by_product_for_client(df_client, product)
-                thr = get_dynamic_threshold(client, product)
-                if share < thr:
-                    continue
+def _rule_inputs(clients: list) -> tuple:
+    """
+    Колонки для RULES.select_card_products по списку Client (или агрегатов):
+    (траты по категориям правил, то же в KZT, все траты, профиль + типы переводов, месяцы).
+    """
+    categories = RULES.categories
+    totals = np.array(
+        [[c.totals_by_category.get(k, 0.0) for k in categories] for c in clients], dtype="float64"
+    ).reshape(len(clients), len(categories))
+    by_category_kzt = [spending_kzt_by_category(c) for c in clients]
+    totals_kzt = np.array(
+        [[t.get(k, 0.0) for k in categories] for t in by_category_kzt], dtype="float64"
+    ).reshape(len(clients), len(categories))
+    total = np.array([sum(c.totals_by_category.values()) for c in clients], dtype="float64")
+
+    columns = {f: np.array([getattr(c, f) for c in clients]) for f in PROFILE_FIELDS}
+    types = [_transfer_types(c) for c in clients]
+    for ttype in RULES.transfer_types:
+        columns[transfer_column(ttype)] = np.array([ttype in t for t in types], dtype=bool)
+    months = np.array([observed_months(c) for c in clients], dtype="float64")
+    return totals, totals_kzt, total, columns, months
+
+# --- Выбор карточного продукта по правилам ---
+def best_products_by_transactions(clients: list) -> list[tuple[Optional[str], float]]:
+    """
+    Для всех клиентов сразу: (product, max_potential_profit) по тратам;
+    (None, 0.0), если ни один карточный продукт не прошёл динамический порог доли.
+    """
+    if not clients:
+        return []
+    best, profit = RULES.select_card_products(*_rule_inputs(clients))
+    return [
+        (RULES.card_products[i] if i >= 0 else None, float(p))
+        for i, p in zip(best, profit)
+    ]
+
+def best_product_by_transactions(client) -> tuple[Optional[str], float]:
+    """
+    Выбор карточного продукта по агрегатам трат client.totals_by_category (один клиент, онлайн).
+    Возвращает (product, max_potential_profit); (None, 0.0), если ничего не прошло порог.
+    """
+    types = _transfer_types(client)
+    columns = {f: getattr(client, f) for f in PROFILE_FIELDS}
+    for ttype in RULES.transfer_types:
+        columns[transfer_column(ttype)] = ttype in types
+    best, profit = RULES.select_card_product(
+        client.totals_by_category, spending_kzt_by_category(client),
+        sum(client.totals_by_category.values()), columns, observed_months(client),
+    )
+    return (RULES.card_products[best] if best >= 0 else None), profit
 
-            profit = calculate_profit_for_client_by_product(client, product)
-            if profit > max_profit:
-                max_profit = profit
-                max_product = product
-        client.max_potential_profit = max_profit
-        client.product = max_product
 
+def group_category_product(spent_categories_per_client: pd.DataFrame, clients):
+    registry = ClientRegistry.of(clients)
+    selected = [registry.get(code) for code in spent_categories_per_client["client_code"].unique()]
+    selected = [c for c in selected if c is not None]  # сироты: нет в clients.csv
+    for client, (product, profit) in zip(selected, best_products_by_transactions(selected)):
+        client.product, client.max_potential_profit = product, profit
 
     return clients
 
@@ -349,6 +465,8 @@ def group_category_product(spent_categories_per_client: pd.DataFrame, clients: l
 def group_transfers_by_type(
     transfers_df: pd.DataFrame,
     clients,
+    backend: Optional[str] = None,
+    sums: Optional[dict] = None,
 ) -> List[Client]:
     """
     Aggregates transfers by type and direction, sets per-client totals and dicts:
@@ -356,27 +474,28 @@ def group_transfers_by_type(
       - client.transfer_sums_by_direction:   {"in": 120000, "out": 50000}
       - client.transfer_sums_by_direction_type: {"in": {"salary_in": ...}, "out": {"card_out": ...}}
       - client.total_transfers_in / _out / _total
-    Optionally normalizes amounts to base_currency using `currency_rates`.
+    Grouped sums come from `sums` (TRANSFER_GROUPINGS, already computed) or the given backend.
     """
     if transfers_df.empty or not len(clients):
         return clients
 
-    df = transfers_df.copy()
+    if sums is None:
+        sums = get_backend(backend).aggregate(transfers_df, TRANSFER_GROUPINGS)
 
     # Build quick lookup for clients
     clients_by_code = {c.client_code: c for c in clients}
 
     # 1) sums by type (direction-agnostic)
     by_type = (
-        df.groupby(["client_code", "type"])["amount"]
-          .sum()
+        sums["by_type"]
+          .set_index(["client_code", "type"])["amount"]
           .unstack(fill_value=0.0)
     )
 
 
     # 3) sums by direction × type (nice for fine-grained inspection)
     by_dir_type = pd.pivot_table(
-        df,
+        sums["by_direction_type"],
         index="client_code",
         columns=["direction", "type"],
         values="amount",
@@ -1,10 +1,307 @@
+"""
+Result writers: rows (client_code, product, push_notification).
+
+    with open_writer("result.parquet", batch_size=50_000, partition_by_product=True) as writer:
+        for row in rows:
+            writer.write(row)
+
+The format comes from the suffix: .csv, .csv.gz, .jsonl, .jsonl.gz, .parquet
+(needs pyarrow). Rows are buffered and handed to the back end every batch_size
+rows (a Parquet row group per batch). Everything goes to a temp file next to
+the target and is renamed over it on close, so a reader never sees half a
+result and a failed run leaves the previous one in place.
+
+partition_by_product=True makes the target a directory in Hive layout,
+<path>/product=<name>/part-0<suffix>, without the product column in the files:
+pyarrow / duckdb / polars read it as one dataset, read_results() puts the
+column back.
+"""
 import csv
+import gzip
+import json
+from json.encoder import encode_basestring
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+COLUMNS = ["client_code", "product", "push_notification"]
+FORMATS = (".csv", ".csv.gz", ".jsonl", ".jsonl.gz", ".parquet")
+BATCH_SIZE = 10_000
+PARTITION_COLUMN = "product"
+PART_NAME = "part-0"
+EMPTY_PARTITION = "__HIVE_DEFAULT_PARTITION__"      # как в Hive/pyarrow для пустого значения
+FILE_BUFFER = 1 << 20
+
+
+def output_format(path) -> str:
+    name = Path(path).name.lower()
+    for suffix in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    raise ValueError(f"Unknown result format {Path(path).name!r}, expected one of {FORMATS}")
+
+
+def _tmp_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.tmp-{os.getpid()}")
+
+
+def _jsonable(value):
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _json_value(value) -> str:
+    # строки и int — напрямую (их большинство), остальное через json.dumps
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value, ensure_ascii=False, default=_jsonable)
+
+
+class ResultWriter:
+    """Буфер строк + атомарная фиксация; наследники пишут пачку в _write_batch."""
+
+    def __init__(self, path, columns=COLUMNS, batch_size: int = BATCH_SIZE, atomic: bool = True):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.batch_size = max(1, batch_size)
+        self.rows = 0
+        self._buffer: list = []
+        self._target = _tmp_path(self.path) if atomic else self.path
+        self._open(self._target)
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self.rows += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        """Дописывает буфер и переименовывает временный файл в целевой."""
+        self.flush()
+        self._close()
+        if self._target != self.path:
+            os.replace(self._target, self.path)
+
+    def abort(self):
+        """Сбой посреди записи: временный файл удаляется, прежний результат остаётся."""
+        self._buffer = []
+        try:
+            self._close()
+        finally:
+            if self._target != self.path:
+                self._target.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # --- back end ---
+    def _open(self, path: Path):
+        raise NotImplementedError
+
+    def _write_batch(self, rows: list):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class CsvWriter(ResultWriter):
+    """CSV (gzip для .csv.gz) через csv.writer, пачками writerows."""
+
+    def __init__(self, path, columns=COLUMNS, batch_size: int = BATCH_SIZE, atomic: bool = True,
+                 compress: bool | None = None):
+        self.compress = str(path).endswith(".gz") if compress is None else compress
+        super().__init__(path, columns, batch_size, atomic)
+
+    def _open(self, path: Path):
+        if self.compress:
+            self._file = gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6)
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8", buffering=FILE_BUFFER)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def _write_batch(self, rows: list):
+        self._writer.writerows(rows)
+
+    def _close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class JsonlWriter(CsvWriter):
+    """JSON lines: по объекту {колонка: значение} на строку, gzip для .jsonl.gz."""
+
+    def _open(self, path: Path):
+        if self.compress:
+            self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        else:
+            self._file = open(path, "w", encoding="utf-8", buffering=FILE_BUFFER)
+        self._keys = [encode_basestring(c) + ": " for c in self.columns]
+
+    def _write_batch(self, rows: list):
+        keys = self._keys
+        self._file.write("".join(
+            "{" + ", ".join([key + _json_value(value) for key, value in zip(keys, row)]) + "}\n"
+            for row in rows))
+
+
+class ParquetWriter(ResultWriter):
+    """Parquet через pyarrow: пачка — row group, колонки читаются без разбора текста."""
+
+    def _open(self, path: Path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+        types = {"client_code": pa.int64()}
+        self._pa = pa
+        self._schema = pa.schema([(c, types.get(c, pa.string())) for c in self.columns])
+        self._file = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def _write_batch(self, rows: list):
+        data = [list(column) for column in zip(*rows)]
+        self._file.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(data, self._schema)],
+            schema=self._schema))
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+WRITERS = {".csv": CsvWriter, ".csv.gz": CsvWriter, ".jsonl": JsonlWriter, ".jsonl.gz": JsonlWriter,
+           ".parquet": ParquetWriter}
+
+
+def partition_dir(value) -> str:
+    return f"{PARTITION_COLUMN}={value or EMPTY_PARTITION}"
+
+
+class PartitionedWriter:
+    """
+    По файлу на продукт во временном каталоге; на close каталог встаёт на место
+    прежнего (тот удаляется уже после переименования).
+    """
+
+    def __init__(self, path, columns=COLUMNS, batch_size: int = BATCH_SIZE):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.fmt = output_format(self.path)
+        self.rows = 0
+        self._key = self.columns.index(PARTITION_COLUMN)
+        self._rest = [c for c in self.columns if c != PARTITION_COLUMN]
+        self._parts: dict = {}
+        self._tmp = _tmp_path(self.path)
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp.mkdir(parents=True)
+
+    def write(self, row):
+        value = row[self._key]
+        part = self._parts.get(value)
+        if part is None:
+            directory = self._tmp / partition_dir(value)
+            directory.mkdir()
+            part = self._parts[value] = WRITERS[self.fmt](
+                directory / (PART_NAME + self.fmt), self._rest, self.batch_size, atomic=False)
+        part.write(row[:self._key] + row[self._key + 1:])
+        self.rows += 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        for part in self._parts.values():
+            part.close()
+        old = self.path.with_name(f".{self.path.name}.old-{os.getpid()}")
+        if self.path.is_dir():
+            self.path.rename(old)
+        elif self.path.exists():
+            self.path.unlink()
+        self._tmp.rename(self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def abort(self):
+        for part in self._parts.values():
+            try:
+                part.abort()
+            except Exception:  # noqa: BLE001 — каталог удаляется целиком
+                pass
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    __enter__ = ResultWriter.__enter__
+    __exit__ = ResultWriter.__exit__
+
+
+def open_writer(path, columns=COLUMNS, batch_size: int = BATCH_SIZE, partition_by_product: bool = False):
+    path = Path(path)
+    if partition_by_product:
+        return PartitionedWriter(path, columns, batch_size)
+    return WRITERS[output_format(path)](path, columns, batch_size)
+
+
+def save_push_notifications(results, filename="result.csv", batch_size: int = BATCH_SIZE,
+                            partition_by_product: bool = False):
+    with open_writer(filename, batch_size=batch_size, partition_by_product=partition_by_product) as writer:
+        writer.write_rows(results)
+    print(f"Saved {writer.rows} push notifications to {filename} ✅")
+
+
+# --- чтение (check, serve) ---
+
+def _read_file(path: Path, fmt: str, columns, chunksize: int):
+    if fmt == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet results needs pyarrow: pip install pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt.startswith(".jsonl"):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunksize, dtype=False):
+            yield chunk.reindex(columns=columns) if columns else chunk
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize,
+                               dtype={"product": object, "push_notification": object})
 
-def save_push_notifications(results,filename="result.csv"):
-    # --- Write to CSV ---
-    with open(filename, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-        writer.writerow(["client_code", "product", "push_notification"])
-        writer.writerows(results)
 
-    print(f"Saved {len(results)} push notifications to {filename} ✅")
\ No newline at end of file
+def read_results(path, columns=None, chunksize: int = 100_000):
+    """
+    Чанки DataFrame из результата любого формата, в том числе каталога с партициями
+    (колонка product восстанавливается из имени каталога). Пустые значения — NaN/None.
+    """
+    path = Path(path)
+    fmt = output_format(path)
+    if not path.is_dir():
+        yield from _read_file(path, fmt, columns, chunksize)
+        return
+    wanted = None if columns is None else [c for c in columns if c != PARTITION_COLUMN]
+    for part in sorted(path.glob(f"{PARTITION_COLUMN}=*/*{fmt}")):
+        value = part.parent.name.split("=", 1)[1]
+        for chunk in _read_file(part, fmt, wanted, chunksize):
+            if columns is None or PARTITION_COLUMN in columns:
+                chunk.insert(min(COLUMNS.index(PARTITION_COLUMN), chunk.shape[1]), PARTITION_COLUMN,
+                             None if value == EMPTY_PARTITION else value)
+            yield chunk if columns is None else chunk[columns]
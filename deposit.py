@@ -2,6 +2,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Tuple
 
+from rules import RULES
+
 # ----- Конфиг: курсы и ставки (можешь менять под бэкенд/окружение) -----
 DEFAULT_FX_RATES_TO_KZT: Dict[str, float] = {
     "KZT": 1.0,
@@ -10,16 +12,25 @@ DEFAULT_FX_RATES_TO_KZT: Dict[str, float] = {
     "RUB": 5.0,
 }
 
-DEFAULT_DEPOSIT_RATES = {
-    "Депозит Накопительный": 0.14,   # 14% годовых (пример)
-    "Депозит Мультивалютный": 0.02,  # 2% годовых на FX-остаток (пример)
-}
+# Ставки, пороги и параметры уверенности — в rules.json
+NAKOP = "Депозит Накопительный"
+MULTI = "Депозит Мультивалютный"
+DEFAULT_DEPOSIT_RATES = {product: spec["rate"] for product, spec in RULES.deposits.items()}
+NAKOP_MIN_BALANCE = RULES.deposits[NAKOP]["min_balance"]
+FX_TOPUP_TYPE = RULES.deposits[MULTI]["topup_type"]
+FX_WITHDRAW_TYPE = RULES.deposits[MULTI]["withdraw_type"]
+FX_WITHDRAW_FACTOR = RULES.deposits[MULTI]["withdraw_factor"]
 
 # Сколько месяцев охватывают данные (по ТЗ — 3 мес)
 OBSERVED_MONTHS = 3
 
 
 # ----- Утилиты -----
+def observed_months(client) -> float:
+    """Период выгрузки в месяцах (features.FeatureCache.observed_span, общий для всех клиентов), иначе OBSERVED_MONTHS."""
+    return getattr(client, "observed_months", None) or OBSERVED_MONTHS
+
+
 def to_kzt(amount: float, currency: str, rates: Dict[str, float]) -> float:
     rate = rates.get(currency.upper())
     if rate is None:
@@ -27,6 +38,27 @@ def to_kzt(amount: float, currency: str, rates: Dict[str, float]) -> float:
     return amount * rate
 
 
+def fx_transfer_stats(client) -> Tuple[int, float, int, float]:
+    """
+    Возвращает (число FX-топапов, топапы в KZT, число FX-снятий, снятия в KZT).
+    Если у клиента уже есть агрегаты (client.fx_stats), сырые переводы не перебираются.
+    """
+    stats = getattr(client, "fx_stats", None)
+    if stats is not None:
+        return tuple(stats)
+
+    topup_cnt = withdraw_cnt = 0
+    topup_sum_kzt = withdraw_sum_kzt = 0.0
+    for tr in client.transfers:
+        if tr.type == FX_TOPUP_TYPE:
+            topup_cnt += 1
+            topup_sum_kzt += to_kzt(tr.amount, tr.currency, DEFAULT_FX_RATES_TO_KZT)
+        elif tr.type == FX_WITHDRAW_TYPE:
+            withdraw_cnt += 1
+            withdraw_sum_kzt += to_kzt(tr.amount, tr.currency, DEFAULT_FX_RATES_TO_KZT)
+    return topup_cnt, topup_sum_kzt, withdraw_cnt, withdraw_sum_kzt
+
+
 def count_fx_transfers(client) -> Tuple[int, float, float]:
     """
     Возвращает:
@@ -34,22 +66,13 @@ def count_fx_transfers(client) -> Tuple[int, float, float]:
       - суммарный объём topup_out в KZT
       - суммарный объём withdraw_in в KZT
     """
-    topup_cnt = 0
-    topup_sum_kzt = 0.0
-    withdraw_sum_kzt = 0.0
-    for tr in client.transfers:
-        if tr.type == "deposit_fx_topup_out":
-            topup_cnt += 1
-            topup_sum_kzt += to_kzt(tr.amount, tr.currency, DEFAULT_FX_RATES_TO_KZT)
-        elif tr.type == "deposit_fx_withdraw_in":
-            withdraw_sum_kzt += to_kzt(tr.amount, tr.currency, DEFAULT_FX_RATES_TO_KZT)
+    topup_cnt, topup_sum_kzt, _, withdraw_sum_kzt = fx_transfer_stats(client)
     return topup_cnt, topup_sum_kzt, withdraw_sum_kzt
 
 
 def has_required_fx_patterns(client) -> bool:
-    seen_topup = any(t.type == "deposit_fx_topup_out" for t in client.transfers)
-    seen_withdraw = any(t.type == "deposit_fx_withdraw_in" for t in client.transfers)
-    return seen_topup and seen_withdraw
+    topup_cnt, _, withdraw_cnt, _ = fx_transfer_stats(client)
+    return topup_cnt > 0 and withdraw_cnt > 0
 
 
 def estimate_avg_fx_balance_kzt(client) -> float:
@@ -57,11 +80,11 @@ def estimate_avg_fx_balance_kzt(client) -> float:
     Приблизительно оцениваем средний FX-остаток за период.
     Метод: проходим по времени и интегрируем кумулятивный остаток,
     но без дат можно применить устойчивую эвристику:
-      avg_balance ≈ max(0, (sum_topups_kzt - sum_withdraws_kzt * 0.8))
-    Коэффициент 0.8 сглаживает "качание" баланса.
+      avg_balance ≈ max(0, (sum_topups_kzt - sum_withdraws_kzt * withdraw_factor))
+    Коэффициент withdraw_factor (rules.json, 0.8) сглаживает "качание" баланса.
     """
     _, topup_kzt, withdraw_kzt = count_fx_transfers(client)
-    return max(0.0, topup_kzt - withdraw_kzt * 0.8)
+    return max(0.0, topup_kzt - withdraw_kzt * FX_WITHDRAW_FACTOR)
 
 
 # ----- Прибыль по продуктам -----
@@ -70,7 +93,7 @@ def profit_deposit_nakop(client, annual_rate: float) -> float:
     Ожидаемая прибыль (KZT) за период наблюдений от накопительного вклада.
     """
     monthly_rate = annual_rate / 12.0
-    return client.avg_monthly_balance_KZT * monthly_rate * OBSERVED_MONTHS
+    return client.avg_monthly_balance_KZT * monthly_rate * observed_months(client)
 
 
 def profit_deposit_multicurrency(client, annual_rate: float) -> float:
@@ -80,20 +103,21 @@ def profit_deposit_multicurrency(client, annual_rate: float) -> float:
     """
     avg_fx_bal_kzt = estimate_avg_fx_balance_kzt(client)
     monthly_rate = annual_rate / 12.0
-    return avg_fx_bal_kzt * monthly_rate * OBSERVED_MONTHS
+    return avg_fx_bal_kzt * monthly_rate * observed_months(client)
 
 
 # ----- Уверенность (0.0..1.0) -----
-def confidence_nakop(client, threshold: float = 1_000_000) -> float:
+def confidence_nakop(client, threshold: float = NAKOP_MIN_BALANCE) -> float:
     """
-    База 0.55 при выполнении порога.
-    + до +0.4 линейно за «запас» над порогом (капим 0.95)
+    База (0.55) при выполнении порога.
+    + до max_bonus (0.4) линейно за «запас» над порогом (капим cap, 0.95)
     """
+    conf = RULES.deposits[NAKOP]["confidence"]
     if client.avg_monthly_balance_KZT <= threshold:
         return 0.0
     surplus = client.avg_monthly_balance_KZT - threshold
-    bonus = min(0.4, (surplus / threshold) * 0.4)
-    return min(0.95, 0.55 + bonus)
+    bonus = min(conf["max_bonus"], (surplus / threshold) * conf["max_bonus"])
+    return min(conf["cap"], conf["base"] + bonus)
 
 
 def confidence_multicurrency(client) -> float:
@@ -103,14 +127,15 @@ def confidence_multicurrency(client) -> float:
     """
     if not has_required_fx_patterns(client):
         return 0.0
+    conf = RULES.deposits[MULTI]["confidence"]
     topup_cnt, topup_kzt, withdraw_kzt = count_fx_transfers(client)
-    # 0..0.35 за частоту (нормализация на 6 событий за 3 мес)
-    freq_bonus = min(0.35, (topup_cnt / 6.0) * 0.35)
-    return min(0.95, 0.60 + freq_bonus)
+    # 0..max_bonus за частоту (нормализация на topups_for_max_bonus событий за 3 мес)
+    freq_bonus = min(conf["max_bonus"], (topup_cnt / conf["topups_for_max_bonus"]) * conf["max_bonus"])
+    return min(conf["cap"], conf["base"] + freq_bonus)
 
 
 # ----- Правила применимости -----
-def eligible_nakop(client, threshold: float = 1_000_000) -> bool:
+def eligible_nakop(client, threshold: float = NAKOP_MIN_BALANCE) -> bool:
     return client.avg_monthly_balance_KZT > threshold
 
 
@@ -137,20 +162,20 @@ def choose_deposit_product(
 
     # Кандидат: Депозит Накопительный
     if eligible_nakop(client):
-        profit = profit_deposit_nakop(client, rates["Депозит Накопительный"])
+        profit = profit_deposit_nakop(client, rates[NAKOP])
         conf = confidence_nakop(client)
-        candidates.append(("Депозит Накопительный", profit, conf, [
-            "Средний остаток > 1 000 000 ₸",
-            f"Ставка по продукту ~{int(rates['Депозит Накопительный']*100)}% годовых (пример)"
+        candidates.append((NAKOP, profit, conf, [
+            f"Средний остаток > {NAKOP_MIN_BALANCE:,.0f} ₸".replace(",", " "),
+            f"Ставка по продукту ~{int(rates[NAKOP]*100)}% годовых (пример)"
         ]))
 
     # Кандидат: Депозит Мультивалютный
     if eligible_multicurrency(client):
-        profit = profit_deposit_multicurrency(client, rates["Депозит Мультивалютный"])
+        profit = profit_deposit_multicurrency(client, rates[MULTI])
         conf = confidence_multicurrency(client)
-        candidates.append(("Депозит Мультивалютный", profit, conf, [
-            "Есть и пополнения, и снятия FX-вклада (deposit_fx_topup_out & deposit_fx_withdraw_in)",
-            f"Ставка по продукту ~{int(rates['Депозит Мультивалютный']*100)}% годовых (пример)"
+        candidates.append((MULTI, profit, conf, [
+            f"Есть и пополнения, и снятия FX-вклада ({FX_TOPUP_TYPE} & {FX_WITHDRAW_TYPE})",
+            f"Ставка по продукту ~{int(rates[MULTI]*100)}% годовых (пример)"
         ]))
 
     if not candidates:
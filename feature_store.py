@@ -0,0 +1,244 @@
+"""
+On-disk per-client feature store.
+
+Fixed-width .npy matrices opened with mmap_mode="r", so any number of
+processes share the same pages through the OS cache and reads are zero-copy:
+
+    client_codes.npy      int64 [clients]              sorted, row index = searchsorted
+    categories.npy        float64 [clients x categories]   raw amounts (shares)
+    categories_kzt.npy    float64 [clients x categories]   amounts in KZT (profits)
+    transfers_in.npy      float64 [clients x types]
+    transfers_out.npy     float64 [clients x types]
+    transfer_counts.npy   int32   [clients x types]
+    scalars.npy           float64 [clients x SCALARS]
+    names.npy / cities.npy / labels.npy   fixed-width unicode, as wide as the longest value
+    meta.json             column names, status dictionary
+
+ClientAggregates built from a row (FeatureStore.client) works with
+client.decide_product, ai_client.build_recommendation_prompt and the check reports.
+"""
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregates import FX_TOPUP_TYPE, FX_WITHDRAW_TYPE, ClientAggregates
+from deposit import DEFAULT_FX_RATES_TO_KZT
+from features import FeatureCache
+from profits import CURRENCY_RATES
+
+SCALARS = [
+    "age",
+    "avg_monthly_balance_KZT",
+    "status",            # код в meta["statuses"]
+    "observed_months",   # активные месяцы клиента (признак); период выгрузки — meta["observed_span"]
+    "fx_topup_count",
+    "fx_topup_kzt",
+    "fx_withdraw_count",
+    "fx_withdraw_kzt",
+]
+# минимальная ширина строковых колонок; длиннее — колонка расширяется до самой длинной строки
+NAME_WIDTH = 64
+CITY_WIDTH = 32
+LABEL_WIDTH = 32
+
+
+def _pivot(df: pd.DataFrame, column: str, codes: np.ndarray, keys: list, values: str = "amount",
+           aggfunc: str = "sum", dtype="float64") -> np.ndarray:
+    if df.empty:
+        return np.zeros((len(codes), len(keys)), dtype=dtype)
+    table = df.pivot_table(index="client_code", columns=column, values=values, aggfunc=aggfunc, fill_value=0)
+    return table.reindex(index=codes, columns=keys, fill_value=0).fillna(0).to_numpy(dtype=dtype)
+
+
+def _strings(values: pd.Series, width: int) -> np.ndarray:
+    """Строки в fixed-width unicode без обрезки: ширина — max(width, самая длинная строка)."""
+    values = values.astype(str)
+    longest = int(values.str.len().max()) if len(values) else 0
+    return values.to_numpy(dtype=f"U{max(width, longest)}")
+
+
+def _save(path: Path, name: str, array: np.ndarray):
+    out = np.lib.format.open_memmap(path / f"{name}.npy", mode="w+", dtype=array.dtype, shape=array.shape)
+    out[...] = array
+    out.flush()
+    del out
+
+
+def build_feature_store(path: Path, clients_df: pd.DataFrame, transactions_df: pd.DataFrame,
+                        transfers_df: pd.DataFrame) -> Path:
+    """Vectorized build from raw frames; written to a temp dir and renamed into place."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    clients_df = clients_df.sort_values("client_code")
+    codes = clients_df["client_code"].to_numpy(dtype=np.int64)
+    categories = sorted(transactions_df["category"].dropna().unique()) if len(transactions_df) else []
+    types = sorted(transfers_df["type"].dropna().unique()) if len(transfers_df) else []
+    statuses = sorted(clients_df["status"].dropna().unique())
+
+    tx = transactions_df.assign(
+        amount_kzt=transactions_df["amount"] * transactions_df["currency"].map(CURRENCY_RATES).fillna(1)
+    ) if len(transactions_df) else transactions_df
+    _save(tmp, "client_codes", codes)
+    _save(tmp, "categories", _pivot(tx, "category", codes, categories))
+    _save(tmp, "categories_kzt", _pivot(tx, "category", codes, categories, values="amount_kzt"))
+    for direction in ("in", "out"):
+        part = transfers_df[transfers_df["direction"] == direction] if len(transfers_df) else transfers_df
+        _save(tmp, f"transfers_{direction}", _pivot(part, "type", codes, types))
+    _save(tmp, "transfer_counts", _pivot(transfers_df, "type", codes, types, aggfunc="count", dtype="int32"))
+
+    # FX-пополнения/снятия депозита в KZT (как deposit.fx_transfer_stats)
+    fx = transfers_df[transfers_df["type"].isin([FX_TOPUP_TYPE, FX_WITHDRAW_TYPE])] if len(transfers_df) else transfers_df
+    if len(fx):
+        rates = fx["currency"].str.upper().map(DEFAULT_FX_RATES_TO_KZT)
+        if rates.isna().any():
+            raise ValueError(f"Нет курса для {sorted(fx.loc[rates.isna(), 'currency'].unique())}")
+        fx = fx.assign(amount_kzt=fx["amount"] * rates)
+    fx_kzt = _pivot(fx, "type", codes, [FX_TOPUP_TYPE, FX_WITHDRAW_TYPE], values="amount_kzt")
+    fx_cnt = _pivot(fx, "type", codes, [FX_TOPUP_TYPE, FX_WITHDRAW_TYPE], aggfunc="count")
+
+    features = FeatureCache(codes, transactions_df, transfers_df)
+    scalars = np.column_stack([
+        clients_df["age"].to_numpy(dtype="float64"),
+        clients_df["avg_monthly_balance_KZT"].to_numpy(dtype="float64"),
+        clients_df["status"].map({s: i for i, s in enumerate(statuses)}).fillna(-1).to_numpy(dtype="float64"),
+        features.observed_months.astype("float64"),
+        fx_cnt[:, 0], fx_kzt[:, 0], fx_cnt[:, 1], fx_kzt[:, 1],
+    ])
+    _save(tmp, "scalars", scalars)
+
+    # метка для check-отчётов: продукт первой транзакции клиента
+    label_col = "product" if "product" in transactions_df.columns else "products"
+    labels = (
+        transactions_df.groupby("client_code")[label_col].first().reindex(codes)
+        if label_col in transactions_df.columns else pd.Series(index=codes, dtype=object)
+    )
+    _save(tmp, "names", _strings(clients_df["name"], NAME_WIDTH))
+    _save(tmp, "cities", _strings(clients_df["city"], CITY_WIDTH))
+    _save(tmp, "labels", _strings(labels.fillna(""), LABEL_WIDTH))
+
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "clients": len(codes),
+            "categories": categories,
+            "transfer_types": types,
+            "scalars": SCALARS,
+            "statuses": statuses,
+            "observed_span": features.observed_span,
+        }, f, ensure_ascii=False, indent=2)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+
+class FeatureStore:
+    """Read-only memory-mapped view of a built store."""
+
+    ARRAYS = ("client_codes", "categories", "categories_kzt", "transfers_in", "transfers_out",
+              "transfer_counts", "scalars", "names", "cities", "labels")
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(self.path / f"{name}.npy", mmap_mode="r"))
+        self.category_names = self.meta["categories"]
+        self.type_names = self.meta["transfer_types"]
+        self._scalar = {name: i for i, name in enumerate(self.meta["scalars"])}
+        # период выгрузки; в сторах без него — самый длинный активный период клиента
+        active = self.scalar("observed_months")
+        self.observed_span = float(self.meta.get("observed_span") or (active.max() if len(active) else 0.0))
+
+    def __len__(self) -> int:
+        return len(self.client_codes)
+
+    def scalar(self, name: str) -> np.ndarray:
+        """Column view over all clients, e.g. store.scalar("avg_monthly_balance_KZT")."""
+        return self.scalars[:, self._scalar[name]]
+
+    def row(self, client_code: int) -> int | None:
+        i = int(np.searchsorted(self.client_codes, client_code))
+        if i < len(self.client_codes) and self.client_codes[i] == client_code:
+            return i
+        return None
+
+    def rows(self, client_codes) -> np.ndarray:
+        """Vectorized lookup; -1 for unknown codes."""
+        codes = np.asarray(client_codes, dtype=np.int64)
+        idx = np.searchsorted(self.client_codes, codes).clip(max=max(len(self.client_codes) - 1, 0))
+        found = len(self.client_codes) > 0 and self.client_codes[idx] == codes
+        return np.where(found, idx, -1)
+
+    def client(self, client_code: int) -> ClientAggregates | None:
+        i = self.row(client_code)
+        if i is None:
+            return None
+
+        def nonzero(values, names):
+            return {names[j]: float(values[j]) for j in np.flatnonzero(values)}
+
+        s = self.scalars[i]
+        status_code = int(s[self._scalar["status"]])
+        transfers = {
+            "in": nonzero(self.transfers_in[i], self.type_names),
+            "out": nonzero(self.transfers_out[i], self.type_names),
+        }
+        return ClientAggregates(
+            client_code=int(self.client_codes[i]),
+            name=str(self.names[i]),
+            status=self.meta["statuses"][status_code] if status_code >= 0 else "",
+            age=int(s[self._scalar["age"]]),
+            city=str(self.cities[i]),
+            avg_monthly_balance_KZT=float(s[self._scalar["avg_monthly_balance_KZT"]]),
+            totals_by_category=nonzero(self.categories[i], self.category_names),
+            totals_by_category_kzt=nonzero(self.categories_kzt[i], self.category_names),
+            transfer_sums_by_direction_type={k: v for k, v in transfers.items() if v},
+            transfer_counts={k: int(v) for k, v in nonzero(self.transfer_counts[i], self.type_names).items()},
+            fx_stats=[
+                int(s[self._scalar["fx_topup_count"]]),
+                float(s[self._scalar["fx_topup_kzt"]]),
+                int(s[self._scalar["fx_withdraw_count"]]),
+                float(s[self._scalar["fx_withdraw_kzt"]]),
+            ],
+            observed_months=self.observed_span or None,
+        )
+
+    def label(self, client_code: int) -> str | None:
+        i = self.row(client_code)
+        return str(self.labels[i]) if i is not None else None
+
+
+class StoreIndex(Mapping):
+    """
+    {client_code: ClientAggregates} over a FeatureStore for serve.ScoringService.
+    Rows are materialized on first access and kept (they may receive live events).
+    """
+
+    def __init__(self, store: FeatureStore):
+        self.store = store
+        self._materialized: dict[int, ClientAggregates] = {}
+
+    def __getitem__(self, code: int) -> ClientAggregates:
+        agg = self._materialized.get(code)
+        if agg is None:
+            agg = self.store.client(code)
+            if agg is None:
+                raise KeyError(code)
+            self._materialized[code] = agg
+        return agg
+
+    def __iter__(self):
+        return (int(code) for code in self.store.client_codes)
+
+    def __len__(self) -> int:
+        return len(self.store)
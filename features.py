@@ -0,0 +1,236 @@
+"""
+Time-windowed feature stage: per-client monthly buckets, observed span,
+trends and spikes for spending categories and transfer types.
+
+One vectorized pass per table: dates are mapped to month numbers and amounts
+are scattered into a dense clients x months x keys cube with np.add.at, so
+everything below is array math. Per-client results are cached in FeatureCache,
+scoring reads them instead of rescanning raw rows.
+"""
+import csv
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from registry import ClientRegistry
+
+# Всплеск: месяц, в котором сумма больше SPIKE_FACTOR медиан по наблюдаемым месяцам
+SPIKE_FACTOR = 2.5
+SPIKE_MIN_AMOUNT = 10_000.0
+SPIKE_MIN_MONTHS = 3
+DAYS_PER_MONTH = 30.44
+
+
+@dataclass
+class ClientFeatures:
+    client_code: int
+    observed_months: int                                    # активные месяцы клиента (признак, не период выгрузки)
+    first_month: str | None = None
+    last_month: str | None = None
+    monthly_spend: dict = field(default_factory=dict)       # "2025-06" -> сумма трат
+    category_trends: dict = field(default_factory=dict)     # категория -> относительный наклон в месяц
+    transfer_trends: dict = field(default_factory=dict)     # тип перевода -> относительный наклон в месяц
+    category_spikes: list = field(default_factory=list)
+    transfer_spikes: list = field(default_factory=list)
+
+
+def span_months(first, last) -> float:
+    """Период выгрузки в месяцах по DAYS_PER_MONTH: от первой до последней даты, оба дня включительно."""
+    return ((last.normalize() - first.normalize()).days + 1) / DAYS_PER_MONTH
+
+
+class DateRange:
+    """
+    Первая и последняя дата выгрузки без загрузки таблиц: текст дат копится и разбирается
+    пачками тем же pd.to_datetime(errors="coerce"), что и в FeatureCache. Нужен прогонам,
+    которые видят только часть клиентов (партиции, выборка), чтобы период был как у полного прогона.
+    """
+
+    def __init__(self, batch: int = 100_000):
+        self.batch = batch
+        self.pending: list[str] = []
+        self.first = self.last = None
+
+    def add(self, text: str):
+        self.pending.append(text)
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def add_files(self, files: list):
+        """Колонка date всех файлов (csv-модулем, без pandas)."""
+        for path in files:
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                if "date" not in header:
+                    continue
+                column = header.index("date")
+                for record in reader:
+                    if column < len(record):
+                        self.add(record[column])
+
+    def flush(self):
+        if not self.pending:
+            return
+        parsed = pd.to_datetime(pd.Series(self.pending), errors="coerce").dropna()
+        self.pending.clear()
+        if len(parsed):
+            first, last = parsed.min(), parsed.max()
+            self.first = first if self.first is None else min(self.first, first)
+            self.last = last if self.last is None else max(self.last, last)
+
+    @property
+    def span(self) -> float:
+        """Период в месяцах (span_months); 0.0 — ни одной распознанной даты."""
+        self.flush()
+        return span_months(self.first, self.last) if self.first is not None else 0.0
+
+
+def month_numbers(dates: pd.Series) -> np.ndarray:
+    """Даты -> год * 12 + месяц - 1; нераспознанные -> -1."""
+    return _months_of(pd.to_datetime(dates, errors="coerce"))
+
+
+def _months_of(parsed: pd.Series) -> np.ndarray:
+    months = (parsed.dt.year * 12 + parsed.dt.month - 1).to_numpy(dtype="float64")
+    return np.where(np.isnan(months), -1, months).astype(np.int64)
+
+
+def _label(month: int) -> str:
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _cube(rows: np.ndarray, months: np.ndarray, keys: np.ndarray, amounts: np.ndarray,
+          n_clients: int, n_months: int, n_keys: int) -> np.ndarray:
+    cube = np.zeros((n_clients, n_months, n_keys))
+    np.add.at(cube, (rows, months, keys), amounts)
+    return cube
+
+
+def _trends(cube: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    """
+    МНК-наклон помесячных сумм по наблюдаемым месяцам клиента, делённый на среднюю сумму.
+    cube: clients x months x keys, observed: clients x months (bool).
+    """
+    t = np.arange(cube.shape[1], dtype="float64")[None, :]
+    n = observed.sum(axis=1, keepdims=True).clip(min=1)
+    t_mean = (t * observed).sum(axis=1, keepdims=True) / n
+    dt = (t - t_mean) * observed                                   # clients x months
+    y_mean = (cube * observed[:, :, None]).sum(axis=1) / n         # clients x keys
+    cov = (dt[:, :, None] * (cube - y_mean[:, None, :])).sum(axis=1)
+    var = (dt ** 2).sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(var > 0, cov / var, 0.0)
+        return np.where(y_mean > 0, slope / y_mean, 0.0)
+
+
+def _spikes(cube: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    if cube.shape[1] == 0:
+        return np.zeros(cube.shape[::2], dtype=bool)
+    masked = np.where(observed[:, :, None], cube, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # клиенты без операций: All-NaN
+        median = np.nanmedian(masked, axis=1)
+        peak = np.nanmax(masked, axis=1)
+    enough = observed.sum(axis=1)[:, None] >= SPIKE_MIN_MONTHS
+    median = np.nan_to_num(median)
+    # разовые траты (медиана 0) — не всплеск, а отсутствие базы для сравнения
+    return enough & (median > 0) & (peak >= SPIKE_MIN_AMOUNT) & (peak > SPIKE_FACTOR * median)
+
+
+class FeatureCache:
+    """Массивы признаков по всем клиентам + ленивый кэш ClientFeatures по client_code."""
+
+    def __init__(self, clients, transactions_df: pd.DataFrame, transfers_df: pd.DataFrame):
+        """clients: ClientRegistry (строки массивов = строки реестра) или итерируемое client_code."""
+        self.registry = clients if isinstance(clients, ClientRegistry) else ClientRegistry(clients)
+        self.client_codes = self.registry.codes
+        self._cache: dict[int, ClientFeatures] = {}
+
+        tx_rows, tx_dates = self._locate(self.registry, transactions_df)
+        tr_rows, tr_dates = self._locate(self.registry, transfers_df)
+        tx_months, tr_months = _months_of(tx_dates), _months_of(tr_dates)
+        valid_tx = (tx_rows >= 0) & (tx_months >= 0)
+        valid_tr = (tr_rows >= 0) & (tr_months >= 0)
+
+        # период выгрузки — один на всех клиентов (от первой до последней даты, в месяцах по 30.44 дня):
+        # на него делятся траты и умножаются ставки депозитов. Активные месяцы клиента — только признак.
+        dates = pd.concat([tx_dates[valid_tx], tr_dates[valid_tr]])
+        self.observed_span = span_months(dates.min(), dates.max()) if len(dates) else 0.0
+
+        all_months = np.concatenate([tx_months[valid_tx], tr_months[valid_tr]])
+        self.month0 = int(all_months.min()) if all_months.size else 0
+        n_months = int(all_months.max()) - self.month0 + 1 if all_months.size else 0
+        n_clients = len(self.client_codes)
+
+        # активные месяцы клиента: от первого до последнего месяца с любой операцией
+        first = np.full(n_clients, np.iinfo(np.int64).max)
+        last = np.full(n_clients, -1)
+        for rows, months, valid in ((tx_rows, tx_months, valid_tx), (tr_rows, tr_months, valid_tr)):
+            np.minimum.at(first, rows[valid], months[valid] - self.month0)
+            np.maximum.at(last, rows[valid], months[valid] - self.month0)
+        has_data = last >= 0
+        self.first = np.where(has_data, first, -1)
+        self.last = last
+        self.observed_months = np.where(has_data, last - first + 1, 0)
+        t = np.arange(n_months)[None, :]
+        observed = has_data[:, None] & (t >= self.first[:, None]) & (t <= self.last[:, None])
+
+        cat_codes, self.categories = pd.factorize(transactions_df["category"]) if len(transactions_df) else (np.array([], dtype=int), pd.Index([]))
+        type_codes, self.transfer_types = pd.factorize(transfers_df["type"]) if len(transfers_df) else (np.array([], dtype=int), pd.Index([]))
+        valid_tx &= cat_codes >= 0
+        valid_tr &= type_codes >= 0
+
+        self.category_cube = _cube(
+            tx_rows[valid_tx], tx_months[valid_tx] - self.month0, cat_codes[valid_tx],
+            transactions_df["amount"].to_numpy(dtype="float64")[valid_tx],
+            n_clients, n_months, len(self.categories),
+        )
+        self.transfer_cube = _cube(
+            tr_rows[valid_tr], tr_months[valid_tr] - self.month0, type_codes[valid_tr],
+            transfers_df["amount"].to_numpy(dtype="float64")[valid_tr],
+            n_clients, n_months, len(self.transfer_types),
+        )
+        self.category_trends = _trends(self.category_cube, observed)
+        self.transfer_trends = _trends(self.transfer_cube, observed)
+        self.category_spikes = _spikes(self.category_cube, observed)
+        self.transfer_spikes = _spikes(self.transfer_cube, observed)
+
+    @staticmethod
+    def _locate(registry: ClientRegistry, df: pd.DataFrame) -> tuple[np.ndarray, pd.Series]:
+        if df.empty:
+            return np.array([], dtype=np.int64), pd.Series([], dtype="datetime64[ns]")
+        return registry.rows(df["client_code"]), pd.to_datetime(df["date"], errors="coerce").reset_index(drop=True)
+
+    def observed_months_of(self, client_code: int) -> int:
+        row = self.registry.row(client_code)
+        return int(self.observed_months[row]) if row is not None else 0
+
+    def get(self, client_code: int) -> ClientFeatures | None:
+        code = int(client_code)
+        cached = self._cache.get(code)
+        if cached is not None:
+            return cached
+        row = self.registry.row(code)
+        if row is None:
+            return None
+
+        features = ClientFeatures(client_code=code, observed_months=int(self.observed_months[row]))
+        if self.observed_months[row] > 0:
+            first, last = int(self.first[row]), int(self.last[row])
+            features.first_month = _label(self.month0 + first)
+            features.last_month = _label(self.month0 + last)
+            spend = self.category_cube[row].sum(axis=1)
+            features.monthly_spend = {_label(self.month0 + m): float(spend[m]) for m in range(first, last + 1)}
+            features.category_trends = {
+                c: round(float(v), 4) for c, v in zip(self.categories, self.category_trends[row]) if v
+            }
+            features.transfer_trends = {
+                t: round(float(v), 4) for t, v in zip(self.transfer_types, self.transfer_trends[row]) if v
+            }
+            features.category_spikes = [c for c, s in zip(self.categories, self.category_spikes[row]) if s]
+            features.transfer_spikes = [t for t, s in zip(self.transfer_types, self.transfer_spikes[row]) if s]
+        self._cache[code] = features
+        return features
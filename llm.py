@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Таймаут одного запроса, сек
+CALL_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+# Хедж: дубль запроса отправляется через p95 задержки (не раньше, чем накопится статистика)
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "1") != "0"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+_client = None
+_client_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_POOL_SIZE", "32")), thread_name_prefix="llm")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Глобальный дедлайн прогона истёк или ответ не пришёл за отведённое время."""
+
+
+class RunDeadline:
+    """Дедлайн на весь прогон; после него LLM не вызывается, используются детерминированные тексты."""
+
+    def __init__(self):
+        self._deadline = None
+
+    def start(self, seconds: float | None):
+        self._deadline = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float | None:
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов для оценки p95."""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+RUN_DEADLINE = RunDeadline()
+LATENCY = LatencyTracker()
+
+
+def get_client():
+    """
+    Shared OpenAI client for the whole process.
+    LLM_BASE_URL points the pipeline at any OpenAI-compatible server
+    (e.g. the local mock_server.py), LLM_MAX_RETRIES tunes client retries.
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+
+            base_url = os.getenv("LLM_BASE_URL") or None
+            api_key = os.getenv("OPENAI_API_KEY")
+            if base_url and not api_key:
+                # local stand-in does not check keys, but the SDK requires one
+                api_key = "local"
+
+            _client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            )
+    return _client
+
+
+def _call(messages: list[dict], temperature: float, model: str, timeout: float) -> str:
+    started = time.monotonic()
+    response = get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        timeout=timeout,
+    )
+    LATENCY.record(time.monotonic() - started)
+    return response.choices[0].message.content
+
+
+def _call_timeout() -> float:
+    remaining = RUN_DEADLINE.remaining()
+    if remaining is None:
+        return CALL_TIMEOUT
+    if remaining <= 0:
+        raise DeadlineExceeded("run deadline passed")
+    return min(CALL_TIMEOUT, remaining)
+
+
+def chat_completion(messages: list[dict], temperature: float, model: str = DEFAULT_MODEL) -> str:
+    """
+    Один ответ модели с таймаутом и хеджированием:
+    если первый запрос не ответил за p95, отправляется дубль, побеждает первый ответ.
+    Проигравший отменяется, если ещё не стартовал, иначе его результат отбрасывается
+    (он в любом случае ограничен таймаутом запроса).
+    """
+    timeout = _call_timeout()
+    hedge_delay = LATENCY.quantile(0.95) if HEDGE_ENABLED else None
+
+    primary = _executor.submit(_call, messages, temperature, model, timeout)
+    if hedge_delay is None:
+        done, _ = wait([primary], timeout=timeout)
+        if not done:
+            primary.cancel()
+            raise DeadlineExceeded(f"no LLM answer in {timeout:.1f}s")
+        return primary.result()
+
+    pending = {primary}
+    done, _ = wait(pending, timeout=max(HEDGE_MIN_DELAY, hedge_delay))
+    if not done and not RUN_DEADLINE.expired():
+        pending.add(_executor.submit(_call, messages, temperature, model, _call_timeout()))
+
+    end = time.monotonic() + timeout
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+            error = future.exception()
+
+    for loser in pending:
+        loser.cancel()
+    if error is not None:
+        raise error
+    raise DeadlineExceeded(f"no LLM answer in {timeout:.1f}s")
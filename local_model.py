@@ -0,0 +1,232 @@
+"""
+Local product classifier for the "ai" branch of decide_product.
+
+Clients that no rule picks get one of the four catalog products of the
+recommendation prompt from the LLM, one request each. LocalModel is a
+multinomial logistic regression (numpy only) learned from those LLM answers:
+decision records of a JSON-lines log (logs.py, source "llm") joined by
+client_code with the balance, transfer and spending features of a feature
+store. A run with --model scores every client in one matrix product and asks
+the LLM only when the top class probability is below the threshold.
+
+    python main.py train-model --store feature_store --log run.jsonl -o model.npz
+    python main.py run -i "case 1" --model model.npz --model-threshold 0.7
+
+The .npz keeps the weights, the standardization and the feature / class names;
+predictions are deterministic.
+"""
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from scoring import FeatureMatrices
+from validation import CATEGORIES, TRANSFER_TYPES
+
+MODEL_THRESHOLD = 0.7
+HOLDOUT = 0.2
+L2_SAMPLES = 10.0
+MIN_SAMPLES = 50                # меньше ответов LLM — модель не обучается
+MIN_CLASSES = 2                 # с одним классом модель «уверена» во всех клиентах и LLM не вызывается вовсе
+REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+BASE_FEATURES = [
+    "log_balance", "age", "log_transfers_in", "log_transfers_out", "net_outflow", "log_spend_kzt",
+    "observed_months", "fx_topup_count", "log_fx_topup_kzt", "fx_withdraw_count", "log_fx_withdraw_kzt",
+]
+TYPE_NAMES = [t for t, _ in TRANSFER_TYPES]
+
+
+def _log(values) -> np.ndarray:
+    return np.log1p(np.maximum(np.asarray(values, dtype="float64"), 0.0))
+
+
+def model_features(m: FeatureMatrices, statuses: list[str]) -> np.ndarray:
+    """clients x features: профиль и баланс, переводы по типам, траты по категориям (log1p), статус one-hot."""
+    balance = np.asarray(m.profile["avg_monthly_balance_KZT"], dtype="float64")
+    tin, tout = m.transfers_in, m.transfers_out
+    base = np.column_stack([
+        _log(balance),
+        np.asarray(m.profile["age"], dtype="float64"),
+        _log(tin),
+        _log(tout),
+        # правило fallback «отток больше притока и баланса» в линейном виде, от -1 до 1
+        (tout - tin - balance) / (tout + tin + np.abs(balance) + 1.0),
+        _log(m.categories_kzt.sum(axis=1)),
+        m.active_months,
+        m.fx[:, 0], _log(m.fx[:, 1]), m.fx[:, 2], _log(m.fx[:, 3]),
+    ])
+    status = np.asarray(m.profile["status"], dtype=object)
+    return np.hstack([
+        base,
+        _log(m._columns_of(m.type_names, m.transfer_sums, TYPE_NAMES)),
+        _log(m._columns_of(m.category_names, m.categories_kzt, CATEGORIES)),
+        np.column_stack([status == s for s in statuses]).astype("float64") if statuses else np.zeros((len(m), 0)),
+    ])
+
+
+def feature_names(statuses: list[str]) -> list[str]:
+    return (BASE_FEATURES + [f"log_transfer:{t}" for t in TYPE_NAMES]
+            + [f"log_spend:{c}" for c in CATEGORIES] + [f"status:{s}" for s in statuses])
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+@dataclass
+class LocalModel:
+    classes: np.ndarray             # продукты, порядок столбцов weights
+    statuses: list
+    mean: np.ndarray
+    scale: np.ndarray
+    weights: np.ndarray             # features x classes
+    bias: np.ndarray                # classes
+
+    @classmethod
+    def fit(cls, m: FeatureMatrices, labels: np.ndarray, l2: float | None = None, epochs: int = 400,
+            learning_rate: float = 0.05) -> "LocalModel":
+        """
+        Полный батч, Adam по кросс-энтропии с L2; детерминированно (старт с нулей).
+        l2=None — L2_SAMPLES / n: чем меньше ответов LLM, тем сильнее регуляризация
+        (на малом логе модель иначе уверенно запоминает шум).
+        ValueError — меньше MIN_SAMPLES примеров или MIN_CLASSES классов.
+        """
+        _check_training_set(labels)
+        statuses = sorted({s for s in np.asarray(m.profile["status"], dtype=object) if s})
+        x = model_features(m, statuses)
+        mean, scale = x.mean(axis=0), x.std(axis=0)
+        scale[scale == 0] = 1.0
+        x = (x - mean) / scale
+        classes, y = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        target = np.eye(len(classes))[y]
+        l2 = L2_SAMPLES / len(x) if l2 is None else l2
+
+        params = [np.zeros((x.shape[1], len(classes))), np.zeros(len(classes))]
+        moments = [[np.zeros_like(p), np.zeros_like(p)] for p in params]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for step in range(1, epochs + 1):
+            error = (_softmax(x @ params[0] + params[1]) - target) / len(x)
+            grads = [x.T @ error + l2 * params[0], error.sum(axis=0)]
+            for p, g, (m1, m2) in zip(params, grads, moments):
+                m1 += (1 - beta1) * (g - m1)
+                m2 += (1 - beta2) * (g * g - m2)
+                p -= learning_rate * (m1 / (1 - beta1 ** step)) / (np.sqrt(m2 / (1 - beta2 ** step)) + eps)
+        return cls(classes=classes.astype(object), statuses=statuses, mean=mean, scale=scale,
+                   weights=params[0], bias=params[1])
+
+    def predict_proba(self, m: FeatureMatrices) -> np.ndarray:
+        x = (model_features(m, self.statuses) - self.mean) / self.scale
+        return _softmax(x @ self.weights + self.bias)
+
+    def predict(self, m: FeatureMatrices) -> tuple[np.ndarray, np.ndarray]:
+        """(продукт, вероятность) для всех клиентов."""
+        proba = self.predict_proba(m)
+        best = proba.argmax(axis=1)
+        return self.classes[best], proba[np.arange(len(best)), best]
+
+    def confident(self, clients, threshold: float = MODEL_THRESHOLD) -> dict:
+        """{client_code: (product, score)} для клиентов с вероятностью >= threshold; score — по шкале accuracy LLM (0-10)."""
+        clients = list(clients)
+        if not clients:
+            return {}
+        m = FeatureMatrices.from_clients(clients)
+        products, proba = self.predict(m)
+        keep = proba >= threshold
+        return {int(code): (product, round(float(p) * 10, 2))
+                for code, product, p in zip(m.client_codes[keep], products[keep], proba[keep])}
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, classes=self.classes.astype(str), statuses=np.array(self.statuses, dtype=str),
+                 mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias,
+                 features=np.array(feature_names(self.statuses), dtype=str))
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "LocalModel":
+        with np.load(path, allow_pickle=False) as data:
+            model = cls(classes=data["classes"].astype(object), statuses=data["statuses"].tolist(),
+                        mean=data["mean"], scale=data["scale"], weights=data["weights"], bias=data["bias"])
+        if len(model.classes) < MIN_CLASSES:
+            raise ValueError(f"Model {path} knows {len(model.classes)} product(s), at least {MIN_CLASSES} "
+                             "are needed: it would skip the LLM for every client")
+        return model
+
+
+def _check_training_set(labels) -> None:
+    labels = np.asarray(labels, dtype=str)
+    classes = len(np.unique(labels))
+    if len(labels) < MIN_SAMPLES or classes < MIN_CLASSES:
+        raise ValueError(f"Not enough LLM decisions to train: {len(labels)} with {classes} product(s), "
+                         f"need at least {MIN_SAMPLES} with {MIN_CLASSES} products")
+
+
+def read_decision_log(paths, min_accuracy: float = 0.0) -> dict[int, str]:
+    """
+    {client_code: продукт} из записей decision ветки "ai", которые вернула LLM (source "llm");
+    при нескольких записях клиента берётся последняя.
+    """
+    labels = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue            # обрезанная строка в конце лога
+                if (record.get("event") == "decision" and record.get("branch") == "ai"
+                        and record.get("source") == "llm" and record.get("product")
+                        and float(record.get("score") or 0) >= min_accuracy):
+                    labels[int(record["client_code"])] = record["product"]
+    return labels
+
+
+def _holdout_mask(codes: np.ndarray, share: float) -> np.ndarray:
+    """Детерминированный holdout по client_code (тот же хеш, что у logs.sampled)."""
+    return (codes.astype("uint64") * np.uint64(2654435761)) % np.uint64(2**32) < share * 2**32
+
+
+def evaluate(model: LocalModel, m: FeatureMatrices, labels: np.ndarray,
+             thresholds=REPORT_THRESHOLDS) -> list[dict]:
+    """Покрытие (доля клиентов без LLM) и точность на них для каждого порога."""
+    products, proba = model.predict(m)
+    correct = products == labels
+    rows = []
+    for threshold in thresholds:
+        covered = proba >= threshold
+        rows.append({
+            "threshold": threshold,
+            "coverage": float(covered.mean()) if len(covered) else 0.0,
+            "accuracy": float(correct[covered].mean()) if covered.any() else None,
+        })
+    return rows
+
+
+def train_from_logs(store, log_paths, output, holdout: float = HOLDOUT, min_accuracy: float = 0.0) -> LocalModel:
+    labels = read_decision_log(log_paths, min_accuracy)
+    m = FeatureMatrices.from_store(store)
+    rows = store.rows(list(labels))
+    found = rows >= 0
+    if not found.any():
+        raise ValueError("No LLM decisions of the log match clients of the feature store")
+    rows = rows[found]
+    y = np.array(list(labels.values()), dtype=object)[found]
+    m = m.subset(rows)
+    test = _holdout_mask(m.client_codes, holdout) if len(y) >= 10 else np.zeros(len(y), dtype=bool)
+
+    model = LocalModel.fit(m.subset(~test), y[~test])
+    print(f"Trained on {int((~test).sum())} LLM decisions ({', '.join(model.classes)}), "
+          f"{int(found.size - found.sum())} log clients not in the store")
+    if test.any():
+        print(f"Holdout: {int(test.sum())} clients")
+        for row in evaluate(model, m.subset(test), y[test]):
+            accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.3f}"
+            print(f"  threshold {row['threshold']:.2f}: without LLM {row['coverage']:.1%}, accuracy {accuracy}")
+    print(f"Model saved to {model.save(output)}")
+    return model
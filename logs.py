@@ -0,0 +1,149 @@
+"""
+Structured JSON-lines logging for the per-client hot loop.
+
+Records go through a logging.handlers.QueueHandler to a QueueListener thread
+that writes one JSON object per line into a buffered stream, so the scoring
+threads never wait on stdout or a log collector. Per-client decision records
+are sampled deterministically by client_code, so the same clients show up
+in every run.
+
+    LOG_LEVEL=INFO               DEBUG adds a per-client "client" record
+    LOG_FILE=run.jsonl           default: stderr
+    LOG_DECISION_SAMPLE=0.01     share of clients whose decisions are logged (default 1)
+
+    {"ts": "...", "level": "INFO", "logger": "decisions", "event": "decision",
+     "client_code": 17, "branch": "deposit", "product": "Депозит Накопительный", "score": 0.95}
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = "decentraton"
+FLUSH_INTERVAL = 1.0          # секунд; буфер сбрасывается не чаще, чем раз в интервал
+BUFFER_SIZE = 1 << 16
+
+_listener: logging.handlers.QueueListener | None = None
+_sample_rate = 1.0
+
+
+def _jsonable(value):
+    """numpy-скаляры -> числа, остальное — строкой."""
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name.removeprefix(ROOT + "."),
+            "event": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=_jsonable)
+
+
+class BufferedJsonLinesHandler(logging.Handler):
+    """Пишет строки в буферизованный поток; flush — по интервалу и при остановке, а не на каждую запись."""
+
+    def __init__(self, stream, flush_interval: float = FLUSH_INTERVAL):
+        super().__init__()
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self._flushed = time.monotonic()
+        self.setFormatter(JsonFormatter())
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.stream.write(self.format(record) + "\n")
+            now = time.monotonic()
+            if now - self._flushed >= self.flush_interval:
+                self.stream.flush()
+                self._flushed = now
+        except Exception:  # noqa: BLE001 — как logging.StreamHandler: сбой лога не роняет прогон
+            self.handleError(record)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.stream not in (sys.stdout, sys.stderr) and not self.stream.closed:
+            self.stream.close()
+        super().close()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # стандартный prepare склеивает исключение с сообщением; запись остаётся в процессе — отдаём как есть
+        return record
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def setup_logging(level: str | None = None, path: str | None = None, sample: float | None = None):
+    """Один раз на процесс (main.main); повторный вызов перенастраивает sink."""
+    global _listener, _sample_rate
+    shutdown_logging()
+
+    level = (level or os.getenv("LOG_LEVEL") or "INFO").upper()
+    path = path or os.getenv("LOG_FILE")
+    _sample_rate = float(sample if sample is not None else os.getenv("LOG_DECISION_SAMPLE", "1"))
+
+    stream = open(path, "a", encoding="utf-8", buffering=BUFFER_SIZE) if path else sys.stderr
+    sink = BufferedJsonLinesHandler(stream)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, sink)
+    _listener.start()
+
+    root = logging.getLogger(ROOT)
+    root.handlers[:] = [_QueueHandler(records)]
+    root.setLevel(level)
+    root.propagate = False
+
+
+atexit.register(lambda: shutdown_logging())
+
+
+def shutdown_logging():
+    """Дописывает очередь и сбрасывает буфер."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def log(logger: logging.Logger, level: int, event: str, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def sampled(client_code) -> bool:
+    """Детерминированная выборка клиентов: один и тот же client_code всегда в ней или всегда нет."""
+    if _sample_rate >= 1.0:
+        return True
+    if _sample_rate <= 0.0:
+        return False
+    return (int(client_code) * 2654435761) % 2**32 < _sample_rate * 2**32
+
+
+_decisions = get_logger("decisions")
+
+
+def log_decision(client_code, product, branch: str, score, **fields):
+    """Какая ветка (transfers / deposit / transactions / ai) выбрала продукт и с каким score."""
+    if _decisions.isEnabledFor(logging.INFO) and sampled(client_code):
+        _decisions.info("decision", extra={"fields": {
+            "client_code": client_code, "branch": branch, "product": product, "score": score, **fields}})
@@ -1,13 +1,36 @@
+from __future__ import annotations
+
 import argparse
+import csv
+import os
+import sys
 from pathlib import Path
-import pandas as pd
-from client import handle_clients_logic
-from dotenv import load_dotenv
-load_dotenv()
+from typing import TYPE_CHECKING
+
+# Тяжёлые модули (pandas, dotenv, client со всеми скорингами) импортируются
+# только внутри стадий, чтобы --help и лёгкие команды стартовали мгновенно.
+if TYPE_CHECKING:
+    import pandas as pd
+
+REQUIRED_COLUMNS = {
+    "clients": {"client_code", "name", "status", "age", "city", "avg_monthly_balance_KZT"},
+    "transactions": {"client_code", "date", "category", "amount", "currency"},
+    "transfers": {"client_code", "date", "type", "direction", "amount", "currency"},
+}
+
+
+def find_input_files(base_path: Path) -> dict[str, list[Path]]:
+    if not base_path.exists():
+        raise FileNotFoundError(f"Folder not found: {base_path}")
+
+    all_csv = sorted(base_path.glob("**/*.csv"))
+    return {kind: [p for p in all_csv if kind in p.name] for kind in REQUIRED_COLUMNS}
 
 
 def read_many_csv(files: list[Path]) -> pd.DataFrame:
     """Concat many CSVs safely; return empty DF if none."""
+    import pandas as pd
+
     frames = []
     for f in files:
         df = pd.read_csv(f)
@@ -17,29 +40,569 @@ def read_many_csv(files: list[Path]) -> pd.DataFrame:
     return pd.concat(frames, ignore_index=True)
 
 def load_data(base_path: Path):
-    if not base_path.exists():
-        raise FileNotFoundError(f"Folder not found: {base_path}")
+    files = find_input_files(base_path)
 
-    client_files      = sorted([p for p in base_path.glob("**/*.csv") if "clients" in p.name])
-    transaction_files = sorted([p for p in base_path.glob("**/*.csv") if "transactions" in p.name])
-    transfer_files    = sorted([p for p in base_path.glob("**/*.csv") if "transfers"    in p.name])
-
-    clients_df      = read_many_csv(client_files)
-    transactions_df = read_many_csv(transaction_files)
-    transfers_df    = read_many_csv(transfer_files)
+    clients_df      = read_many_csv(files["clients"])
+    transactions_df = read_many_csv(files["transactions"])
+    transfers_df    = read_many_csv(files["transfers"])
 
     return clients_df, transactions_df, transfers_df
 
 
+def quarantine_path(output: Path) -> Path:
+    """result.csv -> result.quarantine.csv"""
+    return Path(output).with_suffix(".quarantine.csv")
+
+
+def load_valid_data(base_path: Path, quarantine: Path | None = None):
+    """
+    load_data + построчная проверка (validation.py): плохие строки уходят в quarantine
+    (CSV с причинами), прогон получает только годные.
+    """
+    return validate_loaded(load_data(base_path), quarantine)
+
+
+def validate_loaded(frames, quarantine: Path | None = None):
+    """Построчная проверка уже прочитанных (clients, transactions, transfers), см. load_valid_data."""
+    from validation import print_summary, validate_frames, write_quarantine
+
+    result = validate_frames(*frames)
+    if quarantine is not None:
+        if not result.quarantine.empty:
+            write_quarantine(result.quarantine, quarantine)
+        elif quarantine.exists():
+            quarantine.unlink()  # карантин от прошлого прогона этих данных уже не актуален
+    print_summary(result, quarantine)
+    return result.clients, result.transactions, result.transfers
+
+
+def validate_input(base_path: Path) -> list[str]:
+    """Быстрая проверка структуры папки и заголовков CSV без pandas. Возвращает список проблем."""
+    if not base_path.is_dir():
+        return [f"Folder not found: {base_path}"]
+
+    problems = []
+    files = find_input_files(base_path)
+    for kind, required in REQUIRED_COLUMNS.items():
+        if not files[kind]:
+            problems.append(f"no *{kind}*.csv files in {base_path}")
+            continue
+        for f in files[kind]:
+            with open(f, newline="", encoding="utf-8") as fh:
+                header = set(next(csv.reader(fh), []))
+            missing = required - header
+            if missing:
+                problems.append(f"{f}: missing columns {sorted(missing)}")
+    return problems
+
+
+def cmd_validate(args) -> int:
+    problems = validate_input(args.input)
+    if args.input.is_dir():
+        files = find_input_files(args.input)
+        print(", ".join(f"{kind}: {len(paths)} file(s)" for kind, paths in files.items()))
+    if not problems and args.rows:
+        from validation import validate_frames
+
+        summary = validate_frames(*load_data(args.input)).summary()
+        problems = [f"{table}: {reason} ({n} rows)" for table, reasons in summary.items()
+                    for reason, n in reasons.items()]
+    if not problems and args.rules:
+        from rules import RULES
+
+        _, transactions_df, transfers_df = load_data(args.input)
+        problems = [f"rules: {p}" for p in RULES.validate(transactions_df["category"].unique(),
+                                                           transfers_df["type"].unique())]
+    for problem in problems:
+        print(f"- {problem}")
+    if problems:
+        return 1
+    print("✅ Input looks valid")
+    return 0
+
+
+def cmd_run(args) -> int:
+    problems = validate_input(args.input)
+    if problems:
+        for problem in problems:
+            print(f"- {problem}", file=sys.stderr)
+        return 1
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    deadline = args.deadline if args.deadline is not None else _env_deadline()
+    if args.partitions is not None and args.sample is not None:
+        print("--sample and --partitions cannot be combined", file=sys.stderr)
+        return 2
+    if args.model is not None:
+        from local_model import LocalModel
+
+        try:
+            LocalModel.load(args.model)     # до загрузки данных: модель с одним классом обошла бы LLM у всех
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    if args.partitions is not None:
+        from partition import run_partitioned
+
+        run_partitioned(
+            args.input, args.output,
+            partitions=args.partitions or None,
+            spill_dir=args.spill_dir,
+            keep_spill=args.keep_spill,
+            deadline_seconds=deadline,
+            with_push=args.stage == "all",
+            dry_run=args.dry_run,
+            workers=args.workers,
+            backend=args.backend,
+            rank_k=args.rank,
+            write_batch=args.write_batch,
+            partition_by_product=args.partition_by_product,
+            model=args.model,
+            model_threshold=args.model_threshold,
+            **_budgets(args),
+        )
+        return 0
+
+    from client import handle_clients_logic
+
+    quarantine = None if args.dry_run else quarantine_path(args.output)
+    span = None     # None — период по датам прочитанных строк (вся выгрузка)
+    if args.sample is not None:
+        import sampling
+
+        sample = sampling.select_sample(args.input, args.sample, seed=args.sample_seed, strata=args.sample_strata)
+        frames = sampling.read_sample(args.input, sample)
+        clients_df, transactions_df, transfers_df = validate_loaded(frames, quarantine)
+        span = sample.observed_span or None  # период всей выгрузки, а не выбранных клиентов
+    else:
+        clients_df, transactions_df, transfers_df = load_valid_data(args.input, quarantine)
+
+    result = handle_clients_logic(
+        clients_df, transactions_df, transfers_df,
+        deadline_seconds=deadline,
+        output=str(args.output),
+        with_push=args.stage == "all",
+        dry_run=args.dry_run,
+        workers=args.workers,
+        backend=args.backend,
+        rank_k=args.rank,
+        write_batch=args.write_batch,
+        partition_by_product=args.partition_by_product,
+        model=args.model,
+        model_threshold=args.model_threshold,
+        observed_span=span,
+        **_budgets(args),
+    )
+    if args.sample is not None:
+        report = sampling.estimate(sample, result, sampling.first_labels(frames[1]))
+        sampling.print_estimate(report)
+        if not args.dry_run:
+            sampling.write_estimate(report, sampling.sample_report_path(args.output))
+    return 0
+
+
+def cmd_batch(args) -> int:
+    from dotenv import load_dotenv
+    from batch import run_batch
+
+    load_dotenv()
+    summary = run_batch(
+        args.inputs,
+        output_dir=args.output_dir,
+        parallel=args.parallel,
+        result_format=args.format,
+        deadline_seconds=args.deadline if args.deadline is not None else _env_deadline(),
+        with_push=args.stage == "all",
+        dry_run=args.dry_run,
+        workers=args.workers,
+        backend=args.backend,
+        rank_k=args.rank,
+        write_batch=args.write_batch,
+        partition_by_product=args.partition_by_product,
+        model=args.model,
+        model_threshold=args.model_threshold,
+        **_budgets(args),
+    )
+    for report in summary["reports"]:
+        print(f"{report['status']:>8}  {report['input']} -> {report['output']} ({report['duration_sec']} s)")
+    print(f"Batch: {summary['ok']}/{summary['folders']} folders, {summary['clients']} clients in {summary['duration_sec']} s")
+    return 0 if summary["ok"] == summary["folders"] else 1
+
+
+def cmd_aggregates(args) -> int:
+    problems = validate_input(args.input)
+    if problems:
+        for problem in problems:
+            print(f"- {problem}", file=sys.stderr)
+        return 1
+
+    from client import build_clients, calculations
+    from aggregates import from_client, save_aggregates
+
+    clients_df, transactions_df, transfers_df = load_valid_data(args.input, quarantine_path(args.output))
+    clients = calculations(transactions_df, transfers_df, build_clients(clients_df, transactions_df, transfers_df),
+                           backend=args.backend)
+    save_aggregates((from_client(c) for c in clients), str(args.output))
+    print(f"Saved aggregates for {len(clients)} clients to {args.output}")
+    return 0
+
+
+def cmd_features(args) -> int:
+    problems = validate_input(args.input)
+    if problems:
+        for problem in problems:
+            print(f"- {problem}", file=sys.stderr)
+        return 1
+
+    from feature_store import build_feature_store
+
+    clients_df, transactions_df, transfers_df = load_valid_data(args.input, quarantine_path(args.output))
+    build_feature_store(args.output, clients_df, transactions_df, transfers_df)
+    print(f"Feature store for {len(clients_df)} clients written to {args.output}")
+    return 0
+
+
+def cmd_prompt(args) -> int:
+    from feature_store import FeatureStore
+    from ai_client import build_recommendation_prompt
+
+    client = FeatureStore(args.store).client(args.client)
+    if client is None:
+        print(f"Unknown client_code {args.client}", file=sys.stderr)
+        return 1
+    print(build_recommendation_prompt(client))
+    return 0
+
+
+def cmd_check(args) -> int:
+    import check
+
+    if args.input is not None:
+        labels = check.load_labels(find_input_files(args.input)["transactions"])
+    else:
+        from feature_store import FeatureStore
+        labels = check.labels_from_store(FeatureStore(args.store))
+
+    if args.diff is not None:
+        check.print_diff(check.diff_results(str(args.diff), str(args.result), labels, samples=args.samples))
+        return 0
+
+    report = check.evaluate_results(str(args.result), labels, samples=args.samples)
+    check.print_evaluation(report)
+    if args.report_dir is not None:
+        check.write_evaluation(report, args.report_dir)
+        print(f"Report written to {args.report_dir}")
+    return 0
+
+
+def cmd_tune(args) -> int:
+    import json
+    from feature_store import FeatureStore
+    from rules import RULES
+    from tuning import run_tuning
+
+    with open(args.grid, encoding="utf-8") as f:
+        grid = json.load(f)
+    run_tuning(FeatureStore(args.store), RULES.config, grid, top=args.top,
+               output=str(args.output) if args.output else None,
+               save_best=str(args.save_best) if args.save_best else None)
+    return 0
+
+
+def cmd_rank(args) -> int:
+    from feature_store import FeatureStore
+    from ranking import load_ranking, ranking_frame, write_ranking
+    from scoring import FeatureMatrices
+
+    path = write_ranking(FeatureMatrices.from_store(FeatureStore(args.store)), args.output, args.k)
+    frame = ranking_frame(load_ranking(path))
+    print(f"Top-{args.k} rankings for {frame['client_code'].nunique()} clients saved to {path}")
+    if args.csv is not None:
+        frame.to_csv(args.csv, index=False)
+        print(f"Long table written to {args.csv}")
+    return 0
+
+
+def cmd_train_model(args) -> int:
+    from feature_store import FeatureStore
+    from local_model import train_from_logs
+
+    try:
+        train_from_logs(FeatureStore(args.store), args.log, args.output, holdout=args.holdout,
+                        min_accuracy=args.min_accuracy)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_simulate(args) -> int:
+    import json
+    from feature_store import FeatureStore
+    from rules import RULES
+    from simulate import run_simulation
+
+    with open(args.grid, encoding="utf-8") as f:
+        grid = json.load(f)
+    run_simulation(FeatureStore(args.store), RULES.config, grid, top=args.top,
+                   output=str(args.output) if args.output else None)
+    return 0
+
+
+def cmd_serve(args) -> int:
+    from aggregates import attach_cached_pushes, load_aggregates
+    from serve import serve
+
+    if args.store:
+        from feature_store import FeatureStore, StoreIndex
+        index = StoreIndex(FeatureStore(args.store))
+    else:
+        index = load_aggregates(str(args.aggregates))
+    if args.pushes:
+        print(f"Cached pushes: {attach_cached_pushes(index, str(args.pushes))}")
+    serve(index, host=args.host, port=args.port)
+    return 0
+
+
+def cmd_stream(args) -> int:
+    from stream import open_stream
+
+    ingestor = open_stream(args.input, args.snapshot, window_months=args.window_months)
+    state = ingestor.state
+
+    if args.serve_port:
+        from serve import ScoringService, serve_in_background
+
+        service = ScoringService(state.windows, lock=state.lock)
+        state.on_update = service.invalidate
+        serve_in_background(service, port=args.serve_port)
+
+    ingestor.run(interval=args.interval, snapshot_every=args.snapshot_every, once=args.once)
+    print(f"Stream stats: {dict(state.stats)}")
+
+    if args.scores:
+        with open(args.scores, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["client_code", "product", "branch", "score"])
+            writer.writerows(state.rescore())
+        print(f"Re-scored {len(state.windows)} clients to {args.scores}")
+    return 0
+
+
+def _env_deadline() -> float | None:
+    value = os.getenv("RUN_DEADLINE_SECONDS")
+    return float(value) if value else None
+
+
+def _budgets(args) -> dict:
+    """--token-budget / --cost-budget, иначе LLM_TOKEN_BUDGET / LLM_COST_BUDGET из окружения."""
+    tokens, cost = os.getenv("LLM_TOKEN_BUDGET"), os.getenv("LLM_COST_BUDGET")
+    return {
+        "token_budget": args.token_budget if args.token_budget is not None else (int(tokens) if tokens else None),
+        "cost_budget": args.cost_budget if args.cost_budget is not None else (float(cost) if cost else None),
+    }
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be >= 1")
+    return number
+
+
+def _rank(value: str) -> int:
+    """--rank: 0 — без рейтинга, иначе top-K."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("must be >= 0")
+    return number
+
+
+def _partitions(value: str) -> int:
+    """--partitions: число или auto (0 — по размеру входа, partition.auto_partitions)."""
+    return 0 if value == "auto" else _positive_int(value)
+
+
+def _sample_size(value: str) -> int | float:
+    from sampling import parse_size
+
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def _strata(value: str) -> tuple[str, ...]:
+    strata = tuple(s.strip() for s in value.split(",") if s.strip())
+    unknown = set(strata) - {"status", "age", "balance", "category"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown strata: {', '.join(sorted(unknown))}")
+    return strata
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Product recommendations and push notifications")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_input(p: argparse.ArgumentParser):
+        p.add_argument("--input", "-i", type=Path, default=Path("case 1"), help="folder with clients/transactions/transfers CSVs")
+
+    def add_run_options(p: argparse.ArgumentParser):
+        p.add_argument("--stage", choices=["products", "all"], default="all",
+                       help="products: only choose products; all: products + push notifications")
+        p.add_argument("--dry-run", action="store_true", help="no LLM calls and no output file")
+        p.add_argument("--workers", type=_positive_int, default=1, help="clients processed in parallel")
+        p.add_argument("--deadline", type=float, default=None, help="run deadline in seconds (RUN_DEADLINE_SECONDS)")
+        p.add_argument("--rank", type=_rank, default=0, metavar="K",
+                       help="also save top-K products per client next to the result (<result>.rank.npz)")
+        p.add_argument("--write-batch", type=_positive_int, default=10_000, metavar="N",
+                       help="rows buffered before each write to the result file")
+        p.add_argument("--partition-by-product", action="store_true",
+                       help="write the result as a directory product=<name>/part-0.<format>")
+        p.add_argument("--model", type=Path, default=None,
+                       help="local classifier (train-model) for clients no rule picks; the LLM only below the threshold")
+        p.add_argument("--model-threshold", type=float, default=None,
+                       help="minimal class probability to skip the LLM (default 0.7)")
+        p.add_argument("--token-budget", type=int, default=None, metavar="TOKENS",
+                       help="LLM tokens per run (LLM_TOKEN_BUDGET); the most valuable clients are served first")
+        p.add_argument("--cost-budget", type=float, default=None, metavar="USD",
+                       help="LLM cost per run in USD at LLM_PRICE_INPUT_PER_M / LLM_PRICE_OUTPUT_PER_M (LLM_COST_BUDGET)")
+        add_backend(p)
+
+    def add_backend(p: argparse.ArgumentParser):
+        p.add_argument("--backend", choices=["pandas", "duckdb", "polars"], default=None,
+                       help="aggregation engine (default: AGG_BACKEND or pandas)")
+
+    run = commands.add_parser("run", help="run the pipeline (default command)")
+    add_input(run)
+    run.add_argument("--output", "-o", type=Path, default=Path("result.csv"))
+    add_run_options(run)
+    run.add_argument("--partitions", type=_partitions, default=None, metavar="N|auto",
+                     help="out-of-core: hash-partition the input by client_code on disk and run partition by partition")
+    run.add_argument("--spill-dir", type=Path, default=None,
+                     help="where partition files go (default: next to the output)")
+    run.add_argument("--keep-spill", action="store_true", help="keep partition files after the run")
+    run.add_argument("--sample", type=_sample_size, default=None, metavar="N|P%",
+                     help="run on a stratified sample of N clients (or P%%) and estimate population metrics")
+    run.add_argument("--sample-seed", type=int, default=0, help="seed of the sample (same seed, same clients)")
+    run.add_argument("--sample-strata", type=_strata, default=("status", "age", "balance", "category"),
+                     metavar="LIST", help="comma-separated strata from status,age,balance,category (default: all)")
+    run.set_defaults(handler=cmd_run)
+
+    batch = commands.add_parser("batch", help="run many case folders in one process")
+    batch.add_argument("inputs", type=Path, nargs="+", help="case folders")
+    batch.add_argument("--output-dir", type=Path, default=None,
+                       help="where to put <folder>.csv and <folder>.report.json (default: inside each folder)")
+    batch.add_argument("--parallel", type=_positive_int, default=1, help="folders processed in parallel")
+    batch.add_argument("--format", choices=[".csv", ".csv.gz", ".jsonl", ".jsonl.gz", ".parquet"], default=".csv",
+                       help="result file format (default: .csv)")
+    add_run_options(batch)
+    batch.set_defaults(handler=cmd_batch)
+
+    validate = commands.add_parser("validate", help="check input folder layout and CSV headers")
+    add_input(validate)
+    validate.add_argument("--rules", action="store_true",
+                          help="also check that categories/transfer types from rules.json occur in the data")
+    validate.add_argument("--rows", action="store_true",
+                          help="also check every row (types, enums, negative amounts, orphans)")
+    validate.set_defaults(handler=cmd_validate)
+
+    aggregates = commands.add_parser("aggregates", help="precompute per-client aggregates for the online service")
+    add_input(aggregates)
+    aggregates.add_argument("--output", "-o", type=Path, default=Path("aggregates.jsonl"))
+    add_backend(aggregates)
+    aggregates.set_defaults(handler=cmd_aggregates)
+
+    serve = commands.add_parser("serve", help="online scoring service over precomputed aggregates")
+    serve.add_argument("--aggregates", type=Path, default=Path("aggregates.jsonl"))
+    serve.add_argument("--store", type=Path, default=None, help="read clients from a feature store instead")
+    serve.add_argument("--pushes", type=Path, default=None, help="result.csv with pushes to serve from cache")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.set_defaults(handler=cmd_serve)
+
+    features = commands.add_parser("features", help="build the memory-mapped per-client feature store")
+    add_input(features)
+    features.add_argument("--output", "-o", type=Path, default=Path("feature_store"))
+    features.set_defaults(handler=cmd_features)
+
+    prompt = commands.add_parser("prompt", help="print the AI prompt for one client from the feature store")
+    prompt.add_argument("--store", type=Path, default=Path("feature_store"))
+    prompt.add_argument("--client", type=int, required=True)
+    prompt.set_defaults(handler=cmd_prompt)
+
+    check = commands.add_parser("check", help="evaluate a result file against first-transaction labels")
+    labels = check.add_mutually_exclusive_group()
+    labels.add_argument("--store", type=Path, default=Path("feature_store"), help="labels from a feature store")
+    labels.add_argument("--input", "-i", type=Path, default=None, help="labels read from the case folder CSVs")
+    check.add_argument("--result", type=Path, default=Path("result.csv"))
+    check.add_argument("--report-dir", type=Path, default=None, help="write confusion.csv, metrics.csv, evaluation.json")
+    check.add_argument("--samples", type=int, default=20, help="mismatch samples to keep")
+    check.add_argument("--diff", type=Path, default=None, metavar="OLD_RESULT",
+                       help="show what changed from OLD_RESULT to --result instead")
+    check.set_defaults(handler=cmd_check)
+
+    tune = commands.add_parser("tune", help="grid search over rules.json parameters against store labels")
+    tune.add_argument("--store", type=Path, default=Path("feature_store"))
+    tune.add_argument("--grid", type=Path, required=True,
+                      help='JSON {"<dotted path in rules.json>": [values] | {"start", "stop", "step"}}')
+    tune.add_argument("--top", type=int, default=10)
+    tune.add_argument("--output", "-o", type=Path, default=None, help="CSV with every combination")
+    tune.add_argument("--save-best", type=Path, default=None, help="write rules.json with the best combination")
+    tune.set_defaults(handler=cmd_tune)
+
+    simulate = commands.add_parser("simulate", help="what-if over deposit rates and cashback on a feature store")
+    simulate.add_argument("--store", type=Path, default=Path("feature_store"))
+    simulate.add_argument("--grid", type=Path, required=True,
+                          help='JSON {"deposits.<product>.rate": [...], "card_products.<product>.cashback": [...]}')
+    simulate.add_argument("--top", type=int, default=10)
+    simulate.add_argument("--output", "-o", type=Path, default=None, help="CSV with every scenario")
+    simulate.set_defaults(handler=cmd_simulate)
+
+    rank = commands.add_parser("rank", help="top-k products per client from a feature store")
+    rank.add_argument("--store", type=Path, default=Path("feature_store"))
+    rank.add_argument("-k", type=_positive_int, default=3)
+    rank.add_argument("--output", "-o", type=Path, default=Path("result.rank.npz"))
+    rank.add_argument("--csv", type=Path, default=None, help="also write the ranking as a long CSV")
+    rank.set_defaults(handler=cmd_rank)
+
+    train = commands.add_parser("train-model", help="fit the local classifier on logged LLM product decisions")
+    train.add_argument("--store", type=Path, default=Path("feature_store"))
+    train.add_argument("--log", type=Path, nargs="+", required=True, help="JSON-lines logs of runs (LOG_FILE)")
+    train.add_argument("--output", "-o", type=Path, default=Path("model.npz"))
+    train.add_argument("--holdout", type=float, default=0.2, help="share of clients kept for the coverage report")
+    train.add_argument("--min-accuracy", type=float, default=0.0,
+                       help="skip LLM answers with a lower self-reported accuracy (0-10)")
+    train.set_defaults(handler=cmd_train_model)
+
+    stream = commands.add_parser("stream", help="tail append-only CSVs and keep sliding-window aggregates")
+    add_input(stream)
+    stream.add_argument("--snapshot", type=Path, default=None, help="state file, restored on start")
+    stream.add_argument("--window-months", type=_positive_int, default=3)
+    stream.add_argument("--interval", type=float, default=1.0, help="poll interval, seconds")
+    stream.add_argument("--snapshot-every", type=float, default=30.0, help="seconds between snapshots")
+    stream.add_argument("--once", action="store_true", help="ingest what is there and exit")
+    stream.add_argument("--serve-port", type=int, default=None, help="also serve live decisions over HTTP")
+    stream.add_argument("--scores", type=Path, default=None, help="write re-scored decisions on exit")
+    stream.set_defaults(handler=cmd_stream)
+
+    return parser
 
-def main():
 
-    # Resolve path robustly: absolute OR relative to script location
-    p = Path("case 1")
-    clients_df, transactions_df, transfers_df = load_data(p)
+def main(argv: list[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = build_parser()
+    # `python main.py [--input ...]` keeps working as the run command
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "run")
+    args = parser.parse_args(argv)
 
-    handle_clients_logic(clients_df, transactions_df, transfers_df)
+    from logs import setup_logging
+    setup_logging()  # LOG_LEVEL / LOG_FILE / LOG_DECISION_SAMPLE
+    return args.handler(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Local OpenAI-compatible stand-in for load testing without network/quota.
+
+Implements POST /v1/chat/completions:
+  - prompts built from PROMPT_TEMPLATE get a valid product JSON,
+  - everything else gets a plausible push text.
+Latency (log-normal), 5xx error rate and 429 injection are configurable.
+
+Usage:
+    python mock_server.py --port 8001 --latency-median-ms 300 --rate-limit-rate 0.05
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 python main.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATALOG = [
+    "Кредит наличными",
+    "Депозит Мультивалютный",
+    "Депозит Сберегательный",
+    "Депозит Накопительный",
+]
+
+PUSH_TEMPLATES = [
+    "{name}, {product} поможет держать финансы под контролем. Посмотреть",
+    "{name}, по итогу месяца {product} мог бы упростить вам жизнь. Открыть",
+    "{name}, кажется, {product} вам подойдёт: без лишних шагов и условий. Узнать",
+    "{name}, попробуйте {product} — настройка займёт пару минут. Настроить",
+]
+
+
+class MockConfig:
+    def __init__(self, latency_median_ms=200.0, latency_sigma=0.5,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=None):
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def draw(self) -> tuple[float, float]:
+        """Returns (latency seconds, uniform sample for fault injection)."""
+        with self.lock:
+            latency = self.rng.lognormvariate(0.0, self.latency_sigma) * self.latency_median_ms / 1000.0
+            return latency, self.rng.random()
+
+
+def _stable_index(text: str, n: int) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16) % n
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def build_reply(messages: list[dict]) -> str:
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+
+    if "product_suggestion" in prompt:
+        idx = _stable_index(prompt, len(CATALOG))
+        return json.dumps({
+            "product_suggestion": {"name": CATALOG[idx]},
+            "accuracy": 3 + _stable_index(prompt[::-1], 8),
+        }, ensure_ascii=False)
+
+    name_match = re.search(r"- Имя: (.+)", prompt)
+    product_match = re.search(r"- (?:Рекомендуемый продукт|Продукт): (.+)", prompt)
+    name = name_match.group(1).strip() if name_match else "Клиент"
+    product = product_match.group(1).strip() if product_match else "новый продукт"
+    template = PUSH_TEMPLATES[_stable_index(prompt, len(PUSH_TEMPLATES))]
+    return template.format(name=name, product=product.lower())
+
+
+def make_handler(config: MockConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are two writes; without TCP_NODELAY keep-alive clients wait for delayed ACK (~40 ms)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # keep stdout quiet under load
+            pass
+
+        def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                with config.lock:
+                    self._send_json(200, dict(config.stats))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            try:
+                request = json.loads(raw)
+                messages = request["messages"]
+            except (ValueError, KeyError):
+                self._send_json(400, {"error": {"message": "invalid request", "type": "invalid_request_error"}})
+                return
+
+            latency, fault = config.draw()
+            time.sleep(latency)
+
+            if fault < config.rate_limit_rate:
+                with config.lock:
+                    config.stats["429"] += 1
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                    headers={"Retry-After": str(config.retry_after)},
+                )
+                return
+            if fault < config.rate_limit_rate + config.error_rate:
+                with config.lock:
+                    config.stats["500"] += 1
+                self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                return
+
+            content = build_reply(messages)
+            prompt_tokens = sum(_approx_tokens(str(m.get("content", ""))) for m in messages)
+            completion_tokens = _approx_tokens(content)
+            with config.lock:
+                config.stats["200"] += 1
+
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o-mini"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8001, config: MockConfig | None = None) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(config or MockConfig()))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-median-ms", type=float, default=200.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma (tail heaviness)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = make_server(args.host, args.port, config)
+    print(f"Mock LLM server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {dict(config.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Out-of-core runs for inputs larger than RAM.
+
+split_inputs() streams the input CSVs in chunks and hash-partitions clients,
+transactions and transfers by client_code into spill files
+
+    <spill>/clients/part-00007.csv
+    <spill>/transactions/part-00007.csv
+    <spill>/transfers/part-00007.csv
+
+so a client lands in one partition together with all its rows. Values are
+copied as text with the csv module, plus a leading "row" column with the row
+number in the whole table (quarantine reports the same rows as an in-memory
+run). The same pass records the first and last date of the extract
+(features.DateRange), so every partition is scored over the extract-wide
+observed span, not over the dates of its own clients. run_partitioned() then loads one partition at a time, validates it
+(validation.py), runs the usual handle_clients_logic on it and streams its rows
+into one result writer; quarantine and --rank files of the partitions are
+merged at the end.
+
+Peak memory is CHUNK_ROWS buffered rows while splitting and one partition while
+scoring.
+With --partitions auto every partition gets about PARTITION_INPUT_MB of CSV
+(a 500 GB extract -> 1000 partitions, a few GB of pandas each).
+
+Per-client results (products and push texts) match the in-memory run, except
+that the span also counts dates of rows that validation later quarantines; rows in the result are grouped by
+partition, in input order inside a partition.
+"""
+import csv
+import gc
+import logging
+import math
+import shutil
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path
+
+import pandas as pd
+
+from client import handle_clients_logic
+from csv_save import BATCH_SIZE, open_writer
+from features import DateRange
+from llm import RUN_DEADLINE
+from logs import get_logger, log
+from main import find_input_files, quarantine_path
+from ranking import concat_rankings, load_ranking, ranking_path, save_ranking
+from tokens import RUN_BUDGET
+from validation import ValidationResult, print_summary, validate_frames, write_quarantine
+
+TABLES = ("clients", "transactions", "transfers")
+CHUNK_ROWS = 200_000          # строк в буфере разбиения на все партиции
+PARTITION_INPUT_MB = 512
+ROW_COLUMN = "row"
+CODE_CACHE = 1 << 20
+
+_log = get_logger("partition")
+
+
+def auto_partitions(files: dict[str, list[Path]], partition_mb: int = PARTITION_INPUT_MB) -> int:
+    size = sum(f.stat().st_size for paths in files.values() for f in paths)
+    return max(1, math.ceil(size / (partition_mb << 20)))
+
+
+def partition_key(code: str) -> int:
+    """
+    Хеш client_code одной строки (мультипликативный, 64 бита). "17" и "17.0" — одна партиция,
+    как одно число после pd.read_csv; нечисловые коды — в 0, их отбракует проверка строк.
+    """
+    try:
+        number = int(code)
+    except ValueError:
+        try:
+            number = float(code)
+        except ValueError:
+            return 0
+        if not number.is_integer():
+            return 0
+        number = int(number)
+    return ((number * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32
+
+
+def spill_path(spill: Path, table: str, part: int) -> Path:
+    return spill / table / f"part-{part:05d}.csv"
+
+
+def _header(path: Path) -> list[str]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+class _Spiller:
+    """Строки копятся по партициям и дописываются в файлы пачками: память — chunk_rows строк, файлы не держатся открытыми."""
+
+    def __init__(self, spill: Path, table: str, partitions: int, columns: list[str], chunk_rows: int):
+        self.paths = [spill_path(spill, table, part) for part in range(partitions)]
+        self.chunk_rows = chunk_rows
+        self.buffers: list[list] = [[] for _ in range(partitions)]
+        self.pending = 0
+        for path in self.paths:              # заголовок есть у каждой партиции, даже пустой
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow([ROW_COLUMN, *columns])
+
+    def add(self, part: int, record: list):
+        self.buffers[part].append(record)
+        self.pending += 1
+        if self.pending >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        for path, buffer in zip(self.paths, self.buffers):
+            if buffer:
+                with open(path, "a", newline="", encoding="utf-8", buffering=1 << 20) as f:
+                    csv.writer(f).writerows(buffer)
+                buffer.clear()
+        self.pending = 0
+
+
+def _split_file(path: Path, columns: list[str], spiller: _Spiller, row: int, cache: dict,
+                dates: DateRange | None = None) -> int:
+    """Строки одного файла -> партиции (даты — в dates); возвращает следующий номер строки таблицы."""
+    partitions = len(spiller.paths)
+    date = columns.index("date") if dates is not None and "date" in columns else None
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = None if header == columns else [header.index(c) if c in header else None for c in columns]
+        code = header.index("client_code") if "client_code" in header else None
+        for record in reader:
+            if not record:
+                continue                        # пустые строки pd.read_csv тоже пропускает
+            key = record[code] if code is not None and code < len(record) else ""
+            part = cache.get(key)               # строки одного клиента обычно идут подряд
+            if part is None:
+                if len(cache) >= CODE_CACHE:
+                    cache.clear()
+                part = cache[key] = partition_key(key) % partitions
+            if positions is not None:
+                record = [record[i] if i is not None and i < len(record) else "" for i in positions]
+            if date is not None and date < len(record):
+                dates.add(record[date])
+            spiller.add(part, [row, *record])
+            row += 1
+    return row
+
+
+def split_inputs(files: dict[str, list[Path]], spill: Path, partitions: int,
+                 chunk_rows: int = CHUNK_ROWS) -> tuple[dict[str, int], float]:
+    """
+    Раскладывает все три таблицы по партициям; возвращает число строк по таблицам
+    и период всей выгрузки в месяцах (features.DateRange по transactions и transfers).
+    Значения копируются текстом через csv, без разбора типов, так что партиция
+    читается pandas так же, как исходные файлы.
+    """
+    rows = {}
+    dates = DateRange(chunk_rows)
+    collecting = gc.isenabled()
+    gc.disable()        # миллионы мелких списков без циклов: сборщик мусора только тормозит разбор
+    try:
+        for table in TABLES:
+            # колонки всех файлов таблицы в порядке появления — как у pd.concat в main.read_many_csv
+            columns = list(dict.fromkeys(c for f in files[table] for c in _header(f)))
+            (spill / table).mkdir(parents=True, exist_ok=True)
+            spiller = _Spiller(spill, table, partitions, columns, chunk_rows)
+            row, cache = 0, {}
+            for f in files[table]:
+                row = _split_file(f, columns, spiller, row, cache, dates if table != "clients" else None)
+            spiller.flush()
+            rows[table] = row
+    finally:
+        if collecting:
+            gc.enable()
+    return rows, dates.span
+
+
+def load_partition(spill: Path, part: int) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    frames = []
+    for table in TABLES:
+        df = pd.read_csv(spill_path(spill, table, part), index_col=ROW_COLUMN)
+        df.index.name = None
+        frames.append(df)
+    return tuple(frames)
+
+
+def merge_quarantine(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    """Карантин партиций в порядке in-memory прогона: clients, transactions, transfers, по номеру строки."""
+    quarantine = pd.concat(parts, ignore_index=True)
+    order = quarantine["table"].map({t: i for i, t in enumerate(TABLES)})
+    return quarantine.assign(_order=order).sort_values(["_order", "row"], kind="stable") \
+                     .drop(columns="_order").reset_index(drop=True)
+
+
+def run_partitioned(base_path: Path, output, partitions: int | None = None,
+                    spill_dir: Path | None = None, keep_spill: bool = False,
+                    chunk_rows: int = CHUNK_ROWS,
+                    deadline_seconds: float | None = None,
+                    token_budget: int | None = None,
+                    cost_budget: float | None = None,
+                    write_batch: int = BATCH_SIZE,
+                    partition_by_product: bool = False,
+                    rank_k: int = 0,
+                    **run_kwargs) -> int:
+    """
+    Разбиение + прогон по партициям в один output (форматы как у run, csv_save).
+      - partitions=None — auto_partitions по размеру входа;
+      - spill_dir — где создать временный каталог партиций (по умолчанию рядом с output);
+        после прогона он удаляется, если не keep_spill;
+      - deadline_seconds и token_budget / cost_budget — одни на все партиции (партиции идут по очереди,
+        очередь по ценности клиентов — внутри партиции);
+      - run_kwargs уходят в handle_clients_logic (with_push, dry_run, workers, backend).
+    Возвращает число обработанных клиентов.
+    """
+    output = Path(output)
+    dry_run = run_kwargs.get("dry_run", False)
+    files = find_input_files(base_path)
+    partitions = partitions or auto_partitions(files)
+    parent = Path(spill_dir) if spill_dir is not None else output.parent
+    parent.mkdir(parents=True, exist_ok=True)
+    spill = Path(tempfile.mkdtemp(prefix=f".{output.name}.spill-", dir=parent))
+
+    try:
+        rows, span = split_inputs(files, spill, partitions, chunk_rows)
+        print(f"Split {', '.join(f'{n} {t}' for t, n in rows.items())} rows into {partitions} partitions")
+        if deadline_seconds is not None:
+            RUN_DEADLINE.start(deadline_seconds)
+        if token_budget is not None or cost_budget is not None:
+            RUN_BUDGET.start(token_budget, cost_budget)
+
+        quarantines, rankings, clients = [], [], 0
+        writer = None if dry_run else open_writer(output, batch_size=write_batch,
+                                                  partition_by_product=partition_by_product)
+        with writer or nullcontext():
+            for part in range(partitions):
+                checked = validate_frames(*load_partition(spill, part))
+                quarantines.append(checked.quarantine)
+                log(_log, logging.INFO, "partition", part=part, clients=len(checked.clients),
+                    transactions=len(checked.transactions), transfers=len(checked.transfers),
+                    quarantined=len(checked.quarantine))
+                if checked.clients.empty:
+                    continue
+                part_output = spill / "rank" / f"part-{part:05d}.csv"
+                part_output.parent.mkdir(exist_ok=True)
+                result = handle_clients_logic(
+                    checked.clients, checked.transactions, checked.transfers,
+                    output=str(part_output), writer=writer, rank_k=rank_k, check_rules=False,
+                    observed_span=span or None, **run_kwargs)
+                clients += len(result)
+                if rank_k and not dry_run:
+                    rankings.append(load_ranking(ranking_path(part_output)))
+    finally:
+        if keep_spill:
+            print(f"Spill files kept in {spill}")
+        else:
+            shutil.rmtree(spill, ignore_errors=True)
+
+    checked = ValidationResult(pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), merge_quarantine(quarantines))
+    where = None if dry_run else quarantine_path(output)
+    if where is not None:
+        if not checked.quarantine.empty:
+            write_quarantine(checked.quarantine, where)
+        elif where.exists():
+            where.unlink()
+    print_summary(checked, where)
+    if not dry_run:
+        print(f"Saved {writer.rows} push notifications to {output} ✅")
+        if rankings:
+            print(f"Top-{rank_k} rankings saved to {save_ranking(concat_rankings(rankings), ranking_path(output))}")
+    return clients
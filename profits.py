@@ -1,3 +1,6 @@
+from deposit import observed_months
+from rules import RULES
+
 # Курсы валют
 CURRENCY_RATES = {
     "KZT": 1,
@@ -10,41 +13,35 @@ def convert_to_kzt(amount: float, currency: str) -> float:
     rate = CURRENCY_RATES.get(currency, 1)  # если валюта неизвестна → оставить как есть
     return amount * rate
 
-def calculate_travel_card_benefit(client) -> float:
-    travel_categories = ["Путешествия", "Такси", "Отели"]
-    travel_spending = sum(
+def spending_kzt(client, categories) -> float:
+    """Траты клиента в KZT по списку категорий; берёт агрегаты client.totals_by_category_kzt, если они есть."""
+    totals = getattr(client, "totals_by_category_kzt", None)
+    if totals is not None:
+        return sum(totals.get(c, 0.0) for c in categories)
+    return sum(
         convert_to_kzt(tx.amount, tx.currency)
-        for tx in client.transactions if tx.category in travel_categories
+        for tx in client.transactions if tx.category in categories
     )
-    monthly_cashback = (travel_spending * 0.04) / 3
-    return monthly_cashback
 
-def calculate_premium_card_benefit(client) -> float:
-    premium_categories = ["Кафе и рестораны", "Ювелирные украшения", "Косметика и Парфюмерия"]
-    premium_spending = sum(
-        convert_to_kzt(tx.amount, tx.currency)
-        for tx in client.transactions if tx.category in premium_categories
-    )
-    premium_bonus = (premium_spending * 0.02) / 3
-    return premium_bonus
+def spending_kzt_by_category(client) -> dict:
+    """{категория: траты в KZT} одним проходом по транзакциям (или готовые агрегаты)."""
+    totals = getattr(client, "totals_by_category_kzt", None)
+    if totals is not None:
+        return totals
+    by_category = {}
+    for tx in client.transactions:
+        by_category[tx.category] = by_category.get(tx.category, 0.0) + convert_to_kzt(tx.amount, tx.currency)
+    return by_category
 
-def calculate_credit_card_benefit(client) -> float:
-    online_categories = ["Играем дома", "Смотрим дома", "Едим дома"]
-    online_spending = sum(
-        convert_to_kzt(tx.amount, tx.currency)
-        for tx in client.transactions if tx.category in online_categories
-    )
-    online_cashback = online_spending * 0.05
-    monthly_benefit = online_cashback / 3
-    return monthly_benefit
+def calculate_card_benefit(client, product_type: str) -> float:
+    """Кешбэк в месяц по карточному продукту: траты в его категориях × ставка (rules.json)."""
+    spec = RULES.config["card_products"][product_type]
+    spending = spending_kzt(client, spec["categories"])
+    return (spending * spec["cashback"]) / observed_months(client)
 
 
 def calculate_profit_for_client_by_product(client, product_type: str) -> float:
-    if product_type == 'Карта для путешествий':
-        return calculate_travel_card_benefit(client)
-    elif product_type == 'Премиальная карта':
-        return calculate_premium_card_benefit(client)
-    elif product_type == 'Кредитная карта':
-        return calculate_credit_card_benefit(client)
-    
+    if product_type in RULES.card_products:
+        return calculate_card_benefit(client, product_type)
+
     return 0.0
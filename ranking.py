@@ -0,0 +1,192 @@
+"""
+Top-k product ranking per client.
+
+decide_product keeps one product from the transfers -> deposit -> transactions
+-> ai waterfall and drops every other score. rank_products() scores every
+product of the rules catalog for all clients in one vectorized pass over
+scoring.FeatureMatrices and keeps the k best per client, so A/B campaigns can
+take second choices from the saved file instead of re-running the pipeline.
+
+Order inside a client (tier first, then the value within the tier):
+    4  transfer products with transfers of their types   (by transfer sum)
+    3  deposit chosen by the deposit branch               (confidence >= min_confidence)
+    2  card products past the share threshold             (by monthly profit)
+    1  deterministic fallback product (ai_client.fallback_recomended_product)
+    0  scored but not recommendable: the other deposit, a deposit below
+       min_confidence, cards under the threshold         (by monthly profit)
+Products without any signal are not ranked. Rank 1 is the scoring.decide_all
+product. The "ai" branch here is the deterministic fallback, not an LLM answer.
+
+The file (result.rank.npz next to result.csv) is columnar: client_code (n) and
+n x k matrices product / branch (indices into products / branches, -1 — empty),
+tier, score (the branch score decide_product returns), profit and confidence
+(NaN where the branch has none).
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from rules import CompiledRules
+from scoring import (BRANCHES, FeatureMatrices, deposit_branch, deposit_scores, fallback_products,
+                     transfer_scores)
+
+TIER_TRANSFERS, TIER_DEPOSIT, TIER_CARD, TIER_FALLBACK, TIER_SCORED, TIER_NONE = 4, 3, 2, 1, 0, -1
+BRANCH_OF_TIER = {TIER_TRANSFERS: "transfers", TIER_DEPOSIT: "deposit", TIER_CARD: "transactions",
+                  TIER_FALLBACK: "ai"}
+
+
+def ranking_path(output) -> Path:
+    """result.csv -> result.rank.npz"""
+    return Path(output).with_suffix(".rank.npz")
+
+
+def score_all_products(rules: CompiledRules, m: FeatureMatrices) -> dict[str, np.ndarray]:
+    """
+    Все продукты каталога для всех клиентов: матрицы clients x products
+    tier, value (порядок внутри tier), score, profit, confidence и branch.
+    """
+    products = list(rules.product_categories)
+    column = {p: j for j, p in enumerate(products)}
+    shape = (len(m), len(products))
+    # по столбцу на продукт: column-major, чтобы запись столбца шла подряд
+    tier = np.full(shape, TIER_NONE, dtype="int8", order="F")
+    value = np.zeros(shape, order="F")
+    score = np.zeros(shape, order="F")
+    profit = np.full(shape, np.nan, order="F")
+    confidence = np.full(shape, np.nan, order="F")
+
+    # переводы: любой продукт с ненулевой суммой переводов выше всех остальных веток
+    sums = transfer_scores(rules, m)
+    for j, product in enumerate(rules.transfer_products):
+        c = column[product]
+        has = sums[:, j] > 0
+        tier[:, c] = np.where(has, TIER_TRANSFERS, TIER_NONE)
+        value[:, c] = score[:, c] = sums[:, j]
+
+    # депозиты: победитель ветки (если прошёл min_confidence) — tier 3, остальные подходящие — tier 0
+    scores = deposit_scores(rules, m)
+    chosen, chosen_conf = deposit_branch(rules, m, scores)
+    for product, (ok, total_profit, conf) in scores.items():
+        c = column[product]
+        won = chosen == product
+        tier[:, c] = np.where(won, TIER_DEPOSIT, np.where(ok, TIER_SCORED, TIER_NONE))
+        value[:, c] = np.where(won, chosen_conf, total_profit / m.months)
+        score[:, c] = np.where(ok, np.round(conf, 3), 0.0)
+        profit[:, c] = np.where(ok, total_profit, np.nan)
+        confidence[:, c] = np.where(ok, np.round(conf, 3), np.nan)
+
+    # карты: прошедшие порог — tier 2, с выгодой, но под порогом — tier 0
+    if rules.card_products:
+        eligible, card_profit = rules.card_scores(*m.rule_inputs(rules))
+        for j, product in enumerate(rules.card_products):
+            c = column[product]
+            tier[:, c] = np.where(eligible[:, j], TIER_CARD, np.where(card_profit[:, j] > 0, TIER_SCORED, TIER_NONE))
+            value[:, c] = score[:, c] = card_profit[:, j]
+            profit[:, c] = np.where(card_profit[:, j] > 0, card_profit[:, j], np.nan)
+
+    # детерминированный fallback — ниже всех рекомендаций правил
+    fallback = fallback_products(rules, m)
+    for product in pd.unique(fallback):
+        c = column[product]
+        mask = (fallback == product) & (tier[:, c] < TIER_FALLBACK)
+        tier[:, c] = np.where(mask, TIER_FALLBACK, tier[:, c])
+        score[:, c] = np.where(mask, 0.0, score[:, c])
+
+    branch = np.full(shape, -1, dtype="int8", order="F")
+    for t, name in BRANCH_OF_TIER.items():
+        branch[tier == t] = BRANCHES.index(name)
+    # tier 0: ветка, посчитавшая продукт
+    for product, c in column.items():
+        own = "deposit" if product in scores else "transactions" if product in rules.card_products else None
+        if own:
+            branch[tier[:, c] == TIER_SCORED, c] = BRANCHES.index(own)
+
+    return {"products": products, "tier": tier, "value": value, "score": score,
+            "profit": profit, "confidence": confidence, "branch": branch}
+
+
+def rank_products(rules: CompiledRules, m: FeatureMatrices, k: int = 3) -> dict[str, np.ndarray]:
+    """
+    Top-k продуктов на клиента: словарь колонок для save_ranking.
+    k проходов «лучший из оставшихся» по (tier, value) вместо сортировки всей строки;
+    при равных ключах берётся продукт раньше в каталоге — как argmax в decide_all.
+    """
+    scored = score_all_products(rules, m)
+    remaining = scored["tier"].copy()
+    k = min(k, remaining.shape[1])
+    rows = np.arange(len(m))
+    order = np.empty((len(m), k), dtype="int16")
+    top_tier = np.empty((len(m), k), dtype="int8")
+    for r in range(k):
+        best_tier = remaining.max(axis=1)
+        pick = np.where(remaining == best_tier[:, None], scored["value"], -np.inf).argmax(axis=1)
+        order[:, r], top_tier[:, r] = pick, best_tier
+        remaining[rows, pick] = TIER_NONE - 1          # уже выбран
+    present = top_tier > TIER_NONE
+    rows = rows[:, None]
+
+    def take(name: str, empty):
+        return np.where(present, scored[name][rows, order], empty)
+
+    return {
+        "client_code": np.asarray(m.client_codes, dtype="int64"),
+        "product": np.where(present, order, -1).astype("int16"),
+        "branch": take("branch", -1).astype("int8"),
+        "tier": np.where(present, top_tier, TIER_NONE).astype("int8"),
+        "score": take("score", np.nan),
+        "profit": take("profit", np.nan).astype("float32"),
+        "confidence": take("confidence", np.nan).astype("float32"),
+        "products": np.array(scored["products"]),
+        "branches": np.array(BRANCHES),
+    }
+
+
+def save_ranking(ranking: dict, path) -> Path:
+    """Сжатый .npz; запись через временный файл, чтобы читатель не увидел половину."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez_compressed(tmp, **ranking)
+    tmp.replace(path)
+    return path
+
+
+def load_ranking(path) -> dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def concat_rankings(rankings: list[dict]) -> dict[str, np.ndarray]:
+    """Склейка ранжирований частей одного прогона (partition.py) по клиентам; k и каталог — общие."""
+    first = rankings[0]
+    merged = {name: np.concatenate([r[name] for r in rankings]) for name in first if name not in ("products", "branches")}
+    return {**merged, "products": first["products"], "branches": first["branches"]}
+
+
+def ranking_frame(ranking: dict) -> pd.DataFrame:
+    """Длинная таблица client_code, rank, product, branch, tier, score, profit, confidence (без пустых мест)."""
+    n, k = ranking["product"].shape
+    present = ranking["product"] >= 0
+    products = np.append(ranking["products"], "")
+    branches = np.append(ranking["branches"], "")
+    frame = pd.DataFrame({
+        "client_code": np.repeat(ranking["client_code"], k),
+        "rank": np.tile(np.arange(1, k + 1), n),
+        "product": products[ranking["product"].ravel()],
+        "branch": branches[ranking["branch"].ravel()],
+        "tier": ranking["tier"].ravel(),
+        "score": ranking["score"].ravel(),
+        "profit": ranking["profit"].ravel(),
+        "confidence": ranking["confidence"].ravel(),
+    })
+    return frame[present.ravel()].reset_index(drop=True)
+
+
+def write_ranking(clients_or_matrices, output, k: int = 3, rules: CompiledRules | None = None) -> Path:
+    """Ранжирование списка Client (после client.calculations) или FeatureMatrices в output."""
+    if rules is None:
+        from rules import RULES as rules
+    m = clients_or_matrices
+    if not isinstance(m, FeatureMatrices):
+        m = FeatureMatrices.from_clients(list(m))
+    return save_ranking(rank_products(rules, m, k), output)
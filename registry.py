@@ -0,0 +1,63 @@
+"""
+Client registry: client_code -> stable row index.
+
+Codes are arbitrary 64-bit integers (sparse, unsorted, sharded); rows follow
+the order of clients.csv and are what the array-based stages (FeatureCache,
+feature_store) index by. Nothing here assumes code == row + 1.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ClientRegistry:
+    def __init__(self, client_codes: Iterable, objects: Optional[list] = None):
+        self.codes = np.asarray([int(code) for code in client_codes], dtype=np.int64)
+        self.index = pd.Index(self.codes)
+        if not self.index.is_unique:
+            duplicated = sorted(int(c) for c in self.index[self.index.duplicated()].unique())
+            raise ValueError(f"Повторяющиеся client_code: {duplicated[:10]}")
+        self._row = {int(code): i for i, code in enumerate(self.codes)}
+        self.objects = objects
+
+    @classmethod
+    def from_clients(cls, clients: list) -> "ClientRegistry":
+        return cls((c.client_code for c in clients), objects=list(clients))
+
+    @classmethod
+    def of(cls, clients) -> "ClientRegistry":
+        return clients if isinstance(clients, cls) else cls.from_clients(clients)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, client_code) -> bool:
+        return int(client_code) in self._row
+
+    def __iter__(self):
+        return iter(self.objects if self.objects is not None else self.codes.tolist())
+
+    def row(self, client_code) -> Optional[int]:
+        return self._row.get(int(client_code))
+
+    def rows(self, client_codes) -> np.ndarray:
+        """Vectorized lookup; -1 for unknown codes."""
+        return self.index.get_indexer(np.asarray(client_codes, dtype=np.int64))
+
+    def get(self, client_code):
+        row = self._row.get(int(client_code))
+        return None if row is None or self.objects is None else self.objects[row]
+
+    def orphans(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Строки транзакций/переводов с client_code, которого нет в clients.csv."""
+        if df.empty:
+            return df
+        return df[self.rows(df["client_code"]) < 0]
+
+    def validate(self, transactions_df: pd.DataFrame, transfers_df: pd.DataFrame) -> dict[str, int]:
+        """{"transactions": n, "transfers": n} — количество строк-сирот по таблицам."""
+        return {
+            "transactions": len(self.orphans(transactions_df)),
+            "transfers": len(self.orphans(transfers_df)),
+        }
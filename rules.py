@@ -0,0 +1,216 @@
+"""
+Declarative product rules (rules.json, or the file in RULES_PATH) compiled once
+into lookup tables and vectorized masks.
+
+Card products: categories, cashback and a share threshold with conditional
+adjustments; conditions are small JSON expressions
+    {"field": "age", "op": "<", "value": 25}
+    {"field": "transfer_types", "op": "any", "value": ["cc_repayment_out"]}
+    {"field": "spend", "op": ">=", "value": 400000}     # траты в категориях продукта
+    {"any": [...]} / {"all": [...]}
+evaluated over whole columns (numpy arrays, one element per client), so one
+call scores every client. Transfer products and deposit parameters live in the
+same file; PRODUCT_CATEGORIES, product_transfer_map and the deposit constants
+are derived from it.
+"""
+import json
+import operator
+import os
+from pathlib import Path
+
+import numpy as np
+
+RULES_PATH = Path(os.getenv("RULES_PATH") or Path(__file__).with_name("rules.json"))
+
+PROFILE_FIELDS = ("age", "status", "avg_monthly_balance_KZT", "city")
+OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda column, values: np.isin(column, list(values)),
+}
+
+
+def transfer_column(ttype: str) -> str:
+    """Имя булевой колонки «у клиента есть перевод типа ttype»."""
+    return f"transfer:{ttype}"
+
+
+class CompiledRules:
+    def __init__(self, config: dict):
+        self.config = config
+        cards = config["card_products"]
+        self.card_products = list(cards)
+        self.categories: list[str] = []
+        self.category_index: dict[str, int] = {}
+        self.product_columns: list[list[int]] = []       # продукт -> индексы его категорий
+        self.transfer_types: set[str] = set()
+
+        for product, spec in cards.items():
+            columns = []
+            for category in spec["categories"]:
+                if category in self.category_index:
+                    raise ValueError(f"Категория {category!r} указана у нескольких карточных продуктов")
+                self.category_index[category] = len(self.categories)
+                self.categories.append(category)
+                columns.append(self.category_index[category])
+            self.product_columns.append(columns)
+
+        self.cashback = np.array([cards[p]["cashback"] for p in self.card_products], dtype="float64")
+        self.base_threshold = np.array([cards[p]["threshold"] for p in self.card_products], dtype="float64")
+        self.threshold_bounds = tuple(config.get("threshold_bounds", (0.0, 1.0)))
+        self.adjustments = [
+            (i, self._compile(adj["if"]), float(adj["delta"]))
+            for i, p in enumerate(self.card_products)
+            for adj in cards[p].get("adjustments", [])
+        ]
+        self._adjustments_by_product = [[a for a in self.adjustments if a[0] == p] for p in range(len(cards))]
+
+        self.transfer_products: dict[str, list[str]] = config.get("transfer_products", {})
+        self.transfer_types.update(t for types in self.transfer_products.values() for t in types)
+
+        deposits = dict(config.get("deposits", {}))
+        self.deposit_min_confidence = float(deposits.pop("min_confidence", 0.8))
+        self.deposits: dict[str, dict] = deposits
+        for spec in deposits.values():
+            self.transfer_types.update(spec[k] for k in ("topup_type", "withdraw_type") if k in spec)
+        # детерминированный выбор без LLM (ai_client.fallback_recomended_product, scoring.fallback_products)
+        self.fallback: dict = config["fallback"]
+
+        # продукт -> категории трат, в том же виде, что исторический client.PRODUCT_CATEGORIES
+        self.product_categories = {p: list(cards[p]["categories"]) for p in self.card_products}
+        for product in [*deposits, *self.transfer_products, *config.get("other_products", [])]:
+            self.product_categories.setdefault(product, [])
+
+    # --- компиляция условий ---
+    def _compile(self, spec: dict):
+        if "any" in spec or "all" in spec:
+            combine = np.logical_or if "any" in spec else np.logical_and
+            parts = [self._compile(s) for s in spec.get("any", spec.get("all"))]
+
+            def evaluate(columns, spend):
+                result = parts[0](columns, spend)
+                for part in parts[1:]:
+                    result = combine(result, part(columns, spend))
+                return result
+            return evaluate
+
+        field, op, value = spec.get("field"), spec.get("op"), spec.get("value")
+        if field == "transfer_types":
+            if op != "any":
+                raise ValueError(f"transfer_types поддерживает только op='any', получено {op!r}")
+            types = list(value)
+            self.transfer_types.update(types)
+
+            def evaluate(columns, spend):
+                result = np.asarray(columns[transfer_column(types[0])], dtype=bool)
+                for ttype in types[1:]:
+                    result = result | columns[transfer_column(ttype)]
+                return result
+            return evaluate
+
+        if op not in OPS:
+            raise ValueError(f"Неизвестный оператор {op!r} (доступны: {sorted(OPS)})")
+        if field != "spend" and field not in PROFILE_FIELDS:
+            raise ValueError(f"Неизвестное поле {field!r} (доступны: spend, transfer_types, {', '.join(PROFILE_FIELDS)})")
+        compare = OPS[op]
+        if field == "spend":
+            return lambda columns, spend: compare(spend, value)
+        return lambda columns, spend: np.asarray(compare(columns[field], value), dtype=bool)
+
+    # --- вычисление по всем клиентам сразу ---
+    def spend_by_product(self, totals: np.ndarray) -> np.ndarray:
+        """totals: clients x self.categories -> clients x card_products (суммы в категориях продукта)."""
+        out = np.zeros((totals.shape[0], len(self.card_products)))
+        for p, columns in enumerate(self.product_columns):
+            spend = np.zeros(totals.shape[0])
+            for c in columns:  # последовательно, как в скалярной версии — те же float-суммы
+                spend = spend + totals[:, c]
+            out[:, p] = spend
+        return out
+
+    def thresholds(self, columns: dict, spend: np.ndarray) -> np.ndarray:
+        """Порог доли трат: clients x card_products."""
+        thr = np.tile(self.base_threshold, (spend.shape[0], 1))
+        for p, condition, delta in self.adjustments:
+            mask = np.broadcast_to(condition(columns, spend[:, p]), spend.shape[:1])
+            thr[:, p] = thr[:, p] + np.where(mask, delta, 0.0)
+        low, high = self.threshold_bounds
+        return np.maximum(np.minimum(thr, high), low)
+
+    def share_passes(self, totals: np.ndarray, total: np.ndarray, columns: dict) -> np.ndarray:
+        """Доля трат в категориях продукта >= его порога: clients x card_products (от cashback не зависит)."""
+        spend = self.spend_by_product(totals)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(total[:, None] > 0, spend / total[:, None], 0.0)
+        return share >= self.thresholds(columns, spend)
+
+    def card_scores(self, totals: np.ndarray, totals_kzt: np.ndarray, total: np.ndarray,
+                    columns: dict, months: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(прошёл порог доли и выгода > 0, выгода в месяц) — clients x card_products."""
+        profit = self.spend_by_product(totals_kzt) * self.cashback / months[:, None]
+        return self.share_passes(totals, total, columns) & (profit > 0), profit
+
+    def select_card_products(self, totals: np.ndarray, totals_kzt: np.ndarray, total: np.ndarray,
+                             columns: dict, months: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Карточный продукт с максимальной выгодой среди прошедших порог доли.
+        Возвращает (индекс в card_products или -1, выгода в месяц).
+        """
+        eligible, profit = self.card_scores(totals, totals_kzt, total, columns, months)
+        if not self.card_products:
+            return np.full(len(total), -1), np.zeros(len(total))
+        ranked = np.where(eligible, profit, -np.inf)
+        best = ranked.argmax(axis=1)
+        value = ranked[np.arange(len(total)), best]
+        found = np.isfinite(value)
+        return np.where(found, best, -1), np.where(found, value, 0.0)
+
+    def select_card_product(self, totals: dict, totals_kzt: dict, total: float,
+                            columns: dict, months: float) -> tuple[int, float]:
+        """
+        То же для одного клиента на скалярах (онлайн-скоринг без накладных расходов numpy):
+        totals/totals_kzt — {категория: сумма}, columns — {поле: значение}.
+        """
+        low, high = self.threshold_bounds
+        best, best_profit = -1, 0.0
+        for p, product in enumerate(self.card_products):
+            categories = self.product_categories[product]
+            spend = spend_kzt = 0.0
+            for category in categories:
+                spend = spend + totals.get(category, 0.0)
+                spend_kzt = spend_kzt + totals_kzt.get(category, 0.0)
+            profit = spend_kzt * self.cashback[p] / months
+            if profit <= best_profit:
+                continue
+            thr = self.base_threshold[p]
+            for _, condition, delta in self._adjustments_by_product[p]:
+                if condition(columns, spend):
+                    thr = thr + delta
+            share = spend / total if total > 0 else 0.0
+            if share >= max(min(thr, high), low):
+                best, best_profit = p, float(profit)
+        return best, best_profit
+
+    # --- проверка против данных ---
+    def validate(self, categories, transfer_types) -> list[str]:
+        """Категории и типы переводов из правил, которых нет в данных."""
+        problems = []
+        missing = sorted(set(self.categories) - set(categories))
+        if missing:
+            problems.append(f"категории из правил не встречаются в транзакциях: {', '.join(missing)}")
+        missing = sorted(self.transfer_types - set(transfer_types))
+        if missing:
+            problems.append(f"типы переводов из правил не встречаются в переводах: {', '.join(missing)}")
+        return problems
+
+
+def load_rules(path: Path = RULES_PATH) -> CompiledRules:
+    with open(path, encoding="utf-8") as f:
+        return CompiledRules(json.load(f))
+
+
+RULES = load_rules()
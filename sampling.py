@@ -0,0 +1,360 @@
+"""
+Stratified client samples for fast smoke and tuning runs.
+
+    python main.py run -i "case 1" --sample 500 --sample-seed 7
+    python main.py run -i "case 1" --sample 5% --sample-strata status,age,balance
+
+select_sample() reads the clients table (one row per client) and, for the
+"category" stratum, client_code / category / amount / currency of transactions.
+Clients are grouped into strata by
+
+    status x age band (AGE_BANDS) x balance decile x dominant spending category
+
+and every stratum gets its proportional share of the sample (at least one
+client, largest remainders first). Inside a stratum the clients with the
+smallest hash of (client_code, seed) are taken, so the same seed gives the same
+sample whatever the input order.
+
+The same scan records the first and last date of the whole extract
+(features.DateRange over transactions and transfers): the sampled run uses that
+observed span, so profits and push texts are the ones of a full run.
+
+read_sample() then pushes the sampled codes down into ingestion: every CSV is
+scanned with the csv module and only rows of sampled clients reach
+pd.read_csv, with their row numbers in the whole table (quarantine reports the
+same rows as a full run).
+
+estimate() turns the sampled result into full-population estimates with the
+stratified estimator: product shares (and accuracy against the first
+transaction product, when the input has one) as
+sum_h W_h p_h with variance sum_h W_h^2 (1 - n_h/N_h) p_h (1 - p_h) / (n_h - 1)
+and a normal confidence interval; W_h is the stratum's share of the estimated
+domain (clients with a result, clients with a label), so unlabeled clients
+do not count as misses.
+"""
+import csv
+import io
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from check import LABEL_COLUMNS
+from features import DateRange
+from main import find_input_files
+from profits import CURRENCY_RATES
+
+STRATA = ("status", "age", "balance", "category")
+AGE_BANDS = (25, 35, 45, 55)            # <25, 25-34, 35-44, 45-54, 55+
+BALANCE_BINS = 10
+CONFIDENCE = 0.95
+ROW_COLUMN = "row"
+MISSING = "?"
+MIN_QUOTA = 2.0                         # ожидаемых клиентов выборки на страту, меньше — слияние (нужно n_h >= 2)
+
+
+def parse_size(value: str) -> int | float:
+    """--sample: число клиентов ("500", int) или доля ("5%", "0.05", float до 1)."""
+    value = value.strip()
+    if value.endswith("%"):
+        size = float(value[:-1]) / 100
+    elif value.isdigit():
+        size = int(value)
+    else:
+        size = float(value)
+        if size > 1:
+            raise ValueError("a fraction must be <= 1, a client count an integer")
+    if size <= 0 or (isinstance(size, float) and size > 1):
+        raise ValueError("sample size must be > 0 and at most 100%")
+    return size
+
+
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _hash(codes: np.ndarray, seed: int) -> np.ndarray:
+    """Мультипликативный хеш (client_code, seed), как у logs.sampled, но со сдвигом по seed."""
+    with np.errstate(over="ignore"):    # переполнение uint64 здесь и есть хеширование по модулю 2**64
+        mixed = codes.astype("uint64") + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        return (mixed * np.uint64(2654435761)) % np.uint64(2**32)
+
+
+def dominant_categories(transaction_files: list, dates: DateRange | None = None) -> pd.Series:
+    """
+    client_code -> категория с наибольшими тратами в KZT. Проход csv-модулем по четырём
+    колонкам: на тысячах мелких файлов pd.read_csv тратит время в основном на сам вызов.
+    dates — заодно собрать даты транзакций (период выгрузки).
+    """
+    totals: dict = {}
+    for path in transaction_files:
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            try:
+                code, category, amount, currency = (header.index(c) for c in
+                                                    ("client_code", "category", "amount", "currency"))
+            except ValueError:
+                continue
+            width = max(code, category, amount, currency)
+            date = header.index("date") if dates is not None and "date" in header else None
+            for record in reader:
+                if date is not None and date < len(record):
+                    dates.add(record[date])
+                if len(record) <= width:
+                    continue
+                try:
+                    value = float(record[amount]) * CURRENCY_RATES.get(record[currency], 1)
+                except ValueError:
+                    continue
+                key = (record[code], record[category])
+                totals[key] = totals.get(key, 0.0) + value
+    best: dict = {}
+    for (code, category), value in totals.items():
+        number = _code_key(code)
+        if number is not None and (number not in best or value > best[number][1]):
+            best[number] = (category, value)
+    return pd.Series({code: category for code, (category, _) in best.items()}, dtype=object)
+
+
+def strata_of(clients_df: pd.DataFrame, strata=STRATA, categories: pd.Series | None = None) -> pd.DataFrame:
+    """client_code -> признаки страт по колонкам strata (только клиенты с числовым кодом, без дублей)."""
+    codes = pd.to_numeric(clients_df["client_code"], errors="coerce")
+    df = clients_df[codes.notna() & (codes % 1 == 0)].assign(client_code=codes)
+    df = df.drop_duplicates("client_code")
+    keys = pd.DataFrame(index=df["client_code"].astype("int64").to_numpy())
+    if "status" in strata:
+        keys["status"] = df["status"].fillna(MISSING).astype(str).to_numpy()
+    if "age" in strata:
+        age = pd.to_numeric(df["age"], errors="coerce").to_numpy()
+        keys["age"] = np.where(np.isnan(age), MISSING, np.searchsorted(AGE_BANDS, age, side="right").astype(str))
+    if "balance" in strata:
+        balance = pd.to_numeric(df["avg_monthly_balance_KZT"], errors="coerce")
+        bins = min(BALANCE_BINS, max(1, int(balance.notna().sum())))
+        decile = pd.qcut(balance.rank(method="first"), bins, labels=False) if bins > 1 else balance * 0
+        keys["balance"] = [MISSING if pd.isna(d) else str(int(d)) for d in decile]
+    if "category" in strata:
+        category = keys.index.to_series().map(categories if categories is not None else {})
+        keys["category"] = category.fillna(MISSING).astype(str).to_numpy()
+    return keys
+
+
+def stratify(keys: pd.DataFrame, size: int, min_quota: float = MIN_QUOTA) -> pd.Series:
+    """
+    client_code -> ключ страты "status|age|balance|category". Страты, где на выборку приходится
+    меньше min_quota клиентов, сливаются в более грубые: последний признак заменяется на "*",
+    затем предпоследний и т. д. — иначе при тысячах сочетаний выборка ушла бы на «по одному на страту».
+    """
+    columns = list(keys.columns)
+    if not columns:
+        return pd.Series("*", index=keys.index, name="stratum")
+    parts = keys.astype(str)
+    current = parts.agg("|".join, axis=1)
+    scale = size / max(1, len(keys))
+    for level in range(len(columns) - 1, -1, -1):
+        small = current.map(current.value_counts()).to_numpy() * scale < min_quota
+        if not small.any():
+            break
+        coarse = parts[columns[:level]].agg("|".join, axis=1) if level else pd.Series("", index=keys.index)
+        coarse = coarse + "|*" * (len(columns) - level) if level else pd.Series("*" + "|*" * (len(columns) - 1),
+                                                                              index=keys.index)
+        current = current.where(~small, coarse)
+    return current.rename("stratum")
+
+
+def allocate(population: pd.Series, size: int) -> pd.Series:
+    """Пропорциональное размещение size по стратам: не меньше 1 и не больше N_h, остаток — наибольшим дробным частям."""
+    size = min(size, int(population.sum()))
+    quota = population * size / population.sum()
+    n = np.minimum(np.maximum(np.floor(quota), 1), population).astype(int)
+    left = size - int(n.sum())
+    if left > 0:
+        order = (quota - np.floor(quota)).sort_values(ascending=False, kind="stable").index
+        for stratum in order:
+            if left <= 0:
+                break
+            if n[stratum] < population[stratum]:
+                n[stratum] += 1
+                left -= 1
+    return n
+
+
+@dataclass
+class Sample:
+    strata: pd.Series               # client_code -> страта, все клиенты популяции
+    codes: np.ndarray               # выбранные client_code
+    population: pd.Series           # страта -> N_h
+    sizes: pd.Series                # страта -> n_h
+    observed_span: float = 0.0      # период всей выгрузки в месяцах (features.DateRange), 0 — нет дат
+
+    def weights(self) -> pd.Series:
+        return self.population / self.population.sum()
+
+    def summary(self) -> dict:
+        return {"clients": int(self.population.sum()), "sampled": int(len(self.codes)),
+                "strata": int(len(self.population))}
+
+
+def select_sample(base_path: Path, size: int | float, seed: int = 0, strata=STRATA) -> Sample:
+    """size: int — число клиентов, float — доля (parse_size)."""
+    files = find_input_files(base_path)
+    clients_df = pd.concat([pd.read_csv(f) for f in files["clients"]], ignore_index=True)
+    dates = DateRange()
+    if "category" in strata:
+        categories = dominant_categories(files["transactions"], dates)
+    else:
+        categories = None
+        dates.add_files(files["transactions"])
+    dates.add_files(files["transfers"])
+    features = strata_of(clients_df, strata, categories)
+    total = len(features)
+    count = min(total, max(1, round(size * total)) if isinstance(size, float) else size)
+    keys = stratify(features, count)
+    population = keys.value_counts().sort_index()
+    sizes = allocate(population, count)
+
+    codes = keys.index.to_numpy()
+    rank = pd.DataFrame({"stratum": keys.to_numpy(), "hash": _hash(codes, seed), "code": codes}) \
+        .sort_values(["stratum", "hash", "code"], kind="stable")
+    position = rank.groupby("stratum").cumcount()
+    chosen = rank[position.to_numpy() < rank["stratum"].map(sizes).to_numpy()]["code"]
+    return Sample(strata=keys, codes=np.sort(chosen.to_numpy()), population=population, sizes=sizes,
+                  observed_span=dates.span)
+
+
+def _code_key(value: str) -> int | None:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return int(number) if number.is_integer() else None
+
+
+def filter_rows(files: list, codes: set) -> pd.DataFrame:
+    """
+    Строки файлов таблицы, чей client_code в codes; колонки — объединение заголовков
+    (как pd.concat в main.read_many_csv), индекс — номер строки во всей таблице.
+    Разбор типов pandas достаётся только выбранным строкам.
+    """
+    headers = []
+    for path in files:
+        with open(path, newline="", encoding="utf-8") as f:
+            headers.append(next(csv.reader(f), []))
+    columns = list(dict.fromkeys(c for header in headers for c in header))
+    buffer = io.StringIO()
+    out = csv.writer(buffer)
+    out.writerow([ROW_COLUMN, *columns])
+    keys: dict[str, int | None] = {}
+    row = 0
+    for path, header in zip(files, headers):
+        positions = None if header == columns else [header.index(c) if c in header else None for c in columns]
+        code = header.index("client_code") if "client_code" in header else None
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for record in reader:
+                if not record:
+                    continue
+                value = record[code] if code is not None and code < len(record) else ""
+                key = keys.get(value, -1)
+                if key == -1:
+                    key = keys[value] = _code_key(value)
+                if key in codes:
+                    if positions is not None:
+                        record = [record[i] if i is not None and i < len(record) else "" for i in positions]
+                    out.writerow([row, *record])
+                row += 1
+    buffer.seek(0)
+    df = pd.read_csv(buffer, index_col=ROW_COLUMN)
+    df.index.name = None
+    return df
+
+
+def read_sample(base_path: Path, sample: Sample) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """clients / transactions / transfers только выбранных клиентов — вход validate_frames."""
+    files = find_input_files(base_path)
+    codes = set(sample.codes.tolist())
+    return tuple(filter_rows(files[table], codes) for table in ("clients", "transactions", "transfers"))
+
+
+def first_labels(transactions_df: pd.DataFrame) -> pd.Series:
+    """Как check.load_labels (первый непустой продукт клиента), но по уже прочитанным строкам выборки."""
+    column = next((c for c in LABEL_COLUMNS if c in transactions_df.columns), None)
+    if column is None or transactions_df.empty:
+        return pd.Series(dtype=object)
+    labeled = transactions_df[_normalize(transactions_df[column]) != ""]
+    first = labeled.drop_duplicates("client_code")
+    codes = pd.to_numeric(first["client_code"], errors="coerce")
+    return pd.Series(first[column].to_numpy(), index=codes.to_numpy()).loc[lambda s: s.index.notna()]
+
+
+def _normalize(values) -> np.ndarray:
+    return np.array(["" if pd.isna(v) else str(v).strip().lower() for v in values], dtype=object)
+
+
+def stratified_share(sample: Sample, hits: pd.Series, confidence: float = CONFIDENCE) -> dict:
+    """
+    hits — client_code -> 0/1 для клиентов выборки из оцениваемого подмножества (домена):
+    клиенты с результатом, с меткой и т. п.; остальные не учитываются.
+    Оценка доли в домене популяции, её ошибка и доверительный интервал. Вес страты —
+    оценка числа клиентов домена в ней, N_h * m_h / n_h (m_h — клиентов домена в выборке).
+    """
+    frame = pd.DataFrame({"hit": hits.astype(float), "stratum": sample.strata.reindex(hits.index).to_numpy()})
+    stats = frame.groupby("stratum")["hit"].agg(["mean", "var", "count"])
+    population = sample.population.reindex(stats.index)
+    domain = population * stats["count"] / sample.sizes.reindex(stats.index)
+    weight = domain / domain.sum()
+    variance = stats["var"].fillna(0.0) / stats["count"] * (1 - stats["count"] / domain)
+    share = float((weight * stats["mean"]).sum())
+    error = math.sqrt(float((weight ** 2 * variance.clip(lower=0.0)).sum()))
+    half = _z(confidence) * error
+    return {"estimate": round(share, 4), "stderr": round(error, 4),
+            "low": round(max(0.0, share - half), 4), "high": round(min(1.0, share + half), 4),
+            "clients": int(round(share * float(domain.sum())))}
+
+
+def estimate(sample: Sample, result: list, labels: pd.Series | None = None,
+             confidence: float = CONFIDENCE) -> dict:
+    """Оценки на всю популяцию по строкам результата (client_code, product, push_notification)."""
+    products = pd.Series({int(code): product for code, product, _ in result}, dtype=object)
+    report = {**sample.summary(), "confidence": confidence, "products": {}}
+    if products.empty:
+        return report
+    for product in sorted(products.dropna().unique()):
+        report["products"][product] = stratified_share(sample, (products == product).astype(int), confidence)
+    if labels is not None and not labels.empty:
+        # клиенты без метки в точность не входят (как unlabeled в check.evaluate_results)
+        labels = labels[_normalize(labels) != ""]
+        common = products.index.intersection(labels.index)
+        if len(common):
+            hits = pd.Series(_normalize(products[common]) == _normalize(labels[common]), index=common)
+            report["accuracy"] = stratified_share(sample, hits.astype(int), confidence)
+    return report
+
+
+def print_estimate(report: dict):
+    level = f"{report['confidence']:.0%}"
+    print(f"Sample: {report['sampled']} of {report['clients']} clients in {report['strata']} strata; "
+          f"population estimates, {level} CI:")
+    for product, row in report["products"].items():
+        print(f"  {product}: {row['estimate']:.1%} [{row['low']:.1%}, {row['high']:.1%}] ~{row['clients']} clients")
+    if "accuracy" in report:
+        row = report["accuracy"]
+        print(f"  accuracy vs first-transaction product: {row['estimate']:.1%} [{row['low']:.1%}, {row['high']:.1%}]")
+
+
+def sample_report_path(output: Path) -> Path:
+    """result.csv -> result.sample.json"""
+    return Path(output).with_suffix(".sample.json")
+
+
+def write_estimate(report: dict, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
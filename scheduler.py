@@ -0,0 +1,116 @@
+"""
+Value-ordered LLM work for one run.
+
+LLM requests of a run (product picks of the "ai" branch, push texts) go
+through one priority queue instead of input order, so when the run deadline
+(llm.RUN_DEADLINE) or the token / cost budget (tokens.RUN_BUDGET) runs out, the
+clients left with deterministic texts are the least valuable ones.
+
+The priority of a client is
+
+    max(max_potential_profit, deposit profit_KZT) x product value
+
+with product value a weight per product from the optional "product_values"
+section of rules.json (1.0 for products not listed); before the product is
+known (product pick) the weight is 1.0. A finished task may queue a follow-up
+(product pick -> push text), which competes with the rest of the queue by its
+own priority. Ties keep input order. InOrder hands finished rows to the
+result writer in input order as soon as every earlier row is finished.
+"""
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from deposit import choose_deposit_product
+from rules import RULES
+
+PRODUCT_VALUES: dict[str, float] = {p: float(v) for p, v in RULES.config.get("product_values", {}).items()}
+
+
+def client_value(client) -> float:
+    """Выгода клиента в ₸: карта по тратам или депозит, что больше."""
+    deposit = choose_deposit_product(client)["profit_KZT"]
+    return max(float(client.max_potential_profit or 0.0), float(deposit))
+
+
+def priority(value: float, product: str | None = None) -> float:
+    return value * PRODUCT_VALUES.get(product, 1.0) if product else value
+
+
+class InOrder:
+    """
+    Буфер переупорядочивания: готовые строки приходят в порядке приоритета, в sink уходят
+    в порядке входа — как только готов очередной префикс (курсор next). Потокобезопасен.
+    """
+
+    def __init__(self, rows: list, sink=None):
+        self.rows = rows            # rows[i] — строка i или None, пока не готова
+        self.sink = sink
+        self.next = 0
+        self._lock = threading.Lock()
+
+    def put(self, i: int, row):
+        with self._lock:
+            self.rows[i] = row
+            while self.next < len(self.rows) and self.rows[self.next] is not None:
+                if self.sink is not None:
+                    self.sink(self.rows[self.next])
+                self.next += 1
+
+
+def run_by_priority(tasks, workers: int = 1) -> int:
+    """
+    tasks — (priority, task); task() возвращает None или следующую задачу (priority, task).
+    Выполняет всё, старшие приоритеты первыми, в workers потоках; возвращает число задач.
+    Исключение задачи останавливает раздачу и пробрасывается.
+    """
+    order = itertools.count()
+    heap = [(-p, next(order), task) for p, task in tasks]
+    heapq.heapify(heap)
+    done = 0
+
+    if workers <= 1:
+        while heap:
+            _, _, task = heapq.heappop(heap)
+            follow_up = task()
+            done += 1
+            if follow_up is not None:
+                heapq.heappush(heap, (-follow_up[0], next(order), follow_up[1]))
+        return done
+
+    ready = threading.Condition()
+    running = 0
+    failed: list[BaseException] = []
+
+    def worker():
+        nonlocal running, done
+        while True:
+            with ready:
+                # пустая очередь при работающих задачах — ждём их продолжений
+                while not heap and running and not failed:
+                    ready.wait()
+                if not heap or failed:
+                    ready.notify_all()
+                    return
+                _, _, task = heapq.heappop(heap)
+                running += 1
+            follow_up = None
+            try:
+                follow_up = task()
+            except BaseException as e:  # noqa: BLE001 — пробрасывается из run_by_priority
+                with ready:
+                    failed.append(e)
+            with ready:
+                running -= 1
+                done += 1
+                if follow_up is not None:
+                    heapq.heappush(heap, (-follow_up[0], next(order), follow_up[1]))
+                ready.notify_all()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-work") as pool:
+        for future in [pool.submit(worker) for _ in range(workers)]:
+            future.result()
+    if failed:
+        raise failed[0]
+    return done
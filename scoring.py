@@ -0,0 +1,257 @@
+"""
+Vectorized decide_product over precomputed feature matrices.
+
+FeatureMatrices holds everything the rules read (spend by rule category, KZT
+spend, transfer sums by type, FX deposit stats, profile columns) as arrays with
+one row per client, built once from a feature_store.FeatureStore. decide_all()
+runs transfers -> deposit -> transactions -> deterministic fallback for all
+clients with array operations, so a rule configuration is evaluated in
+milliseconds without re-running the pipeline (tuning, reports, what-if).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from deposit import MULTI, NAKOP, OBSERVED_MONTHS
+from rules import PROFILE_FIELDS, CompiledRules, transfer_column
+
+BRANCHES = ("transfers", "deposit", "transactions", "ai")
+
+
+def _first_label(client) -> str:
+    """Продукт первой транзакции клиента, как labels.npy в feature store."""
+    transactions = getattr(client, "transactions", None)
+    product = transactions[0].product if transactions else None
+    return product if isinstance(product, str) else ""
+
+
+@dataclass
+class FeatureMatrices:
+    client_codes: np.ndarray
+    category_names: list
+    type_names: list
+    categories: np.ndarray          # clients x categories, сырые суммы
+    categories_kzt: np.ndarray      # clients x categories, KZT
+    transfer_sums: np.ndarray       # clients x types, in + out
+    transfer_counts: np.ndarray     # clients x types
+    transfers_in: np.ndarray        # clients
+    transfers_out: np.ndarray       # clients
+    fx: np.ndarray                  # clients x 4: topup_cnt, topup_kzt, withdraw_cnt, withdraw_kzt
+    months: np.ndarray              # clients, период выгрузки (один на всех; 0 -> OBSERVED_MONTHS)
+    active_months: np.ndarray       # clients, активные месяцы клиента — только признак
+    profile: dict                   # поле профиля -> массив
+    labels: np.ndarray              # продукт первой транзакции ("" — нет метки)
+
+    @classmethod
+    def from_store(cls, store) -> "FeatureMatrices":
+        statuses = np.array(store.meta["statuses"] + [""], dtype=object)
+        status_codes = store.scalar("status").astype(int)
+        span = store.observed_span or OBSERVED_MONTHS
+        return cls(
+            client_codes=np.asarray(store.client_codes),
+            category_names=list(store.category_names),
+            type_names=list(store.type_names),
+            categories=np.asarray(store.categories),
+            categories_kzt=np.asarray(store.categories_kzt),
+            transfer_sums=np.asarray(store.transfers_in) + np.asarray(store.transfers_out),
+            transfer_counts=np.asarray(store.transfer_counts),
+            transfers_in=np.asarray(store.transfers_in).sum(axis=1),
+            transfers_out=np.asarray(store.transfers_out).sum(axis=1),
+            fx=np.column_stack([store.scalar(name) for name in
+                                ("fx_topup_count", "fx_topup_kzt", "fx_withdraw_count", "fx_withdraw_kzt")]),
+            months=np.full(len(store), span, dtype="float64"),
+            active_months=np.asarray(store.scalar("observed_months"), dtype="float64"),
+            profile={
+                "age": store.scalar("age"),
+                "avg_monthly_balance_KZT": store.scalar("avg_monthly_balance_KZT"),
+                "status": statuses[status_codes],       # -1 -> ""
+                "city": np.asarray(store.cities).astype(object),
+            },
+            labels=np.asarray(store.labels).astype(object),
+        )
+
+    @classmethod
+    def from_clients(cls, clients: list) -> "FeatureMatrices":
+        """
+        Те же матрицы из Client после client.calculations (или агрегатов aggregates.py):
+        ранжирование прямо в прогоне, без feature store.
+        """
+        from deposit import fx_transfer_stats, observed_months
+        from profits import spending_kzt_by_category
+
+        category_names = sorted({k for c in clients for k in c.totals_by_category})
+        types = [getattr(c, "transfer_types", None) or {tr.type for tr in c.transfers} for c in clients]
+        type_names = sorted({k for c in clients for k in getattr(c, "transfer_sums_by_type", {})}
+                            | set().union(*types))
+
+        def matrix(rows: list[dict], names: list) -> np.ndarray:
+            return np.array([[row.get(k, 0.0) for k in names] for row in rows],
+                            dtype="float64").reshape(len(rows), len(names))
+
+        return cls(
+            client_codes=np.array([c.client_code for c in clients], dtype="int64"),
+            category_names=category_names,
+            type_names=type_names,
+            categories=matrix([c.totals_by_category for c in clients], category_names),
+            categories_kzt=matrix([spending_kzt_by_category(c) for c in clients], category_names),
+            transfer_sums=matrix([getattr(c, "transfer_sums_by_type", {}) for c in clients], type_names),
+            transfer_counts=matrix([dict.fromkeys(t, 1.0) for t in types], type_names),
+            transfers_in=np.array([c.total_transfers_in for c in clients], dtype="float64"),
+            transfers_out=np.array([c.total_transfers_out for c in clients], dtype="float64"),
+            fx=np.array([fx_transfer_stats(c) for c in clients], dtype="float64").reshape(len(clients), 4),
+            months=np.array([observed_months(c) for c in clients], dtype="float64"),
+            active_months=np.array([c.features.observed_months if getattr(c, "features", None) else 0
+                                    for c in clients], dtype="float64"),
+            profile={
+                "age": np.array([c.age for c in clients]),
+                "avg_monthly_balance_KZT": np.array([c.avg_monthly_balance_KZT for c in clients]),
+                "status": np.array([c.status for c in clients], dtype=object),
+                "city": np.array([c.city for c in clients], dtype=object),
+            },
+            labels=np.array([_first_label(c) for c in clients], dtype=object),
+        )
+
+    def __len__(self) -> int:
+        return len(self.client_codes)
+
+    def subset(self, rows) -> "FeatureMatrices":
+        """Те же матрицы для части клиентов (rows — индексы или булева маска)."""
+        pick = lambda a: a[rows]  # noqa: E731
+        return FeatureMatrices(
+            client_codes=pick(self.client_codes), category_names=self.category_names, type_names=self.type_names,
+            categories=pick(self.categories), categories_kzt=pick(self.categories_kzt),
+            transfer_sums=pick(self.transfer_sums), transfer_counts=pick(self.transfer_counts),
+            transfers_in=pick(self.transfers_in), transfers_out=pick(self.transfers_out), fx=pick(self.fx),
+            months=pick(self.months), active_months=pick(self.active_months), profile={k: pick(v) for k, v in self.profile.items()},
+            labels=pick(self.labels),
+        )
+
+    def _columns_of(self, names: list, matrix: np.ndarray, wanted) -> np.ndarray:
+        index = {name: i for i, name in enumerate(names)}
+        out = np.zeros((len(self), len(wanted)))
+        for j, name in enumerate(wanted):
+            if name in index:
+                out[:, j] = matrix[:, index[name]]
+        return out
+
+    def rule_inputs(self, rules: CompiledRules) -> tuple:
+        """Аргументы для rules.select_card_products (как client._rule_inputs, но из матриц)."""
+        columns = {f: self.profile[f] for f in PROFILE_FIELDS}
+        counts = self._columns_of(self.type_names, self.transfer_counts, sorted(rules.transfer_types))
+        for j, ttype in enumerate(sorted(rules.transfer_types)):
+            columns[transfer_column(ttype)] = counts[:, j] > 0
+        return (
+            self._columns_of(self.category_names, self.categories, rules.categories),
+            self._columns_of(self.category_names, self.categories_kzt, rules.categories),
+            self.categories.sum(axis=1),
+            columns,
+            self.months,
+        )
+
+
+# --- ветки decide_product ---
+def transfer_scores(rules: CompiledRules, m: FeatureMatrices) -> np.ndarray:
+    """Суммы переводов по типам каждого transfer-продукта: clients x transfer_products."""
+    if not rules.transfer_products:
+        return np.zeros((len(m), 0))
+    return np.column_stack([
+        m._columns_of(m.type_names, m.transfer_sums, types).sum(axis=1)
+        for types in rules.transfer_products.values()
+    ])
+
+
+def transfer_branch(rules: CompiledRules, m: FeatureMatrices) -> tuple[np.ndarray, np.ndarray]:
+    """(индекс продукта в rules.transfer_products или -1, score) — recommend_product_by_transfers."""
+    if not rules.transfer_products:
+        return np.full(len(m), -1), np.zeros(len(m))
+    scores = transfer_scores(rules, m)
+    best = scores.argmax(axis=1)
+    value = scores[np.arange(len(m)), best]
+    return np.where(value > 0, best, -1), value
+
+
+def deposit_scores(rules: CompiledRules, m: FeatureMatrices) -> dict[str, tuple]:
+    """{депозит: (подходит по правилу, прибыль за период, уверенность)} — до выбора победителя."""
+    balance = m.profile["avg_monthly_balance_KZT"]
+    nakop, multi = rules.deposits[NAKOP], rules.deposits[MULTI]
+
+    threshold = nakop["min_balance"]
+    conf = nakop["confidence"]
+    nakop_ok = balance > threshold
+    nakop_profit = balance * (nakop["rate"] / 12.0) * m.months
+    nakop_conf = np.minimum(conf["cap"], conf["base"] + np.minimum(
+        conf["max_bonus"], (balance - threshold) / threshold * conf["max_bonus"]))
+
+    topup_cnt, topup_kzt, withdraw_cnt, withdraw_kzt = m.fx.T
+    conf = multi["confidence"]
+    multi_ok = (topup_cnt > 0) & (withdraw_cnt > 0)
+    multi_profit = np.maximum(0.0, topup_kzt - withdraw_kzt * multi["withdraw_factor"]) * (multi["rate"] / 12.0) * m.months
+    multi_conf = np.minimum(conf["cap"], conf["base"] + np.minimum(
+        conf["max_bonus"], topup_cnt / conf["topups_for_max_bonus"] * conf["max_bonus"]))
+    return {NAKOP: (nakop_ok, nakop_profit, nakop_conf), MULTI: (multi_ok, multi_profit, multi_conf)}
+
+
+def deposit_branch(rules: CompiledRules, m: FeatureMatrices, scores: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (продукт или None, уверенность) — deposit.choose_deposit_product + порог min_confidence.
+    Уверенность округляется до 3 знаков, как в choose_deposit_product.
+    """
+    multi_wins, passed, confidence = deposit_choice(rules, scores or deposit_scores(rules, m))
+    product = np.where(multi_wins, MULTI, NAKOP).astype(object)
+    return np.where(passed, product, None), np.where(passed, confidence, 0.0)
+
+
+def deposit_choice(rules: CompiledRules, scores: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(выиграл Мультивалютный, победитель прошёл min_confidence, уверенность победителя) по deposit_scores."""
+    nakop_ok, nakop_profit, nakop_conf = scores[NAKOP]
+    multi_ok, multi_profit, multi_conf = scores[MULTI]
+
+    # при равенстве (прибыль, уверенность) выигрывает Накопительный — как стабильная сортировка
+    multi_wins = multi_ok & (~nakop_ok | (multi_profit > nakop_profit)
+                             | ((multi_profit == nakop_profit) & (multi_conf > nakop_conf)))
+    confidence = np.round(np.where(multi_wins, multi_conf, np.where(nakop_ok, nakop_conf, 0.0)), 3)
+    passed = (multi_wins | nakop_ok) & (confidence >= rules.deposit_min_confidence)
+    return multi_wins, passed, confidence
+
+
+def fallback_products(rules: CompiledRules, m: FeatureMatrices) -> np.ndarray:
+    """ai_client.fallback_recomended_product для всех клиентов."""
+    balance = m.profile["avg_monthly_balance_KZT"]
+    savings = (balance < rules.fallback["savings_max_balance"]) | (m.profile["age"] > rules.fallback["savings_min_age"])
+    return np.select(
+        [m.transfers_out > m.transfers_in + balance, savings],
+        ["Кредит наличными", "Депозит Сберегательный"],
+        "Депозит Накопительный",
+    ).astype(object)
+
+
+def card_branch(rules: CompiledRules, m: FeatureMatrices, inputs: tuple | None = None) -> tuple[np.ndarray, np.ndarray]:
+    best, profit = rules.select_card_products(*(inputs or m.rule_inputs(rules)))
+    names = np.array(rules.card_products + [None], dtype=object)
+    return names[best], profit          # -1 -> None
+
+
+def decide_all(rules: CompiledRules, m: FeatureMatrices, with_fallback: bool = True,
+               card: tuple | None = None, deposit: tuple | None = None,
+               transfers: tuple | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (product, branch, score) для всех клиентов, как client.decide_product.
+    Ветка "ai" получает детерминированный fallback (with_fallback) или None.
+    card/deposit/transfers — уже посчитанные ветки (тюнинг пересчитывает только изменённые).
+    """
+    tr_idx, tr_score = transfers or transfer_branch(rules, m)
+    dep_product, dep_conf = deposit or deposit_branch(rules, m)
+    card_product, card_profit = card or card_branch(rules, m)
+
+    tr_names = np.array(list(rules.transfer_products) + [None], dtype=object)[tr_idx]
+    has_tr = tr_idx >= 0
+    has_dep = ~has_tr & (dep_product != None)                     # noqa: E711
+    has_card = ~has_tr & ~has_dep & (card_product != None)        # noqa: E711
+    branch = np.select([has_tr, has_dep, has_card], BRANCHES[:3], BRANCHES[3]).astype(object)
+    product = np.select(
+        [has_tr, has_dep, has_card],
+        [tr_names, dep_product, card_product],
+        fallback_products(rules, m) if with_fallback else None,
+    ).astype(object)
+    score = np.select([has_tr, has_dep, has_card], [tr_score, dep_conf, card_profit], 0.0)
+    return product, branch, score
@@ -0,0 +1,219 @@
+"""
+Online scoring service for single clients.
+
+Loads precomputed aggregates (main.py aggregates) into memory and answers
+choose_best_product-equivalent decisions without the LLM:
+  GET  /clients/<code>/recommendation[?push=1]
+  POST /clients/<code>/events   {"transactions": [...], "transfers": [...]}
+  GET  /health, GET /stats
+Clients that fall through to the AI branch get the cached product from the
+last batch run, or the deterministic fallback from ai_client.
+"""
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from ai_client import fallback_recomended_product
+from aggregates import ClientAggregates
+from deposit import DEFAULT_FX_RATES_TO_KZT, FX_TOPUP_TYPE, FX_WITHDRAW_TYPE, to_kzt
+
+
+def _amount(value) -> float:
+    amount = float(value)
+    if not math.isfinite(amount):
+        raise ValueError(f"amount is not finite: {value!r}")
+    return amount
+
+
+def parse_events(transactions: list[dict], transfers: list[dict]) -> tuple[list[tuple], list[tuple]]:
+    """Аргументы apply_transaction / apply_transfer для всех событий; валюта FX-переводов проверяется здесь же."""
+    tx_args = [(tx["category"], _amount(tx["amount"]), tx.get("currency", "KZT")) for tx in transactions]
+    tr_args = [(tr["type"], tr["direction"], _amount(tr["amount"]), tr.get("currency", "KZT")) for tr in transfers]
+    for type_, _, amount, currency in tr_args:
+        if type_ in (FX_TOPUP_TYPE, FX_WITHDRAW_TYPE):
+            to_kzt(amount, currency, DEFAULT_FX_RATES_TO_KZT)
+    return tx_args, tr_args
+
+
+class ScoringService:
+    def __init__(self, index: dict[int, ClientAggregates], lock=None):
+        self.index = index
+        self._decisions: dict[int, dict] = {}
+        # общий lock с тем, кто ещё меняет агрегаты (например, stream.StreamState)
+        self._lock = lock or threading.Lock()
+        self._latencies = deque(maxlen=10_000)
+
+    def _decide(self, agg: ClientAggregates) -> dict:
+        product, branch, score = agg.decide()
+        if branch == "ai":
+            cached_product = agg.cached_push[0] if agg.cached_push else None
+            if cached_product:
+                product, branch = cached_product, "cached"
+            else:
+                product, score = fallback_recomended_product(agg)
+                branch = "fallback"
+        return {
+            "client_code": agg.client_code,
+            "product": product,
+            "branch": branch,
+            "score": score,
+            "max_potential_profit": round(agg.max_potential_profit, 2),
+        }
+
+    def recommendation(self, code: int, with_push: bool = False) -> dict | None:
+        decision = self._decisions.get(code)
+        if decision is None:
+            agg = self.index.get(code)
+            if agg is None:
+                return None
+            with self._lock:
+                decision = self._decide(agg)
+                self._decisions[code] = decision
+
+        if not with_push:
+            return decision
+        agg = self.index[code]
+        push = agg.cached_push[1] if agg.cached_push and agg.cached_push[0] == decision["product"] else None
+        return {**decision, "push_notification": push}
+
+    def apply_events(self, code: int, transactions: list[dict], transfers: list[dict]) -> dict | None:
+        """
+        Все события сначала разбираются (parse_events); ошибка в любом — ValueError/KeyError/TypeError
+        без изменений агрегатов, так что повтор запроса клиентом ничего не задвоит.
+        """
+        agg = self.index.get(code)
+        if agg is None:
+            return None
+        tx_args, tr_args = parse_events(transactions, transfers)
+        with self._lock:
+            try:
+                for args in tx_args:
+                    agg.apply_transaction(*args)
+                for args in tr_args:
+                    agg.apply_transfer(*args)
+            finally:
+                self._decisions.pop(code, None)
+        return self.recommendation(code)
+
+    def invalidate(self, code: int):
+        """Сбрасывает закэшированное решение; вызывается тем, кто уже держит lock."""
+        self._decisions.pop(code, None)
+
+    def record_latency(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self._latencies)
+        if not samples:
+            return {"requests": 0, "clients": len(self.index)}
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+        return {"requests": len(samples), "clients": len(self.index), "p50_ms": pick(0.50), "p99_ms": pick(0.99)}
+
+
+def make_handler(service: ScoringService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # заголовки и тело уходят двумя write — без TCP_NODELAY keep-alive ждёт delayed ACK (~40 мс)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _client_code(self, parts: list[str]) -> int | None:
+            if len(parts) == 3 and parts[0] == "clients":
+                try:
+                    return int(parts[1])
+                except ValueError:
+                    return None
+            return None
+
+        def do_GET(self):
+            started = time.perf_counter()
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+
+            if parts == ["health"]:
+                self._send_json(200, {"status": "ok", "clients": len(service.index)})
+                return
+            if parts == ["stats"]:
+                self._send_json(200, service.stats())
+                return
+
+            code = self._client_code(parts)
+            if code is None or parts[2] != "recommendation":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            with_push = parse_qs(url.query).get("push", ["0"])[0] in ("1", "true")
+            decision = service.recommendation(code, with_push=with_push)
+            if decision is None:
+                self._send_json(404, {"error": f"unknown client_code {code}"})
+            else:
+                self._send_json(200, decision)
+            service.record_latency(time.perf_counter() - started)
+
+        def do_POST(self):
+            started = time.perf_counter()
+            parts = [p for p in urlparse(self.path).path.split("/") if p]
+            code = self._client_code(parts)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+
+            if code is None or parts[2] != "events":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                body = json.loads(raw)
+                if not isinstance(body, dict):
+                    raise ValueError("body must be a JSON object")
+                decision = service.apply_events(code, body.get("transactions", []), body.get("transfers", []))
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"invalid events: {e}"})
+                return
+            if decision is None:
+                self._send_json(404, {"error": f"unknown client_code {code}"})
+            else:
+                self._send_json(200, decision)
+            service.record_latency(time.perf_counter() - started)
+
+    return Handler
+
+
+def make_server(service: ScoringService, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+def serve(index: dict[int, ClientAggregates], host: str = "127.0.0.1", port: int = 8080):
+    service = ScoringService(index)
+    # прогрев: решения считаются заранее, запрос — это поиск в dict
+    for code in index:
+        service.recommendation(code)
+    server = make_server(service, host, port)
+    print(f"Scoring service on http://{host}:{port} ({len(index)} clients)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def serve_in_background(service: ScoringService, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    server = make_server(service, host, port)
+    threading.Thread(target=server.serve_forever, name="scoring-http", daemon=True).start()
+    print(f"Scoring service on http://{host}:{port} ({len(service.index)} clients)")
+    return server
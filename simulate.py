@@ -0,0 +1,268 @@
+"""
+What-if simulator over product economics: deposit rates and thresholds, card cashback.
+
+Scenarios are a grid over rules.json paths, in the same format as tuning.py:
+    {"deposits.Депозит Накопительный.rate": [0.12, 0.13, 0.14],
+     "deposits.Депозит Накопительный.min_balance": {"start": 500000, "stop": 1500000, "step": 250000},
+     "card_products.Карта для путешествий.cashback": [0.03, 0.04, 0.05]}
+Deposit parameters and card parameters do not affect each other's branch, so the
+grid is split into a deposit sub-grid (D scenarios) and a card sub-grid (C
+scenarios). Over a chunk of clients each sub-scenario is decided once. All D x C
+combinations then come from matrix products: (D x clients) "fell through to
+cards" @ (clients x C) "card/fallback product is p". The cost grows like
+D + C, not D x C, and the products run in BLAS.
+
+Per scenario: recommended-product counts, clients whose recommendation differs
+from rules.json, and the projected monthly benefit of rule recommendations.
+That benefit is deposit interest per month for deposits and cashback per month
+for cards; transfer products and the fallback have no modeled benefit.
+"""
+import copy
+import csv
+import itertools
+import time
+
+import numpy as np
+
+from deposit import MULTI, NAKOP
+from rules import CompiledRules
+from scoring import FeatureMatrices, deposit_choice, deposit_scores, fallback_products, transfer_branch
+from tuning import check_scalar_param, grid_values, set_param
+
+DEPOSIT_SECTIONS = ("deposits",)
+CARD_SECTIONS = ("card_products", "threshold_bounds")
+CHUNK_SIZE = 65_536
+
+
+def _sub_grid(base_config: dict, grid: dict, sections: tuple) -> list[tuple[dict, CompiledRules]]:
+    """[(параметры, правила)] — все комбинации параметров grid из этих разделов конфига."""
+    paths = [p for p in grid if p.split(".")[0] in sections]
+    scenarios = []
+    for values in itertools.product(*(grid_values(grid[p]) for p in paths)):
+        params = dict(zip(paths, values))
+        config = copy.deepcopy(base_config)
+        for path, value in params.items():
+            set_param(config, path, value)
+        scenarios.append((params, CompiledRules(config)))
+    return scenarios
+
+
+class Simulator:
+    def __init__(self, base_config: dict, matrices: FeatureMatrices, chunk_size: int = CHUNK_SIZE):
+        self.m = matrices
+        self.base_config = base_config
+        self.base = CompiledRules(base_config)
+        self.products = list(self.base.product_categories)
+        self.column = {p: j for j, p in enumerate(self.products)}
+        self.chunk_size = chunk_size
+
+    # --- решения на части клиентов ---
+    def _deposits(self, rules: CompiledRules, m: FeatureMatrices) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(депозит прошёл, колонка продукта, выгода в месяц) для одного сценария."""
+        scores = deposit_scores(rules, m)
+        multi_wins, passed, _ = deposit_choice(rules, scores)
+        product = np.where(multi_wins, self.column[MULTI], self.column[NAKOP])
+        benefit = np.where(multi_wins, scores[MULTI][1], scores[NAKOP][1]) / m.months
+        return passed, product, np.where(passed, benefit, 0.0)
+
+    def _cards(self, rules: CompiledRules, cashback: np.ndarray, share_ok: np.ndarray, spend_kzt: np.ndarray,
+               months: np.ndarray, fallback: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(колонка карты или fallback-продукта, выгода в месяц) для одного сценария."""
+        if not rules.card_products:
+            return fallback, np.zeros(len(months))
+        profit = spend_kzt * cashback / months[:, None]
+        ranked = np.where(share_ok & (profit > 0), profit, -np.inf)
+        best = ranked.argmax(axis=1)
+        value = ranked[np.arange(len(months)), best]
+        found = np.isfinite(value)
+        cards = np.array([self.column[p] for p in rules.card_products])
+        return np.where(found, cards[best], fallback), np.where(found, value, 0.0)
+
+    def _card_totals(self, through: np.ndarray, groups: list, months: np.ndarray, fallback: np.ndarray,
+                     baseline: np.ndarray, n_scenarios: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        counts (D x C x products), benefit (D x C), same (D x C) для клиентов, дошедших до карт.
+        Клиент без карт над порогом получает fallback в любом сценарии, с одной такой картой —
+        её при кэшбэке > 0 (выгода линейна по кэшбэку); их вклад — пара матричных произведений
+        на всю группу сценариев. Поштучный argmax — только для клиентов с несколькими картами.
+        """
+        n_products = len(self.products)
+        counts = np.zeros((len(through), n_scenarios, n_products))
+        benefit = np.zeros((len(through), n_scenarios))
+        same = np.zeros((len(through), n_scenarios))
+        fb_onehot = np.eye(n_products, dtype="float32")[fallback]
+        fb_same = (fallback == baseline).astype("float32")
+        through32 = through.astype("float32")
+
+        for rules, share_ok, spend_kzt, members in groups:
+            scenarios = [c for c, _ in members]
+            if not rules.card_products:
+                counts[:, scenarios] += (through32 @ fb_onehot)[:, None, :]
+                same[:, scenarios] += (through32 @ fb_same)[:, None]
+                continue
+            cards = np.array([self.column[p] for p in rules.card_products])
+            eligible = share_ok & (spend_kzt > 0)
+            n_eligible = eligible.sum(axis=1)
+
+            rows = n_eligible == 0
+            counts[:, scenarios] += (through32[:, rows] @ fb_onehot[rows])[:, None, :]
+            same[:, scenarios] += (through32[:, rows] @ fb_same[rows])[:, None]
+
+            rows = n_eligible == 1
+            one = eligible[rows].astype("float32")                      # clients x cards группы
+            t = through32[:, rows]
+            to_card = t @ one                                            # D x cards
+            to_fallback = [t @ (fb_onehot[rows] * one[:, [j]]) for j in range(len(cards))]
+            monthly = through[:, rows] @ (eligible[rows] * spend_kzt[rows] / months[rows, None])
+            same_card = t @ (one * (cards[None, :] == baseline[rows, None]))
+            same_fallback = t @ (one * fb_same[rows, None])
+            for c, cashback in members:
+                on = cashback > 0
+                for j, column in enumerate(cards):
+                    if on[j]:
+                        counts[:, c, column] += to_card[:, j]
+                    else:
+                        counts[:, c] += to_fallback[j]
+                benefit[:, c] += monthly @ np.where(on, cashback, 0.0)
+                same[:, c] += same_card @ on + same_fallback @ ~on
+
+            rows = n_eligible > 1
+            if rows.any():
+                t, t32 = through[:, rows], through32[:, rows]
+                product = np.empty((len(members), np.count_nonzero(rows)), dtype="int64")
+                value = np.empty(product.shape)
+                for i, (c, cashback) in enumerate(members):
+                    product[i], value[i] = self._cards(rules, cashback, share_ok[rows], spend_kzt[rows],
+                                                       months[rows], fallback[rows])
+                for p in np.flatnonzero(np.bincount(product.ravel(), minlength=n_products)):
+                    counts[:, scenarios, p] += t32 @ (product == p).astype("float32").T
+                benefit[:, scenarios] += t @ value.T
+                same[:, scenarios] += t32 @ (product == baseline[rows]).astype("float32").T
+        return counts, benefit, same
+
+    def _chunk(self, m: FeatureMatrices, deposit_grid: list, card_grid: list) -> dict:
+        totals, totals_kzt, total, columns, months = m.rule_inputs(self.base)
+        fallback = np.array([self.column[p] for p in fallback_products(self.base, m)], dtype="int64").reshape(len(m))
+
+        tr_idx, _ = transfer_branch(self.base, m)
+        tr_columns = np.array([self.column[p] for p in self.base.transfer_products] + [-1])
+        has_tr = tr_idx >= 0
+        rest = ~has_tr
+
+        # базовое решение (rules.json) — для «сколько клиентов сменили рекомендацию»
+        base_passed, base_dep, _ = self._deposits(self.base, m)
+        base_spend = self.base.spend_by_product(totals_kzt)
+        base_card, _ = self._cards(self.base, self.base.cashback, self.base.share_passes(totals, total, columns),
+                                   base_spend, months, fallback)
+        baseline = np.where(has_tr, tr_columns[tr_idx], np.where(base_passed, base_dep, base_card))
+
+        # депозитная подсетка: D x clients
+        through = np.empty((len(deposit_grid), len(m)))
+        dep_counts = np.zeros((len(deposit_grid), len(self.products)))
+        dep_benefit = np.zeros(len(deposit_grid))
+        dep_same = np.zeros(len(deposit_grid))
+        for d, (_, rules) in enumerate(deposit_grid):
+            passed, product, benefit = self._deposits(rules, m)
+            chosen = passed & rest
+            through[d] = rest & ~passed
+            dep_counts[d] = np.bincount(product[chosen], minlength=len(self.products))
+            dep_benefit[d] = benefit[chosen].sum()
+            dep_same[d] = np.count_nonzero(chosen & (product == baseline))
+
+        # карточная подсетка группируется по всему, кроме кэшбэков: порог доли и траты в KZT
+        # считаются на группу один раз
+        groups: dict[tuple, tuple] = {}
+        for c, (params, rules) in enumerate(card_grid):
+            key = tuple((p, v) for p, v in params.items() if not p.endswith(".cashback"))
+            if key not in groups:
+                same_layout = (rules.categories, rules.product_columns) == (self.base.categories, self.base.product_columns)
+                spend = base_spend if same_layout else rules.spend_by_product(totals_kzt)
+                groups[key] = (rules, rules.share_passes(totals, total, columns), spend, [])
+            groups[key][3].append((c, rules.cashback))
+        card_counts, card_benefit, card_same = self._card_totals(
+            through, list(groups.values()), months, fallback, baseline, len(card_grid))
+
+        return {
+            "counts": np.bincount(tr_columns[tr_idx[has_tr]], minlength=len(self.products))[None, None, :]
+                      + dep_counts[:, None, :] + card_counts,
+            "benefit": dep_benefit[:, None] + card_benefit,
+            "same": np.count_nonzero(has_tr) + dep_same[:, None] + card_same,
+        }
+
+    def run(self, grid: dict) -> list[dict]:
+        """Все комбинации grid (порядок — как в grid), каждая с counts / benefit / changed."""
+        for path in grid:
+            if path.split(".")[0] not in DEPOSIT_SECTIONS + CARD_SECTIONS:
+                raise KeyError(f"Параметр {path!r} вне разделов симулятора {sorted(DEPOSIT_SECTIONS + CARD_SECTIONS)}")
+            check_scalar_param(self.base_config, path, grid[path])
+        deposit_grid = _sub_grid(self.base_config, grid, DEPOSIT_SECTIONS)
+        card_grid = _sub_grid(self.base_config, grid, CARD_SECTIONS)
+
+        totals = None
+        for start in range(0, len(self.m), self.chunk_size):
+            part = self._chunk(self.m.subset(slice(start, start + self.chunk_size)), deposit_grid, card_grid)
+            totals = part if totals is None else {k: totals[k] + part[k] for k in totals}
+        if totals is None:  # нет клиентов
+            totals = {"counts": np.zeros((len(deposit_grid), len(card_grid), len(self.products))),
+                      "benefit": np.zeros((len(deposit_grid), len(card_grid))),
+                      "same": np.zeros((len(deposit_grid), len(card_grid)))}
+
+        deposit_index = {tuple(params.values()): d for d, (params, _) in enumerate(deposit_grid)}
+        card_index = {tuple(params.values()): c for c, (params, _) in enumerate(card_grid)}
+        paths = list(grid)
+        results = []
+        for values in itertools.product(*(grid_values(grid[p]) for p in paths)):
+            params = dict(zip(paths, values))
+            d = deposit_index[tuple(v for p, v in params.items() if p.split(".")[0] in DEPOSIT_SECTIONS)]
+            c = card_index[tuple(v for p, v in params.items() if p.split(".")[0] in CARD_SECTIONS)]
+            results.append({
+                "params": params,
+                "counts": {p: int(round(n)) for p, n in zip(self.products, totals["counts"][d, c]) if round(n)},
+                "benefit": float(totals["benefit"][d, c]),
+                "changed": len(self.m) - int(round(totals["same"][d, c])),
+            })
+        return results
+
+
+def save_results(results: list[dict], products: list, filename: str):
+    paths = list(results[0]["params"]) if results else []
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(paths + ["benefit", "changed"] + [f"count:{p}" for p in products])
+        for r in results:
+            writer.writerow(
+                [r["params"][p] for p in paths]
+                + [round(r["benefit"], 2), r["changed"]]
+                + [r["counts"].get(p, 0) for p in products]
+            )
+
+
+def print_report(baseline: dict, results: list[dict], clients: int, top: int = 10):
+    print(f"Baseline (rules.json): benefit {baseline['benefit']:,.0f} ₸/month over {clients} clients")
+    ranked = sorted(results, key=lambda r: -r["benefit"])
+    print(f"Top {min(top, len(ranked))} of {len(ranked)} scenarios by projected benefit:")
+    for r in ranked[:top]:
+        params = ", ".join(f"{path.split('.', 1)[-1]}={value}" for path, value in r["params"].items())
+        delta = r["benefit"] - baseline["benefit"]
+        print(f"  {r['benefit']:>16,.0f} ({delta:+,.0f})  changed {r['changed']:>7}  {params}")
+
+    if ranked:
+        best = ranked[0]["counts"]
+        products = sorted(set(baseline["counts"]) | set(best), key=lambda p: -baseline["counts"].get(p, 0))
+        print(f"\n{'product':<28}{'baseline':>10}{'best':>10}")
+        for product in products:
+            print(f"{product:<28}{baseline['counts'].get(product, 0):>10}{best.get(product, 0):>10}")
+
+
+def run_simulation(store, base_config: dict, grid: dict, top: int = 10, output: str | None = None) -> list[dict]:
+    started = time.perf_counter()
+    simulator = Simulator(base_config, FeatureMatrices.from_store(store))
+    baseline = simulator.run({})[0]
+    results = simulator.run(grid)
+    elapsed = time.perf_counter() - started
+
+    print_report(baseline, results, len(simulator.m), top)
+    print(f"\n{len(results)} scenarios on {len(simulator.m)} clients in {elapsed:.2f} s")
+    if output:
+        save_results(results, simulator.products, output)
+    return results
@@ -0,0 +1,295 @@
+"""
+Streaming ingestion: tails append-only transactions/transfers CSVs (local stand-in
+for the event bus) and keeps per-client aggregates over a sliding window of
+calendar months based on the `date` column.
+
+Each event updates its month bucket and the window total in O(1); when the
+watermark (latest event month) moves, expired buckets are subtracted from the
+window. Profits are counted over the observed span of the window, like the
+batch run (features.FeatureCache.observed_span): from the first event day (not
+earlier than the window start) to the last one, in months of 30.44 days; it is
+set on every window aggregate whenever it changes. State is periodically snapshotted to disk and restored on restart;
+decisions can be re-scored at any time from the live window aggregates.
+"""
+import csv
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from pathlib import Path
+
+from aggregates import ClientAggregates
+from deposit import DEFAULT_FX_RATES_TO_KZT, FX_TOPUP_TYPE, FX_WITHDRAW_TYPE, to_kzt
+from features import DAYS_PER_MONTH
+
+WINDOW_MONTHS = 3
+
+
+def month_key(date: str) -> int:
+    """'2025-06-01 10:00:00' -> порядковый номер месяца (год * 12 + месяц - 1)."""
+    year, month = int(date[0:4]), int(date[5:7])
+    if not 1 <= month <= 12:
+        raise ValueError(f"bad month in date {date!r}")
+    return year * 12 + month - 1
+
+
+def _parse_event(row: dict) -> tuple[int, int, date, float, str]:
+    """(client_code, месяц, день, amount, currency) строки события; ValueError/KeyError — строка битая."""
+    code = int(row["client_code"])
+    month = month_key(row["date"])
+    day = date.fromisoformat(row["date"][:10])
+    amount = float(row["amount"])
+    if not math.isfinite(amount):
+        raise ValueError(f"amount is not finite: {row['amount']!r}")
+    return code, month, day, amount, row.get("currency") or "KZT"
+
+
+def month_label(key: int) -> str:
+    return f"{key // 12:04d}-{key % 12 + 1:02d}"
+
+
+class TailReader:
+    """Читает из CSV только дописанные с прошлого раза полные строки."""
+
+    def __init__(self, path: Path, offset: int = 0, header: list[str] | None = None):
+        self.path = path
+        self.offset = offset
+        self.header = header
+
+    def read_new(self) -> list[dict]:
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1  # незавершённую строку оставляем на следующий раз
+        if end == 0:
+            return []
+        self.offset += end
+        lines = chunk[:end].decode("utf-8").splitlines()
+
+        if self.header is None:
+            self.header = next(csv.reader(lines[:1]))
+            lines = lines[1:]
+        return [dict(zip(self.header, row)) for row in csv.reader(lines) if row]
+
+
+class StreamState:
+    def __init__(self, profiles: dict[int, ClientAggregates], window_months: int = WINDOW_MONTHS):
+        self.window_months = window_months
+        self.windows = profiles                                   # client_code -> агрегаты окна
+        self.buckets: dict[int, dict[int, ClientAggregates]] = defaultdict(dict)
+        self.clients_by_month: dict[int, set] = defaultdict(set)
+        self.watermark: int | None = None
+        self.first_day: date | None = None                        # самый ранний и самый поздний день событий
+        self.last_day: date | None = None
+        self.observed_span: float | None = None                   # период окна в месяцах, см. _set_span
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.on_update = None                                     # callback(client_code)
+
+    # --- окно ---
+    def _window_start(self) -> int | None:
+        return None if self.watermark is None else self.watermark - self.window_months + 1
+
+    def _advance(self, month: int):
+        if self.watermark is not None and month <= self.watermark:
+            return
+        self.watermark = month
+        start = self._window_start()
+        for old in [m for m in self.clients_by_month if m < start]:
+            for code in self.clients_by_month.pop(old):
+                bucket = self.buckets[code].pop(old)
+                self.windows[code].merge(bucket, sign=-1)
+                if self.on_update:
+                    self.on_update(code)
+            self.stats["expired_months"] += 1
+
+    def _observe(self, day: date):
+        # новый месяц watermark всегда приходит с новым последним днём — сдвиг начала окна учтён здесь же
+        if self.first_day is not None and self.first_day <= day <= self.last_day:
+            return
+        self.first_day = day if self.first_day is None else min(self.first_day, day)
+        self.last_day = day if self.last_day is None else max(self.last_day, day)
+        self._set_span()
+
+    def _set_span(self):
+        """Период окна как у batch-прогона: дни от первого события (не раньше начала окна) до последнего / 30.44."""
+        start = self._window_start()
+        first = max(self.first_day, date(start // 12, start % 12 + 1, 1))
+        span = ((self.last_day - first).days + 1) / DAYS_PER_MONTH
+        if span != self.observed_span:
+            self.observed_span = span
+            for code, window in self.windows.items():
+                window.observed_months = span
+                if self.on_update:
+                    self.on_update(code)    # прибыль и пуш в кэше сервиса посчитаны по старому периоду
+
+    def _bucket(self, code: int, month: int) -> ClientAggregates | None:
+        window = self.windows.get(code)
+        if window is None:
+            self.stats["orphan_events"] += 1
+            return None
+        self._advance(month)
+        if month < self._window_start():
+            self.stats["late_events"] += 1
+            return None
+        bucket = self.buckets[code].get(month)
+        if bucket is None:
+            bucket = self.buckets[code][month] = window.empty_like()
+            self.clients_by_month[month].add(code)
+        return bucket
+
+    # --- события ---
+    # Строка сначала целиком разбирается (код, месяц, сумма, валюта, пересчёт в KZT) и только потом
+    # двигает watermark и попадает в корзину и окно: битая строка не должна менять ни то, ни другое.
+    def apply_transaction(self, row: dict):
+        code, month, day, amount, currency = _parse_event(row)
+        args = (row["category"], amount, currency)
+        self._apply(code, month, day, lambda agg: agg.apply_transaction(*args), "transactions")
+
+    def apply_transfer(self, row: dict):
+        code, month, day, amount, currency = _parse_event(row)
+        args = (row["type"], row["direction"], amount, currency)
+        if args[0] in (FX_TOPUP_TYPE, FX_WITHDRAW_TYPE):
+            to_kzt(amount, currency, DEFAULT_FX_RATES_TO_KZT)   # неизвестная валюта -> ValueError до изменений
+        self._apply(code, month, day, lambda agg: agg.apply_transfer(*args), "transfers")
+
+    def _apply(self, code: int, month: int, day: date, apply, kind: str):
+        bucket = self._bucket(code, month)
+        if bucket is None:
+            return
+        self._observe(day)
+        apply(bucket)
+        apply(self.windows[code])
+        self.stats[kind] += 1
+        if self.on_update:
+            self.on_update(code)
+
+    # --- скоринг ---
+    def rescore(self, codes=None) -> list[tuple]:
+        """(client_code, product, branch, score) по текущему окну; без полной перезагрузки."""
+        with self.lock:
+            return [(code, *self.windows[code].decide()) for code in (codes or self.windows)]
+
+    # --- снапшоты ---
+    def to_dict(self) -> dict:
+        return {
+            "window_months": self.window_months,
+            "watermark": self.watermark,
+            "days": [self.first_day.isoformat(), self.last_day.isoformat()] if self.first_day else None,
+            "profiles": {code: agg.empty_like().to_dict() for code, agg in self.windows.items()},
+            "buckets": {
+                code: {month: bucket.to_dict() for month, bucket in months.items()}
+                for code, months in self.buckets.items() if months
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StreamState":
+        profiles = {int(code): ClientAggregates.from_dict(p) for code, p in data["profiles"].items()}
+        state = cls(profiles, window_months=data["window_months"])
+        state.watermark = data["watermark"]
+        for code, months in data["buckets"].items():
+            code = int(code)
+            for month, bucket in months.items():
+                month = int(month)
+                bucket = ClientAggregates.from_dict(bucket)
+                state.buckets[code][month] = bucket
+                state.clients_by_month[month].add(code)
+                state.windows[code].merge(bucket)
+        if data.get("days"):
+            state.first_day, state.last_day = (date.fromisoformat(d) for d in data["days"])
+            state._set_span()
+        return state
+
+
+def load_profiles(clients_files: list[Path]) -> dict[int, ClientAggregates]:
+    profiles = {}
+    for path in clients_files:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                code = int(row["client_code"])
+                profiles[code] = ClientAggregates(
+                    client_code=code,
+                    name=row["name"],
+                    status=row["status"],
+                    age=int(row["age"]),
+                    city=row["city"],
+                    avg_monthly_balance_KZT=float(row["avg_monthly_balance_KZT"]),
+                )
+    return profiles
+
+
+class StreamIngestor:
+    """Опрос папки: новые файлы подхватываются, в старых читается только хвост."""
+
+    def __init__(self, input_dir: Path, state: StreamState, snapshot_path: Path | None = None,
+                 offsets: dict | None = None):
+        self.input_dir = input_dir
+        self.state = state
+        self.snapshot_path = snapshot_path
+        self.readers: dict[str, TailReader] = {}
+        for name, (offset, header) in (offsets or {}).items():
+            self.readers[name] = TailReader(Path(name), offset, header)
+
+    def poll(self) -> int:
+        events = 0
+        for path in sorted(self.input_dir.glob("**/*.csv")):
+            kind = "transactions" if "transactions" in path.name else "transfers" if "transfers" in path.name else None
+            if kind is None:
+                continue
+            reader = self.readers.setdefault(str(path), TailReader(path))
+            rows = reader.read_new()
+            if not rows:
+                continue
+            apply = self.state.apply_transaction if kind == "transactions" else self.state.apply_transfer
+            with self.state.lock:
+                for row in rows:
+                    try:
+                        apply(row)
+                    except (KeyError, ValueError, TypeError, IndexError):
+                        self.state.stats["bad_rows"] += 1
+            events += len(rows)
+        return events
+
+    def snapshot(self):
+        if self.snapshot_path is None:
+            return
+        with self.state.lock:
+            data = self.state.to_dict()
+            data["offsets"] = {name: (r.offset, r.header) for name, r in self.readers.items()}
+        tmp = self.snapshot_path.with_suffix(self.snapshot_path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.snapshot_path)
+
+    def run(self, interval: float = 1.0, snapshot_every: float = 30.0, once: bool = False):
+        last_snapshot = time.monotonic()
+        try:
+            while True:
+                self.poll()
+                if once:
+                    break
+                if time.monotonic() - last_snapshot >= snapshot_every:
+                    self.snapshot()
+                    last_snapshot = time.monotonic()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.snapshot()
+
+
+def open_stream(input_dir: Path, snapshot_path: Path | None, window_months: int = WINDOW_MONTHS) -> StreamIngestor:
+    """Восстанавливает состояние из снапшота, если он есть, иначе стартует с профилей из clients*.csv."""
+    if snapshot_path is not None and snapshot_path.exists():
+        with open(snapshot_path, encoding="utf-8") as f:
+            data = json.load(f)
+        state = StreamState.from_dict(data)
+        return StreamIngestor(input_dir, state, snapshot_path, offsets=data.get("offsets"))
+
+    clients_files = sorted(p for p in input_dir.glob("**/*.csv") if "clients" in p.name)
+    state = StreamState(load_profiles(clients_files), window_months=window_months)
+    return StreamIngestor(input_dir, state, snapshot_path)
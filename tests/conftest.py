@@ -0,0 +1,91 @@
+"""
+Общие фикстуры: маленькая синтетическая выгрузка (clients.csv + файлы клиентов за 3 мес)
+и feature store из неё. Данные детерминированы (random.Random с фиксированным seed).
+"""
+import csv
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+CATEGORIES = [
+    "Одежда и обувь", "Продукты питания", "Кафе и рестораны", "Медицина", "Авто", "Спорт",
+    "Развлечения", "АЗС", "Кино", "Питомцы", "Книги", "Цветы", "Едим дома", "Смотрим дома",
+    "Играем дома", "Косметика и Парфюмерия", "Подарки", "Ремонт дома", "Мебель", "Спа и массаж",
+    "Ювелирные украшения", "Такси", "Отели", "Путешествия",
+]
+TRANSFER_TYPES = [
+    "salary_in", "stipend_in", "family_in", "cashback_in", "refund_in", "card_in", "p2p_out",
+    "card_out", "atm_withdrawal", "utilities_out", "loan_payment_out", "cc_repayment_out",
+    "installment_payment_out", "fx_buy", "fx_sell", "invest_out", "invest_in", "deposit_topup_out",
+    "deposit_fx_topup_out", "deposit_fx_withdraw_in", "gold_buy_out", "gold_sell_in",
+]
+PRODUCTS = [
+    "Карта для путешествий", "Премиальная карта", "Кредитная карта", "Обмен валют", "Кредит наличными",
+    "Депозит Мультивалютный", "Депозит Сберегательный", "Депозит Накопительный", "Инвестиции",
+    "Золотые слитки",
+]
+STATUSES = ["Студент", "Зарплатный клиент", "Премиальный клиент", "Стандартный клиент"]
+CLIENTS = 120
+
+
+def _date(rng: random.Random) -> str:
+    return f"2025-0{rng.randint(6, 8)}-{rng.randint(1, 28):02d} 10:00:00"
+
+
+def write_extract(path: Path, clients: int = CLIENTS, seed: int = 7) -> Path:
+    """Папка в формате входа run: clients.csv, client_<code>_transactions_3m.csv, client_<code>_transfers_3m.csv."""
+    rng = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    profiles = [
+        [code, f"Имя{code}", rng.choice(STATUSES), rng.randint(18, 70), rng.choice(["Алматы", "Астана"]),
+         rng.choice([rng.randint(20_000, 200_000), rng.randint(200_000, 5_000_000)])]
+        for code in range(1, clients + 1)
+    ]
+    with open(path / "clients.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["client_code", "name", "status", "age", "city", "avg_monthly_balance_KZT"])
+        writer.writerows(profiles)
+
+    for code, name, status, _, city, _ in profiles:
+        label = rng.choice(PRODUCTS)
+        favourite = rng.sample(CATEGORIES, 3)
+        with open(path / f"client_{code}_transactions_3m.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["client_code", "name", "product", "status", "city", "date", "category", "amount", "currency"])
+            for _ in range(rng.randint(10, 40)):
+                category = rng.choice(favourite if rng.random() < 0.6 else CATEGORIES)
+                writer.writerow([code, name, label, status, city, _date(rng), category,
+                                 round(rng.uniform(500, 80_000), 2), rng.choice(["KZT"] * 8 + ["USD", "EUR"])])
+
+        types = TRANSFER_TYPES if rng.random() < 0.3 else [
+            t for t in TRANSFER_TYPES if not t.startswith(("fx_", "invest", "gold"))]
+        if rng.random() < 0.5:
+            types = [t for t in types if not t.startswith("deposit_fx")]
+        with open(path / f"client_{code}_transfers_3m.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["client_code", "name", "product", "status", "city", "date", "type", "direction", "amount", "currency"])
+            for _ in range(rng.randint(5, 25)):
+                ttype = rng.choice(types)
+                direction = "in" if ttype.endswith("_in") or ttype == "fx_sell" else "out"
+                writer.writerow([code, name, label, status, city, _date(rng), ttype, direction,
+                                 round(rng.uniform(1_000, 500_000), 2), rng.choice(["KZT"] * 8 + ["USD"])])
+    return path
+
+
+@pytest.fixture(scope="session")
+def extract(tmp_path_factory) -> Path:
+    return write_extract(tmp_path_factory.mktemp("extract") / "case")
+
+
+@pytest.fixture(scope="session")
+def store(extract, tmp_path_factory):
+    from feature_store import FeatureStore, build_feature_store
+    from main import load_valid_data
+
+    path = tmp_path_factory.mktemp("store") / "feature_store"
+    build_feature_store(path, *load_valid_data(extract))
+    return FeatureStore(path)
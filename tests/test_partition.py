@@ -0,0 +1,23 @@
+"""run --partitions против прогона в памяти: те же продукты и тексты пушей у каждого клиента."""
+import pandas as pd
+
+from client import handle_clients_logic
+from main import load_valid_data
+from partition import run_partitioned
+
+# дедлайн истекает сразу: продукт ветки "ai" и тексты пушей — детерминированный fallback, без LLM
+DEADLINE = 1e-6
+
+
+def test_partitioned_matches_in_memory(extract, tmp_path):
+    in_memory = tmp_path / "memory.csv"
+    handle_clients_logic(*load_valid_data(extract), deadline_seconds=DEADLINE, output=str(in_memory))
+    partitioned = tmp_path / "partitioned.csv"
+    # много мелких партиций: у каждой свои первая и последняя даты, период — всё равно общий
+    run_partitioned(extract, partitioned, partitions=60, chunk_rows=100, deadline_seconds=DEADLINE)
+
+    expected = pd.read_csv(in_memory).set_index("client_code").sort_index()
+    actual = pd.read_csv(partitioned).set_index("client_code").sort_index()
+    assert actual.index.is_unique
+    pd.testing.assert_frame_equal(actual[["product", "push_notification"]],
+                                  expected[["product", "push_notification"]])
@@ -0,0 +1,33 @@
+"""Выборочный прогон: тексты пушей как у полного прогона (период — всей выгрузки, не выборки)."""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import sampling
+from client import handle_clients_logic
+from main import load_valid_data, validate_loaded
+
+DEADLINE = 1e-6
+
+
+def test_sample_uses_extract_span(extract, tmp_path):
+    full = tmp_path / "full.csv"
+    handle_clients_logic(*load_valid_data(extract), deadline_seconds=DEADLINE, output=str(full))
+    expected = pd.read_csv(full).set_index("client_code")
+
+    for seed in range(4):
+        sample = sampling.select_sample(extract, 2, seed=seed)
+        output = tmp_path / f"sample-{seed}.csv"
+        handle_clients_logic(*validate_loaded(sampling.read_sample(extract, sample)), deadline_seconds=DEADLINE,
+                             output=str(output), observed_span=sample.observed_span)
+        actual = pd.read_csv(output).set_index("client_code")
+        assert len(actual) == 2
+        pd.testing.assert_frame_equal(actual, expected.loc[actual.index])
+
+
+def test_hash_without_overflow_warning():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        hashes = sampling._hash(np.arange(1, 100), seed=7)
+    assert hashes.max() < 2**32
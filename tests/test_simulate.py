@@ -0,0 +1,57 @@
+"""Simulator (матричные суммы по сценариям) против прямого scoring.decide_all на каждый сценарий."""
+import copy
+import itertools
+import json
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from rules import RULES_PATH, CompiledRules
+from scoring import FeatureMatrices, decide_all
+from simulate import Simulator
+from tuning import grid_values, set_param
+
+GRID = {
+    "deposits.min_confidence": [0.6, 0.8, 0.9],
+    "deposits.Депозит Накопительный.min_balance": [500_000, 1_000_000],
+    "deposits.Депозит Мультивалютный.rate": [0.02, 0.2],
+    "card_products.Карта для путешествий.threshold": [0.1, 0.26],
+    "card_products.Кредитная карта.cashback": [0.03, 0.1],
+    "threshold_bounds.0": [0.05, 0.2],
+}
+
+
+@pytest.fixture(scope="module")
+def base_config() -> dict:
+    with open(RULES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def brute_force(base_config: dict, m: FeatureMatrices, params: dict) -> np.ndarray:
+    config = copy.deepcopy(base_config)
+    for path, value in params.items():
+        set_param(config, path, value)
+    products, _, _ = decide_all(CompiledRules(config), m)
+    return products
+
+
+def test_simulate_matches_decide_all(store, base_config):
+    m = FeatureMatrices.from_store(store)
+    baseline = brute_force(base_config, m, {})
+    results = Simulator(base_config, m, chunk_size=50).run(GRID)
+
+    combinations = list(itertools.product(*(grid_values(GRID[p]) for p in GRID)))
+    assert len(results) == len(combinations)
+    for values, result in zip(combinations, results):
+        params = dict(zip(GRID, values))
+        assert result["params"] == params
+        products = brute_force(base_config, m, params)
+        assert result["counts"] == dict(Counter(products.tolist())), params
+        assert result["changed"] == int(np.count_nonzero(products != baseline)), params
+
+
+def test_simulate_rejects_list_params(store, base_config):
+    simulator = Simulator(base_config, FeatureMatrices.from_store(store))
+    with pytest.raises(ValueError):
+        simulator.run({"card_products.Кредитная карта.categories": [["Едим дома"]]})
@@ -0,0 +1,128 @@
+import math
+import os
+import re
+import threading
+
+# Бюджет токенов на один промпт get_recomended_product (можно переопределить через env)
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1400"))
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+try:  # точный счётчик, если установлен tiktoken
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # noqa: BLE001 — нет пакета или словаря офлайн
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Локальная оценка числа токенов без сети.
+    С tiktoken — точное значение, иначе эвристика:
+    ~4 символа на токен для латиницы/цифр, ~3 для кириллицы, знаки препинания — по токену.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+
+    total = 0
+    for word in _WORD_RE.findall(text):
+        if word.isascii():
+            total += math.ceil(len(word) / 4)
+        else:
+            total += math.ceil(len(word) / 3)
+    return total
+
+
+class PromptTokenStats:
+    """Потокобезопасные счётчики токенов за прогон."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.prompts = 0
+            self.tokens_sent = 0
+            self.tokens_baseline = 0
+            self.over_budget = 0
+
+    def record(self, sent: int, baseline: int, over_budget: bool):
+        with self._lock:
+            self.prompts += 1
+            self.tokens_sent += sent
+            self.tokens_baseline += baseline
+            self.over_budget += int(over_budget)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "tokens_sent": self.tokens_sent,
+                "tokens_baseline": self.tokens_baseline,
+                "tokens_saved": self.tokens_baseline - self.tokens_sent,
+                "over_budget": self.over_budget,
+            }
+
+
+PROMPT_STATS = PromptTokenStats()
+
+
+# Цена за 1M токенов (по умолчанию — gpt-4o-mini) для бюджета в деньгах
+PRICE_INPUT_PER_M = float(os.getenv("LLM_PRICE_INPUT_PER_M", "0.15"))
+PRICE_OUTPUT_PER_M = float(os.getenv("LLM_PRICE_OUTPUT_PER_M", "0.60"))
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * PRICE_INPUT_PER_M + completion_tokens * PRICE_OUTPUT_PER_M) / 1_000_000
+
+
+def messages_tokens(messages: list[dict]) -> int:
+    """Токены запроса chat_completion: тексты сообщений плюс ~4 служебных на сообщение."""
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+class RunBudget:
+    """
+    Бюджет LLM на прогон в токенах и/или деньгах (как RUN_DEADLINE: start() на прогон или batch).
+    Запрос резервирует оценку (промпт + ожидаемый ответ) до отправки; не влез — вызывающий
+    берёт детерминированный текст. Хедж-дубли llm.chat_completion в оценку не входят.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start(None, None)
+
+    def start(self, tokens: int | None = None, cost: float | None = None):
+        with self._lock:
+            self.tokens, self.cost = tokens, cost
+            self.tokens_spent, self.cost_spent = 0, 0.0
+            self.calls = self.rejected = 0
+
+    @property
+    def limited(self) -> bool:
+        return self.tokens is not None or self.cost is not None
+
+    def try_spend(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        tokens = prompt_tokens + completion_tokens
+        cost = estimate_cost(prompt_tokens, completion_tokens)
+        with self._lock:
+            if ((self.tokens is not None and self.tokens_spent + tokens > self.tokens)
+                    or (self.cost is not None and self.cost_spent + cost > self.cost)):
+                self.rejected += 1
+                return False
+            self.tokens_spent += tokens
+            self.cost_spent += cost
+            self.calls += 1
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "token_budget": self.tokens, "cost_budget": self.cost,
+                "calls": self.calls, "tokens_spent": self.tokens_spent,
+                "cost_spent": round(self.cost_spent, 6), "over_budget": self.rejected,
+            }
+
+
+RUN_BUDGET = RunBudget()
@@ -0,0 +1,192 @@
+"""
+Grid search over rules.json parameters against labeled clients.
+
+Parameters are dotted paths into the rules config, e.g.
+    "card_products.Карта для путешествий.threshold"
+    "card_products.Карта для путешествий.adjustments.0.if.value"   # 400 000 ₸ travel cutoff
+    "deposits.min_confidence"
+Each combination is scored with scoring.decide_all over FeatureMatrices built
+once from the feature store; a branch is recomputed only when one of its
+parameters changed (card / deposit / transfer sections are cached separately).
+"""
+import copy
+import csv
+import itertools
+import json
+import time
+from collections import Counter
+
+import numpy as np
+
+from rules import CompiledRules
+from scoring import FeatureMatrices, card_branch, decide_all, deposit_branch, transfer_branch
+
+# раздел конфига -> ветка decide_all, которую он меняет
+SECTION_BRANCH = {
+    "card_products": "card",
+    "threshold_bounds": "card",
+    "deposits": "deposit",
+    "transfer_products": "transfers",
+}
+
+
+def _key(part: str):
+    return int(part) if part.isdigit() else part
+
+
+def get_param(config: dict, path: str):
+    node = config
+    for part in path.split("."):
+        node = node[_key(part)]
+    return node
+
+
+def set_param(config: dict, path: str, value):
+    *parents, last = path.split(".")
+    node = config
+    for part in parents:
+        node = node[_key(part)]
+    if _key(last) not in (range(len(node)) if isinstance(node, list) else node):
+        raise KeyError(f"Нет параметра {path!r} в правилах")
+    node[_key(last)] = value
+
+
+def grid_values(spec) -> list:
+    """[v1, v2, ...] или {"start": a, "stop": b, "step": s} (stop включительно)."""
+    if isinstance(spec, dict):
+        values = np.arange(spec["start"], spec["stop"] + spec["step"] / 2, spec["step"])
+        return [round(float(v), 10) for v in values]
+    return list(spec)
+
+
+def check_scalar_param(config: dict, path: str, spec):
+    """
+    Перебираются только числа и строки: списки (categories, threshold_bounds целиком) меняют
+    раскладку категорий, под которую один раз посчитаны траты (Tuner.inputs), и не хешируются в кэше веток.
+    """
+    scalar = (int, float, str)
+    if not isinstance(get_param(config, path), scalar) or not all(isinstance(v, scalar) for v in grid_values(spec)):
+        raise ValueError(f"Параметр {path!r}: перебираются только числа и строки, не списки и разделы")
+
+
+def accuracy_by_product(predicted: np.ndarray, labels: np.ndarray) -> dict[str, dict]:
+    """{продукт-метка: {"support", "correct", "accuracy", "predicted"}}."""
+    correct = predicted == labels
+    support = Counter(labels.tolist())
+    hits = Counter(labels[correct].tolist())
+    predicted_counts = Counter(predicted.tolist())
+    return {
+        product: {
+            "support": n,
+            "correct": hits.get(product, 0),
+            "accuracy": hits.get(product, 0) / n,
+            "predicted": predicted_counts.get(product, 0),
+        }
+        for product, n in sorted(support.items(), key=lambda kv: -kv[1])
+    }
+
+
+class Tuner:
+    def __init__(self, base_config: dict, matrices: FeatureMatrices):
+        labeled = matrices.labels != ""
+        self.m = matrices.subset(labeled)
+        self.labels = self.m.labels
+        self.base_config = base_config
+        base_rules = CompiledRules(base_config)
+        # траты по категориям правил не зависят от числовых параметров — считаем один раз
+        self.inputs = self.m.rule_inputs(base_rules)
+        self._cache: dict[tuple, tuple] = {}
+
+    def _branch(self, name: str, rules: CompiledRules, key: tuple) -> tuple:
+        cache_key = (name, key)
+        if cache_key not in self._cache:
+            if name == "card":
+                self._cache[cache_key] = card_branch(rules, self.m, self.inputs)
+            elif name == "deposit":
+                self._cache[cache_key] = deposit_branch(rules, self.m)
+            else:
+                self._cache[cache_key] = transfer_branch(rules, self.m)
+        return self._cache[cache_key]
+
+    def predict(self, params: dict) -> np.ndarray:
+        config = copy.deepcopy(self.base_config)
+        for path, value in params.items():
+            set_param(config, path, value)
+        rules = CompiledRules(config)
+
+        branches = {}
+        for name in ("card", "deposit", "transfers"):
+            key = tuple((p, v) for p, v in params.items() if SECTION_BRANCH.get(p.split(".")[0]) == name)
+            branches[name] = self._branch(name, rules, key)
+        product, _, _ = decide_all(rules, self.m, **branches)
+        return product
+
+    def evaluate(self, params: dict) -> dict:
+        predicted = self.predict(params)
+        return {
+            "params": params,
+            "accuracy": float(np.mean(predicted == self.labels)) if len(self.labels) else 0.0,
+            "by_product": accuracy_by_product(predicted, self.labels),
+        }
+
+    def search(self, grid: dict) -> list[dict]:
+        """Все комбинации grid; результаты по убыванию accuracy."""
+        for path in grid:
+            if path.split(".")[0] not in SECTION_BRANCH:
+                raise KeyError(f"Параметр {path!r} вне настраиваемых разделов {sorted(SECTION_BRANCH)}")
+            check_scalar_param(self.base_config, path, grid[path])
+        paths = list(grid)
+        results = [
+            self.evaluate(dict(zip(paths, values)))
+            for values in itertools.product(*(grid_values(grid[p]) for p in paths))
+        ]
+        return sorted(results, key=lambda r: -r["accuracy"])
+
+
+def save_results(results: list[dict], filename: str):
+    products = sorted({p for r in results for p in r["by_product"]})
+    paths = list(results[0]["params"]) if results else []
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(paths + ["accuracy"] + [f"accuracy:{p}" for p in products])
+        for r in results:
+            writer.writerow(
+                [r["params"][p] for p in paths]
+                + [round(r["accuracy"], 6)]
+                + [round(r["by_product"][p]["accuracy"], 6) if p in r["by_product"] else "" for p in products]
+            )
+
+
+def print_report(baseline: dict, results: list[dict], top: int = 10):
+    print(f"Baseline (rules.json): accuracy {baseline['accuracy']:.4f}")
+    print(f"Top {min(top, len(results))} of {len(results)} configurations:")
+    for rank, r in enumerate(results[:top], 1):
+        params = ", ".join(f"{path.split('.', 1)[-1]}={value}" for path, value in r["params"].items())
+        print(f"{rank:>3}. {r['accuracy']:.4f}  {params}")
+
+    if results:
+        best = results[0]["by_product"]
+        print(f"\n{'product':<28}{'support':>8}{'baseline':>10}{'best':>8}")
+        for product, stats in baseline["by_product"].items():
+            print(f"{product:<28}{stats['support']:>8}{stats['accuracy']:>10.3f}{best[product]['accuracy']:>8.3f}")
+
+
+def run_tuning(store, base_config: dict, grid: dict, top: int = 10, output: str | None = None,
+               save_best: str | None = None) -> list[dict]:
+    started = time.perf_counter()
+    tuner = Tuner(base_config, FeatureMatrices.from_store(store))
+    baseline = tuner.evaluate({})
+    results = tuner.search(grid)
+    elapsed = time.perf_counter() - started
+
+    print_report(baseline, results, top)
+    print(f"\n{len(results)} combinations on {len(tuner.labels)} labeled clients in {elapsed:.2f} s")
+    if output:
+        save_results(results, output)
+    if save_best and results:
+        config = copy.deepcopy(base_config)
+        for path, value in results[0]["params"].items():
+            set_param(config, path, value)
+        with open(save_best, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+    return results
@@ -0,0 +1,195 @@
+"""
+Row-level validation of loaded input right after main.load_data.
+
+Every check is a column-wise mask over the whole frame: types (numeric codes,
+amounts, ages, parseable dates), enums (direction, currency, known categories
+and transfer types, type/direction consistency), negative amounts, duplicate
+and orphan client codes. Offending rows are removed from the frames the
+pipeline sees and collected in a quarantine table with all their reasons, so
+a bad row can no longer abort a run halfway (Transaction(**row), to_kzt on an
+unknown currency, ...).
+
+    result = validate_frames(clients_df, transactions_df, transfers_df)
+    write_quarantine(result.quarantine, "result.quarantine.csv")
+"""
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from deposit import DEFAULT_FX_RATES_TO_KZT
+from profits import CURRENCY_RATES
+
+CATEGORIES = [
+    "Одежда и обувь", "Продукты питания", "Кафе и рестораны", "Медицина", "Авто", "Спорт",
+    "Развлечения", "АЗС", "Кино", "Питомцы", "Книги", "Цветы", "Едим дома", "Смотрим дома",
+    "Играем дома", "Косметика и Парфюмерия", "Подарки", "Ремонт дома", "Мебель", "Спа и массаж",
+    "Ювелирные украшения", "Такси", "Отели", "Путешествия",
+]
+TRANSFER_TYPES = [
+    ("salary_in", "in"), ("stipend_in", "in"), ("family_in", "in"), ("cashback_in", "in"),
+    ("refund_in", "in"), ("card_in", "in"), ("p2p_out", "out"), ("card_out", "out"),
+    ("atm_withdrawal", "out"), ("utilities_out", "out"), ("loan_payment_out", "out"),
+    ("cc_repayment_out", "out"), ("installment_payment_out", "out"), ("fx_buy", "out"),
+    ("fx_sell", "in"), ("invest_out", "out"), ("invest_in", "in"), ("deposit_topup_out", "out"),
+    ("deposit_fx_topup_out", "out"), ("deposit_fx_withdraw_in", "in"), ("gold_buy_out", "out"),
+    ("gold_sell_in", "in"),
+]
+DIRECTIONS = ("in", "out")
+# траты конвертируются по profits.CURRENCY_RATES, FX-переводы — по deposit.DEFAULT_FX_RATES_TO_KZT
+TRANSACTION_CURRENCIES = tuple(CURRENCY_RATES)
+TRANSFER_CURRENCIES = tuple(DEFAULT_FX_RATES_TO_KZT)
+
+QUARANTINE_COLUMNS = ["table", "row", "client_code", "reason", "record"]
+
+
+@dataclass
+class ValidationResult:
+    clients: pd.DataFrame
+    transactions: pd.DataFrame
+    transfers: pd.DataFrame
+    quarantine: pd.DataFrame        # QUARANTINE_COLUMNS, по строке на отбракованную строку входа
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """{таблица: {причина: строк}} — строка с несколькими причинами считается в каждой."""
+        out: dict[str, dict[str, int]] = {}
+        for table, reasons in zip(self.quarantine["table"], self.quarantine["reason"]):
+            for reason in reasons.split("; "):
+                out.setdefault(table, {})
+                out[table][reason] = out[table].get(reason, 0) + 1
+        return out
+
+
+class _Checks:
+    """Накопитель причин по строкам одной таблицы."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.reasons = np.full(len(df), "", dtype=object)
+        self._factorized: dict[str, tuple] = {}
+
+    def fail(self, mask, reason: str):
+        mask = np.asarray(mask, dtype=bool)
+        current = self.reasons[mask]
+        self.reasons[mask] = np.where(current == "", reason, current + "; " + reason)
+
+    def numeric(self, column: str, integer: bool = False, non_negative: bool = False) -> pd.Series:
+        values = pd.to_numeric(self.df[column], errors="coerce")
+        bad = values.isna().to_numpy() | ~np.isfinite(values.fillna(0).to_numpy(dtype="float64"))
+        self.fail(bad, f"{column}: not a number")
+        if integer:
+            self.fail(~bad & (values.fillna(0) % 1 != 0).to_numpy(), f"{column}: not an integer")
+        if non_negative:
+            self.fail(~bad & (values.fillna(0) < 0).to_numpy(), f"{column}: negative")
+        return values
+
+    def factorize(self, column: str) -> tuple[np.ndarray, np.ndarray]:
+        """(коды, уникальные значения); проверки идут по уникальным, а не по миллионам строк."""
+        if column not in self._factorized:
+            codes, uniques = pd.factorize(self.df[column])
+            self._factorized[column] = codes, np.asarray(uniques, dtype=object)
+        return self._factorized[column]
+
+    def one_of(self, column: str, allowed) -> None:
+        codes, uniques = self.factorize(column)
+        self.fail(codes < 0, f"{column}: missing")
+        known = np.append(np.isin(uniques, list(allowed)), True)   # код -1 (пусто) уже отмечен выше
+        self.fail(~known[codes], f"{column}: unknown value")
+
+    def date(self, column: str = "date") -> None:
+        self.fail(pd.to_datetime(self.df[column], errors="coerce").isna().to_numpy(), f"{column}: not a date")
+
+    @property
+    def bad(self) -> np.ndarray:
+        return self.reasons != ""
+
+    def quarantine(self, table: str) -> pd.DataFrame:
+        rows = self.df[self.bad]
+        return pd.DataFrame({
+            "table": table,
+            "row": rows.index.to_numpy(),
+            "client_code": rows["client_code"].to_numpy() if "client_code" in rows else None,
+            "reason": self.reasons[self.bad],
+            "record": [json.dumps(r, ensure_ascii=False, default=str) for r in rows.to_dict("records")],
+        }, columns=QUARANTINE_COLUMNS)
+
+    def clean(self, **numeric: pd.Series) -> pd.DataFrame:
+        """Годные строки; проверенные числовые колонки приводятся к числам."""
+        good = ~self.bad
+        df = self.df[good].copy()
+        for column, values in numeric.items():
+            df[column] = values[good]
+        return df
+
+
+def _codes(checks: _Checks) -> pd.Series:
+    return checks.numeric("client_code", integer=True)
+
+
+def validate_frames(clients_df: pd.DataFrame, transactions_df: pd.DataFrame,
+                    transfers_df: pd.DataFrame) -> ValidationResult:
+    # клиенты: коды, дубли (остаётся первый), возраст, баланс
+    clients = _Checks(clients_df)
+    codes = _codes(clients)
+    clients.fail(codes.notna().to_numpy() & codes.duplicated().to_numpy(), "client_code: duplicate")
+    age = clients.numeric("age", integer=True, non_negative=True)
+    balance = clients.numeric("avg_monthly_balance_KZT")
+    clients.fail(clients_df["status"].isna().to_numpy(), "status: missing")
+    known = codes[~clients.bad].astype("int64")
+    rejected = codes[clients.bad].dropna()
+
+    parts = [clients.quarantine("clients")]
+    clean_clients = clients.clean(client_code=codes, age=age, avg_monthly_balance_KZT=balance)
+    clean_clients["client_code"] = clean_clients["client_code"].astype("int64")
+    frames = {}
+
+    for table, df, enum_column, allowed, currencies in (
+        ("transactions", transactions_df, "category", CATEGORIES, TRANSACTION_CURRENCIES),
+        ("transfers", transfers_df, "type", [t for t, _ in TRANSFER_TYPES], TRANSFER_CURRENCIES),
+    ):
+        if df.empty:
+            frames[table] = df
+            continue
+        checks = _Checks(df)
+        codes = _codes(checks)
+        orphan = codes.notna().to_numpy() & ~codes.isin(known).to_numpy()
+        dropped = codes.isin(rejected).to_numpy()
+        checks.fail(orphan & dropped, "client_code: client quarantined")
+        checks.fail(orphan & ~dropped, "client_code: orphan")
+        amount = checks.numeric("amount", non_negative=True)
+        checks.one_of("currency", currencies)
+        checks.one_of(enum_column, allowed)
+        checks.date()
+        if table == "transfers":
+            checks.one_of("direction", DIRECTIONS)
+            types, type_names = checks.factorize("type")
+            directions, direction_names = checks.factorize("direction")
+            expected = np.array([dict(TRANSFER_TYPES).get(t) for t in type_names] + [None], dtype=object)[types]
+            actual = np.append(direction_names, None)[directions]
+            checks.fail((expected != None) & np.isin(actual, DIRECTIONS) & (expected != actual),  # noqa: E711
+                        "direction: does not match type")
+        parts.append(checks.quarantine(table))
+        frames[table] = checks.clean(client_code=codes, amount=amount)
+        frames[table]["client_code"] = frames[table]["client_code"].astype("int64")
+
+    return ValidationResult(
+        clients=clean_clients,
+        transactions=frames["transactions"],
+        transfers=frames["transfers"],
+        quarantine=pd.concat(parts, ignore_index=True),
+    )
+
+
+def write_quarantine(quarantine: pd.DataFrame, path) -> None:
+    quarantine.to_csv(path, index=False, encoding="utf-8")
+
+
+def print_summary(result: ValidationResult, path=None) -> None:
+    if result.quarantine.empty:
+        return
+    where = f" -> {path}" if path else ""
+    print(f"Quarantined {len(result.quarantine)} input rows{where}")
+    for table, reasons in result.summary().items():
+        for reason, n in sorted(reasons.items(), key=lambda kv: -kv[1]):
+            print(f"  {table}: {reason} ({n})")